@@ -1,5 +1,10 @@
 packet_size = 1456 #1500 MTU of ethernet  - 8 UDP_header - 20 IP_header - 16 Packet_header = 1456 bytes
 
+# Retransmission timeout (seconds): initial value and bounds of the adaptive RTO
+rto_initial = 0.5
+rto_min = 0.05
+rto_max = 10.0
+
 class message_type:
     START = 0 
     END = 1 
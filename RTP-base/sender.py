@@ -1,25 +1,36 @@
 import argparse
+import itertools
 import socket
 import sys
 import time
 import config
+from rto import RTOEstimator
 from utils import PacketHeader, compute_checksum
 
-TIME_OUT = 0.5
+TIME_OUT = 0.5  # START/END waits; retransmissions use the adaptive RTO
 time_stamp = {}
+
+def read_chunks(stream, chunk_size):
+    # Read the input one packet at a time so sending can start before EOF
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
 def sender(receiver_ip, receiver_port, window_size):
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     s.settimeout(TIME_OUT)
 
-    message = sys.stdin.buffer.read()
-    if not message:
+    chunk_size = config.packet_size
+    first_chunk = sys.stdin.buffer.read(chunk_size)
+    if not first_chunk:
         print("Error: No data to send.")
         s.close()
         return
 
-    chunk_size = config.packet_size
-    chunks = [message[i:i + chunk_size] for i in range(0, len(message), chunk_size)]
-    total_chunks = len(chunks)
+    chunks = itertools.chain([first_chunk], read_chunks(sys.stdin.buffer, chunk_size))
+    total_chunks = None  # Only known once the input reaches EOF
     receiver_addr = (receiver_ip, receiver_port)
 
     # Send START
@@ -44,10 +55,15 @@ def sender(receiver_ip, receiver_port, window_size):
     base = 1
     next_seq = 1
     window = {}
+    retransmitted = set()  # No RTT samples from retransmitted packets (Karn's rule)
+    rto = RTOEstimator(config.rto_initial, config.rto_min, config.rto_max)
     start_time = time.time()
-    while base <= total_chunks:
-        while next_seq < base + window_size and next_seq <= total_chunks:
-            payload = chunks[next_seq - 1]
+    while total_chunks is None or base <= total_chunks:
+        while next_seq < base + window_size and total_chunks is None:
+            payload = next(chunks, None)
+            if payload is None:
+                total_chunks = next_seq - 1
+                break
             pkt = PacketHeader(type=config.message_type.DATA, seq_num=next_seq, length=len(payload), checksum=0)
             pkt.checksum = compute_checksum(pkt / payload)
             full_pkt = pkt / payload
@@ -60,6 +76,8 @@ def sender(receiver_ip, receiver_port, window_size):
             next_seq += 1
 
         try:
+            # Wait for ACKs at most until the window timer fires
+            s.settimeout(max(0.001, start_time + rto.rto - time.time()))
             data, _ = s.recvfrom(2048)
             ack = PacketHeader(data)
             ack_checksum = ack.checksum
@@ -67,6 +85,9 @@ def sender(receiver_ip, receiver_port, window_size):
             if compute_checksum(ack) != ack_checksum:
                 continue
             if ack.type == config.message_type.ACK and ack.seq_num > base:
+                newest = ack.seq_num - 1
+                if newest in time_stamp and newest not in retransmitted:
+                    rto.sample(time.time() - time_stamp[newest])
                 base = ack.seq_num
                 if base in time_stamp:
                     start_time = time_stamp[base]
@@ -78,10 +99,13 @@ def sender(receiver_ip, receiver_port, window_size):
         except socket.timeout:
             pass 
 
-        if time.time() - start_time > TIME_OUT: 
+        if time.time() - start_time > rto.rto: 
             # Retransmission when time out
             for pkt in window.values():
                 s.sendto(bytes(pkt), receiver_addr)
+            retransmitted.update(window)
+            rto.backoff()
+            start_time = time.time()
 
     # Send END
     end_seq = total_chunks + 1
@@ -89,6 +113,7 @@ def sender(receiver_ip, receiver_port, window_size):
     end_pkt.checksum = compute_checksum(end_pkt)
     s.sendto(bytes(end_pkt), receiver_addr)
 
+    s.settimeout(TIME_OUT)
     start_time = time.time()
     while time.time() - start_time < TIME_OUT:
         try:
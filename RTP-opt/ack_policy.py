@@ -0,0 +1,42 @@
+class AckPolicy:
+    """Decides when the receiver acknowledges in-order DATA.
+
+    Every `every`-th in-order packet is acknowledged right away; the ones in
+    between are held back for at most `delay` seconds. Out-of-order,
+    duplicate and gap-filling packets are not covered by the policy: the
+    receiver ACKs them immediately so the sender's duplicate-ACK and SACK
+    loss detection is never delayed.
+
+    With every=1 (the default) each DATA packet gets its own ACK.
+    """
+
+    def __init__(self, every=1, delay=0.02):
+        self.every = max(1, every)
+        self.delay = delay
+        self.pending = 0  # In-order packets received since the last ACK
+        self.deadline = None  # When the pending packets must be acknowledged
+        self.sent = 0  # ACKs (and SACKs) sent
+        self.suppressed = 0  # In-order packets that did not get an ACK of their own
+
+    def on_in_order(self, now):
+        """Account one in-order packet. Returns True if it must be ACKed now."""
+        self.pending += 1
+        if self.pending >= self.every:
+            return True
+        self.suppressed += 1
+        if self.deadline is None:
+            self.deadline = now + self.delay
+        return False
+
+    def due(self, now):
+        """True when held-back packets have waited long enough"""
+        return self.deadline is not None and now >= self.deadline
+
+    def on_sent(self):
+        """Any ACK covers everything pending"""
+        self.sent += 1
+        self.pending = 0
+        self.deadline = None
+
+    def __repr__(self):
+        return f"ACKs sent: {self.sent}, suppressed: {self.suppressed} (every {self.every}, delay {self.delay * 1000:.0f}ms)"
@@ -0,0 +1,356 @@
+"""asyncio front end of the sender and receiver.
+
+The protocol is the one sender.py and receiver.py run: SenderProtocol drives
+a transfer.Transfer and ReceiverProtocol a session.Endpoint, so START options
+(checksum, packet size, window, FEC, compression, resume), SACK, the reorder
+ring and RESET behave the same. Only the driving differs: retransmissions are
+a single loop timer, waiting for window space or for data is a future, and
+there are no threads or locks since callbacks never run concurrently. Any
+number of transfers can share one loop:
+
+    await send(data, ("127.0.0.1", 40000), window_size=128)
+
+    async for chunk in receive(("0.0.0.0", 40000), window_size=128):
+        ...
+
+receive() stops reading its socket while the consumer is QUEUE_PACKETS
+payloads behind, so a slow consumer stalls the sender on its window instead
+of growing the queue.
+"""
+import argparse
+import asyncio
+import collections
+import sys
+
+import compress
+import config
+import fec
+import integrity
+from congestion import CONTROLLERS
+from session import Endpoint, Settings
+from transfer import Transfer
+from utils import open_input
+
+START_TIMEOUT = 10  # Give up if the receiver does not answer START within this many seconds
+QUEUE_PACKETS = 1024  # In-order payloads receive() holds for its consumer before it pauses the socket
+
+
+async def aiter_chunks(data, size=config.packet_size):
+    """Regroup an async iterable of bytes into payloads of size bytes"""
+    pending = bytearray()
+    async for piece in data:
+        pending += piece
+        while len(pending) >= size:
+            yield bytes(pending[:size])
+            del pending[:size]
+    if pending:
+        yield bytes(pending)
+
+
+class SenderProtocol(asyncio.DatagramProtocol):
+    """Sending side of one transfer: a transfer.Transfer driven by loop callbacks"""
+
+    def __init__(self, data, window_size, **options):
+        self.loop = asyncio.get_running_loop()
+        self.transport = None
+        self.transfer = Transfer(self.send, data, window_size, **options)
+        self.timer_handle = None
+        self.started = self.loop.create_future()
+        self.done = self.loop.create_future()
+        self.window_open = None  # Future the pump waits on while the window is full
+
+    def send(self, packet):
+        self.transport.sendto(packet)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self._cancel_timer()
+        if not self.done.done():
+            self.done.set_exception(exc or ConnectionError("socket closed"))
+        self._wake_pump()
+
+    def error_received(self, exc):
+        # ICMP errors (e.g. port unreachable while the receiver starts): keep retrying
+        pass
+
+    def datagram_received(self, data, addr):
+        transfer = self.transfer
+        if not self.started.done():
+            if transfer.accept_start(data):
+                transfer.begin()
+                self.started.set_result(True)
+            return
+        if self.done.done():
+            return
+        if transfer.on_packet(data, self.loop.time()):
+            self._wake_pump()
+        if not transfer.is_running:
+            # END acknowledged, or the receiver reset the transfer
+            self._finish()
+            return
+        self._arm_timer()
+
+    def _cancel_timer(self):
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+            self.timer_handle = None
+
+    def _arm_timer(self):
+        """Keep one loop timer on the earliest retransmission deadline"""
+        deadline = self.transfer.next_deadline()
+        if self.timer_handle is not None:
+            if deadline is not None and self.timer_handle.when() == deadline:
+                return
+            self.timer_handle.cancel()
+            self.timer_handle = None
+        if deadline is not None and not self.done.done():
+            self.timer_handle = self.loop.call_at(deadline, self._on_timer)
+
+    def _on_timer(self):
+        self.timer_handle = None
+        self.transfer.expire(self.loop.time())
+        self._arm_timer()
+
+    def _wake_pump(self):
+        if self.window_open is not None and not self.window_open.done():
+            self.window_open.set_result(None)
+
+    async def _wait(self, blocked):
+        """Sleep until blocked() is False or the transfer ended; returns False if it ended"""
+        while blocked() and not self.done.done():
+            self.window_open = self.loop.create_future()
+            await self.window_open
+        return not self.done.done()
+
+    def _finish(self):
+        self._cancel_timer()
+        self.transfer.finish()
+        if not self.done.done():
+            self.done.set_result(True)
+        self._wake_pump()
+
+    async def _payloads(self):
+        """The transfer's payloads, without blocking the loop on a slow input"""
+        transfer = self.transfer
+        if hasattr(transfer.data, "__aiter__"):
+            async for payload in aiter_chunks(transfer.data, transfer.packet_size):
+                yield payload
+            return
+        chunks = transfer.payloads()
+        if isinstance(transfer.data, (bytes, bytearray, memoryview)) and transfer.compression is None:
+            # Slices of memory never block
+            for payload in chunks:
+                yield payload
+            return
+        # A pipe, a file or the compression worker may: wait for them in the default executor
+        ready = getattr(chunks, "ready", None)
+        while True:
+            if ready is not None and ready():
+                payload = next(chunks, None)
+            else:
+                payload = await self.loop.run_in_executor(None, next, chunks, None)
+            if payload is None:
+                return
+            yield payload
+
+    async def handshake(self):
+        """Send START until it is acknowledged"""
+        deadline = self.loop.time() + START_TIMEOUT
+        while self.loop.time() < deadline:
+            self.send(self.transfer.start_packet())
+            try:
+                await asyncio.wait_for(asyncio.shield(self.started), self.transfer.rto_estimator.rto)
+                return
+            except asyncio.TimeoutError:
+                continue
+        raise ConnectionError("no ACK for START")
+
+    async def run(self):
+        await self.handshake()
+        transfer = self.transfer
+        payloads = self._payloads()
+        try:
+            async for payload in payloads:
+                if not await self._wait(lambda: transfer.room() <= 0):
+                    break
+                chunk = [payload]
+                transfer.send_new(chunk, *transfer.encode(chunk), self.loop.time())
+                self._arm_timer()
+            else:
+                transfer.input_done = True
+        finally:
+            await payloads.aclose()
+        # Everything must be acknowledged before END goes out
+        if await self._wait(lambda: not transfer.all_acked()):
+            transfer.send_end(self.loop.time())
+            self._arm_timer()
+            try:
+                # The receiver exits after acknowledging END, don't retry forever
+                await asyncio.wait_for(asyncio.shield(self.done), max(config.rto_initial, 4 * transfer.rto_estimator.rto))
+            except asyncio.TimeoutError:
+                pass
+        self._finish()
+        # Surfaces the exception if the socket was lost
+        self.done.result()
+        if not transfer.complete():
+            raise ConnectionError(f"transfer failed at packet {transfer.base}")
+
+
+class ReceiverProtocol(asyncio.DatagramProtocol):
+    """Receiving side: a session.Endpoint fed by loop callbacks, in-order payloads queued for get()"""
+
+    def __init__(self, window_size, settings, queue_limit=QUEUE_PACKETS):
+        self.loop = asyncio.get_running_loop()
+        self.endpoint = Endpoint(window_size, settings, sink=self._deliver)
+        self.transport = None
+        self.queue = collections.deque()
+        self.queue_limit = queue_limit
+        self.paused = False  # Socket reads paused until the consumer catches up
+        self.ready = None  # Future get() waits on while the queue is empty
+        self.finished = False
+        self.error = None  # Raised by get() once the queue is drained
+        self.ack_timer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.endpoint.settings.ack_every > 1:
+            self.ack_timer = self.loop.call_later(self.endpoint.settings.ack_delay, self._flush_acks)
+
+    def connection_lost(self, exc):
+        if not self.finished:
+            self._end(exc or ConnectionError("socket closed"))
+        self.endpoint.close()
+
+    def _flush_acks(self):
+        """Send the ACKs the policy held back, like the receiver's socket timeout does"""
+        self.endpoint.flush_acks(self.transport, self.loop.time())
+        if not self.finished:
+            self.ack_timer = self.loop.call_later(self.endpoint.settings.ack_delay, self._flush_acks)
+
+    def _deliver(self, payload):
+        self.queue.append(bytes(payload))
+        self._wake()
+
+    def _wake(self):
+        if self.ready is not None and not self.ready.done():
+            self.ready.set_result(None)
+
+    def _end(self, error):
+        self.finished = True
+        self.error = error
+        if self.ack_timer is not None:
+            self.ack_timer.cancel()
+        self._wake()
+
+    def datagram_received(self, data, addr):
+        endpoint = self.endpoint
+        endpoint.handle_packet(self.transport, data, addr)
+        if not endpoint.is_running and not self.finished:
+            # Stopped by END, or by data that did not decode (that session is gone)
+            if any(session.finished for session in endpoint.sessions.values()):
+                self._end(None)
+            else:
+                self._end(ValueError("the transfer failed on data that does not decode"))
+        # One datagram can release up to a window of held payloads, so the queue stays within queue_limit + 2 * window_size
+        if len(self.queue) >= self.queue_limit and not self.paused:
+            self.transport.pause_reading()
+            self.paused = True
+
+    async def get(self):
+        """Next in-order payload, None after the last one"""
+        while not self.queue:
+            if self.finished:
+                if self.error is not None:
+                    raise self.error
+                return None
+            self.ready = self.loop.create_future()
+            await self.ready
+        payload = self.queue.popleft()
+        if self.paused and len(self.queue) <= self.queue_limit // 2:
+            self.paused = False
+            self.transport.resume_reading()
+        return payload
+
+
+async def send(data, remote_addr, window_size, cc="none", **options):
+    """Send data (bytes-like, binary file, iterable or async iterable of bytes).
+
+    options are those of transfer.Transfer (checksum, max_packet_size, FEC,
+    compression, resume...). Returns the finished Transfer for inspection
+    (stats, rto_estimator, congestion); raises ConnectionError if START is
+    not answered or the receiver does not take the whole input.
+    """
+    if hasattr(data, "__aiter__") and options.get("compress_method") is not None:
+        raise ValueError("compression needs a bytes-like, file or iterable input")
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: SenderProtocol(data, window_size, cc=cc, **options), remote_addr=remote_addr)
+    try:
+        await protocol.run()
+    finally:
+        transport.close()
+    return protocol.transfer
+
+
+async def receive(local_addr, window_size, settings=None, queue_limit=QUEUE_PACKETS):
+    """Yield the payloads of one incoming transfer, in order.
+
+    settings (session.Settings) decides what START may agree on. Raises
+    ValueError if the transfer fails on data that does not decode.
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: ReceiverProtocol(window_size, settings or Settings(), queue_limit), local_addr=local_addr)
+    try:
+        while True:
+            chunk = await protocol.get()
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        transport.close()
+
+
+async def _main(args):
+    if args.mode == "send":
+        options = {"checksum": args.checksum}
+        if args.fec != "off":
+            options.update(fec_scheme=args.fec, fec_parity=1 if args.fec == "xor" else config.fec_parity)
+        if args.compress != "off":
+            options["compress_method"] = args.compress
+        if args.packet_size:
+            options["max_packet_size"] = args.packet_size
+        try:
+            transfer = await send(open_input(args.file), (args.ip, args.port), args.window_size, cc=args.cc, **options)
+        except ConnectionError as e:
+            print(f"Transfer failed: {e}", file=sys.stderr)
+            return 1
+        transfer.report()
+        print(f"Sent {transfer.num_packet} packets, {transfer.stats.counters['retransmits']} retransmissions")
+    else:
+        try:
+            async for chunk in receive((args.ip, args.port), args.window_size):
+                sys.stdout.buffer.write(chunk)
+        except ValueError as e:
+            print(f"Transfer failed: {e}", file=sys.stderr)
+            return 1
+        finally:
+            sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reliable UDP transfer on asyncio")
+    parser.add_argument("mode", choices=["send", "receive"])
+    parser.add_argument("ip", type=str, help="Receiver host (address to bind when receiving)")
+    parser.add_argument("port", type=int, help="Receiver port")
+    parser.add_argument("window_size", type=int, help="Window size")
+    parser.add_argument("--file", type=str, default=None, help="Send this file instead of stdin")
+    parser.add_argument("--cc", choices=sorted(CONTROLLERS), default="none", help="Congestion control")
+    parser.add_argument("--checksum", choices=sorted(integrity.ALGORITHMS), default=integrity.DEFAULT, help="Checksum to propose at START")
+    parser.add_argument("--packet-size", type=int, default=None, help="Largest DATA payload to propose at START")
+    parser.add_argument("--fec", choices=["off"] + sorted(fec.SCHEMES), default="off", help="Send parity packets per block if the receiver accepts")
+    parser.add_argument("--compress", choices=["off"] + sorted(compress.METHODS), default="off", help="Compress the input if the receiver accepts")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
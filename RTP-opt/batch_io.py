@@ -0,0 +1,136 @@
+import errno
+import socket
+import struct
+
+# Linux UDP segmentation offload (linux/udp.h); not all Python builds export them
+SOL_UDP = getattr(socket, "SOL_UDP", 17)
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+UDP_GRO = getattr(socket, "UDP_GRO", 104)
+UDP_MAX_SEGMENTS = 64
+MAX_UDP_PAYLOAD = 65507
+# Per-socket count of datagrams dropped because the receive buffer was full
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40)
+
+_segment_size = struct.Struct("=H")
+_gro_size = struct.Struct("=i")
+_drop_count = struct.Struct("=I")
+# Errors meaning the kernel/device can't do GSO: fall back to one sendto per packet
+_UNSUPPORTED = (errno.EINVAL, errno.EIO, errno.ENOPROTOOPT, errno.EOPNOTSUPP)
+# Send buffer full: the datagram is lost, retransmission will recover it
+_DROPPED = (errno.ENOBUFS, errno.EAGAIN)
+
+
+class BatchSender:
+    """Sends runs of packets with as few syscalls as possible.
+
+    With UDP GSO a run of equally sized packets (the last one may be shorter)
+    goes out in a single sendmsg: the payloads are passed as an iovec, so they
+    are not even concatenated, and the kernel splits them back into one
+    datagram per packet. Without GSO support every packet costs a sendto, as
+    before. The receiver sees individual datagrams either way.
+    """
+
+    def __init__(self, sock, use_gso=True):
+        self.sock = sock
+        self.use_gso = use_gso and hasattr(sock, "sendmsg")
+        self.syscalls = 0
+        self.packets = 0
+        self.drops = 0
+
+    def max_batch(self, packet_size):
+        """Most packets of packet_size that fit in one GSO send"""
+        if not self.use_gso:
+            return 1
+        return max(1, min(UDP_MAX_SEGMENTS, MAX_UDP_PAYLOAD // packet_size))
+
+    def send(self, packets, addr):
+        self.packets += len(packets)
+        start = 0
+        while start < len(packets):
+            # A run ends after the first packet that differs from the segment size
+            size = len(packets[start])
+            end = start + 1
+            limit = min(len(packets), start + self.max_batch(size))
+            while end < limit and len(packets[end - 1]) == size and len(packets[end]) <= size:
+                end += 1
+            if end - start > 1 and self.use_gso:
+                try:
+                    self.sock.sendmsg(packets[start:end], [(SOL_UDP, UDP_SEGMENT, _segment_size.pack(size))], 0, addr)
+                    self.syscalls += 1
+                    start = end
+                    continue
+                except OSError as e:
+                    if e.errno in _DROPPED:
+                        self.drops += end - start
+                        start = end
+                        continue
+                    if e.errno not in _UNSUPPORTED:
+                        raise
+                    self.use_gso = False
+            for pkt in packets[start:end]:
+                self.syscalls += 1
+                try:
+                    self.sock.sendto(pkt, addr)
+                except OSError as e:
+                    if e.errno not in _DROPPED:
+                        raise
+                    self.drops += 1
+            start = end
+
+
+class BatchReceiver:
+    """Receives bursts of datagrams with UDP GRO.
+
+    With GRO enabled the kernel may coalesce several datagrams from the same
+    flow into one buffer and report the segment size in a control message,
+    so a single recvmsg can drain a whole burst. recv() returns a list of
+    memoryviews, one per original datagram, and the sender address.
+
+    Where SO_RXQ_OVFL is available, drops holds the number of datagrams the
+    kernel discarded because the socket receive buffer was full.
+    """
+
+    def __init__(self, sock, use_gro=True, bufsize=2048):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.use_gro = False
+        self.count_drops = False
+        self.syscalls = 0
+        self.packets = 0
+        self.drops = 0
+        if not hasattr(sock, "recvmsg"):
+            return
+        if use_gro:
+            try:
+                sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+                self.use_gro = True
+                self.bufsize = 65535
+            except OSError:
+                pass
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+            self.count_drops = True
+        except OSError:
+            pass
+        self.ancbufsize = socket.CMSG_SPACE(_gro_size.size) + socket.CMSG_SPACE(_drop_count.size)
+
+    def recv(self):
+        self.syscalls += 1
+        if not self.use_gro and not self.count_drops:
+            pkt, addr = self.sock.recvfrom(self.bufsize)
+            self.packets += 1
+            return [pkt], addr
+        data, ancdata, _, addr = self.sock.recvmsg(self.bufsize, self.ancbufsize)
+        segment = 0
+        for level, kind, value in ancdata:
+            if level == SOL_UDP and kind == UDP_GRO:
+                segment = _gro_size.unpack(value[:_gro_size.size])[0]
+            elif level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                self.drops = _drop_count.unpack(value[:_drop_count.size])[0]
+        if not segment or segment >= len(data):
+            self.packets += 1
+            return [data], addr
+        view = memoryview(data)
+        packets = [view[i:i + segment] for i in range(0, len(data), segment)]
+        self.packets += len(packets)
+        return packets, addr
@@ -0,0 +1,223 @@
+"""Optional compression stage between the input and packetization.
+
+The input is cut into blocks of config.compress_block bytes and every block
+is compressed on its own (no dictionary carried over), so each frame can be
+decoded without the ones before it. A frame is
+
+    FRAME header (method, raw offset, raw length, payload length) + payload
+
+zero-padded to a whole number of packets, so every frame starts at the
+beginning of a DATA payload and packets stay full size (FEC keeps protecting
+them). Blocks that do not shrink are sent stored (method 0), which bounds the
+cost on incompressible input to the header and the padding; a fast zlib pass
+over the first PROBE bytes skips compressing blocks that will not shrink.
+
+Compression runs on a worker thread feeding a bounded queue; zlib and lzma
+release the GIL while they work, so the send loop keeps running meanwhile.
+
+Run this file for a benchmark on compressible (JSON log lines) and
+incompressible (random) input.
+"""
+import queue
+import struct
+import threading
+import zlib
+
+try:
+    import lzma
+except ImportError:  # Python built without liblzma
+    lzma = None
+
+import config
+from utils import iter_chunks
+
+FRAME = struct.Struct("!BQII")  # method, offset of the block in the raw input, raw length, payload length
+STORED = 0
+METHODS = {"zlib": 1}  # Wire ids in the START option (utils.OPT_COMPRESS) and in FRAME
+if lzma is not None:
+    METHODS["lzma"] = 2
+METHOD_NAMES = {i: name for name, i in METHODS.items()}
+DECODE_ERRORS = (zlib.error,) if lzma is None else (zlib.error, lzma.LZMAError)
+DEFAULT_LEVELS = {"zlib": 6, "lzma": 0}
+QUEUE_FRAMES = 8  # Compressed frames the worker may run ahead of the send loop
+PROBE = 16 * 1024  # Bytes of a block compressed first to detect incompressible data
+MAX_BLOCK = max(config.compress_block, 8 * config.max_packet_size)  # Largest raw length a sender's block can have
+
+
+def compress_block(method, block, level):
+    if method == "zlib":
+        return zlib.compress(block, level)
+    return lzma.compress(block, preset=level)
+
+
+def decompress_block(method_id, payload, raw_length):
+    """Decode a frame payload into at most raw_length bytes, ValueError if it is not a whole valid stream"""
+    try:
+        if method_id == METHODS["zlib"]:
+            decoder = zlib.decompressobj()
+            raw = decoder.decompress(payload, raw_length)
+        else:
+            decoder = lzma.LZMADecompressor()
+            raw = decoder.decompress(payload, max_length=raw_length)
+    except DECODE_ERRORS as e:
+        raise ValueError(f"corrupt {METHOD_NAMES[method_id]} frame: {e}") from e
+    if not decoder.eof:
+        raise ValueError(f"{METHOD_NAMES[method_id]} frame does not end within {raw_length} bytes")
+    return raw
+
+
+def encode_frame(method, block, offset, level, packet_size=config.packet_size):
+    """FRAME header + payload of one raw block, padded to whole packets"""
+    sample = block[:PROBE]
+    if len(zlib.compress(sample, 1)) >= len(sample) * 0.98:
+        payload = block  # Already compressed or random
+    else:
+        payload = compress_block(method, block, level)
+    method_id = METHODS[method]
+    if len(payload) >= len(block):
+        payload, method_id = block, STORED
+    frame = bytearray(FRAME.pack(method_id, offset, len(block), len(payload)))
+    frame += payload
+    frame += bytes(-len(frame) % packet_size)
+    return frame
+
+
+class Compressor:
+    """Iterator of packet payloads compressed from data by a worker thread"""
+
+    def __init__(self, data, method, level, block_size=config.compress_block, packet_size=config.packet_size):
+        self.method = method
+        self.packet_size = packet_size
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.frames = queue.Queue(QUEUE_FRAMES)
+        self.worker = threading.Thread(target=self._run, args=(data, level, block_size), daemon=True)
+        self.worker.start()
+
+    def _run(self, data, level, block_size):
+        try:
+            offset = 0
+            for block in iter_chunks(data, block_size):
+                frame = encode_frame(self.method, block, offset, level, self.packet_size)
+                offset += len(block)
+                self.raw_bytes += len(block)
+                self.compressed_bytes += len(frame)
+                self.frames.put(frame)
+            self.frames.put(None)
+        except Exception as e:  # Raised again in the sending thread
+            self.frames.put(e)
+
+    def __iter__(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                return
+            if isinstance(frame, Exception):
+                raise frame
+            yield from iter_chunks(frame, self.packet_size)
+
+    def __str__(self):
+        ratio = self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0
+        return f"{self.method}: {self.raw_bytes} bytes sent as {self.compressed_bytes} ({ratio:.2f}x)"
+
+
+class Decompressor:
+    """Receiver side: fed the DATA payloads in order, returns (raw offset, bytes) of each complete frame.
+
+    Raises ValueError on a frame that does not decode (the transfer cannot go on).
+    """
+
+    def __init__(self, method):
+        self.method = method
+        self.pending = bytearray()  # Payload of the frame being collected
+        self.header = None  # FRAME fields of that frame
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+
+    def feed(self, payload):
+        self.compressed_bytes += len(payload)
+        if self.header is None:
+            if len(payload) < FRAME.size:
+                # Every frame starts a packet, and compression is only agreed on packets that fit a FRAME header
+                raise ValueError(f"{len(payload)}-byte packet cannot start a frame")
+            method_id, offset, raw_length, length = FRAME.unpack_from(payload)
+            if method_id not in (STORED, METHODS[self.method]):
+                raise ValueError(f"frame at {offset} uses method {method_id}, not {self.method}")
+            if raw_length > MAX_BLOCK:
+                raise ValueError(f"frame at {offset} claims {raw_length} raw bytes, blocks are at most {MAX_BLOCK}")
+            self.header = method_id, offset, raw_length, length
+            payload = memoryview(payload)[FRAME.size:]
+        method_id, offset, raw_length, length = self.header
+        self.pending += payload[:length - len(self.pending)]
+        if len(self.pending) < length:
+            return []
+        # The rest of this packet is padding, the next frame starts with the next packet
+        pending = bytes(self.pending)
+        self.header = None
+        self.pending = bytearray()
+        raw = pending if method_id == STORED else decompress_block(method_id, pending, raw_length)
+        if len(raw) != raw_length:
+            raise ValueError(f"frame at {offset} decoded to {len(raw)} bytes instead of {raw_length}")
+        self.raw_bytes += len(raw)
+        return [(offset, raw)]
+
+    def finish(self):
+        """At END: ValueError if the stream stopped inside a frame"""
+        if self.header is not None:
+            _, offset, _, length = self.header
+            raise ValueError(f"stream ended {length - len(self.pending)} bytes short of the end of the frame at {offset}")
+
+    def __str__(self):
+        ratio = self.raw_bytes / self.compressed_bytes if self.compressed_bytes else 0
+        return f"{self.method} {ratio:.2f}x"
+
+
+def sample_logs(size, seed=1):
+    """Compressible input: JSON log lines"""
+    import json
+    import random
+
+    rng = random.Random(seed)
+    lines = []
+    total = 0
+    while total < size:
+        line = json.dumps({"ts": 1700000000 + total // 100, "level": rng.choice(["INFO", "INFO", "WARN", "ERROR"]),
+                           "service": rng.choice(["api", "auth", "billing"]), "latency_ms": rng.randint(1, 500),
+                           "path": f"/v1/items/{rng.randint(1, 10000)}", "status": rng.choice([200, 200, 200, 404, 500])}) + "\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines).encode()[:size]
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import time
+
+    parser = argparse.ArgumentParser(description="Compression stage benchmark")
+    parser.add_argument("--size", type=int, default=8 << 20, help="Bytes of each generated input")
+    parser.add_argument("--file", type=str, default=None, help="Also benchmark this file")
+    args = parser.parse_args()
+    inputs = {"logs": sample_logs(args.size), "random": os.urandom(args.size)}
+    if args.file:
+        with open(args.file, "rb") as f:
+            inputs[os.path.basename(args.file)] = f.read()
+    for name, data in inputs.items():
+        for method, levels in (("zlib", (1, 6)), ("lzma", (0, 6))):
+            if method not in METHODS:
+                continue
+            for level in levels:
+                t0 = time.perf_counter()
+                compressor = Compressor(data, method, level)
+                payloads = [bytes(p) for p in compressor]
+                t1 = time.perf_counter()
+                decompressor = Decompressor(method)
+                out = bytearray(len(data))
+                for payload in payloads:
+                    for offset, raw in decompressor.feed(payload):
+                        out[offset:offset + len(raw)] = raw
+                t2 = time.perf_counter()
+                assert out == data
+                print(f"{name:8s} {method} level {level}: {len(payloads)} packets for {-(-len(data) // config.packet_size)} raw "
+                      f"({len(data) / compressor.compressed_bytes:5.2f}x)  compress {len(data) / (t1 - t0) / 1e6:7.1f} MB/s  "
+                      f"decompress {len(data) / (t2 - t1) / 1e6:7.1f} MB/s")
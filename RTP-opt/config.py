@@ -1,7 +1,49 @@
 packet_size = 1456 #1500 MTU of ethernet  - 8 UDP_header - 20 IP_header - 16 Packet_Header = 1456 bytes
+# Default DATA payload; START can agree on a larger one, up to a whole UDP datagram (65507 - 16 header bytes)
+max_packet_size = 65491
+# Wait for the echo of each path MTU probe (sender --pmtu-probe)
+pmtu_probe_timeout = 0.1
+
+# Retransmission timeout (seconds): initial value and bounds of the adaptive RTO
+rto_initial = 0.5
+rto_min = 0.05
+rto_max = 10.0
+
+# Most [start, end) ranges of out-of-order packets reported in one SACK
+sack_max_ranges = 32
+
+# Duplicate ACKs that trigger a fast retransmit of the missing packet
+dupack_threshold = 3
+
+# Receiver ACK policy: ACK every Nth in-order packet, hold the rest at most ack_delay seconds
+ack_every = 1
+ack_delay = 0.02
+
+# Receiver sessions: drop a sender silent for this many seconds; most concurrent transfers
+session_idle_timeout = 10.0
+max_sessions = 1024
+
+# Forward error correction (sender --fec): DATA packets per block and parity packets per block
+fec_block = 8
+fec_parity = 1
+
+# Compression stage (sender --compress): raw bytes per independently compressed frame
+compress_block = 256 * 1024
+
+# Resumable transfers (sender --resume): checkpoint the receive state after this many delivered
+# packets or seconds, whichever comes first
+checkpoint_packets = 4096
+checkpoint_interval = 1.0
+
+# Events kept in the in-memory trace ring (17 bytes each) when tracing is on
+trace_events = 65536
 
 class message_type:
     START = 0 
     END = 1 
     DATA = 2 
-    ACK = 3 
\ No newline at end of file
+    ACK = 3
+    SACK = 4  # Cumulative ACK in seq_num + received ranges in the payload
+    PARITY = 5  # FEC parity of a block of DATA packets, seq_num counts parity packets (fec.py)
+    PROBE = 6  # Path MTU probe padded to seq_num payload bytes, echoed empty by the receiver (pmtu.py)
+    RESET = 7  # Receiver has no session for the sender's DATA/END (evicted, restarted or undecodable), seq_num echoes theirs, payload utils.RESET_REASON
\ No newline at end of file
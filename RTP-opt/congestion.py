@@ -0,0 +1,132 @@
+class CongestionController:
+    """Decides how many packets the sender may have in flight.
+
+    The sender calls on_ack() for every newly acknowledged packet, on_loss()
+    when a loss is inferred from duplicate/selective ACKs and on_timeout()
+    once per retransmission timeout. cwnd is counted in packets and never
+    exceeds max_window (the window_size given on the command line).
+    """
+
+    name = "none"
+
+    def __init__(self, max_window):
+        self.max_window = max_window
+        self.cwnd = float(max_window)
+        self.ssthresh = float("inf")
+
+    def window(self):
+        """Number of packets allowed in flight right now"""
+        return max(1, min(int(self.cwnd), self.max_window))
+
+    def on_ack(self, acked, now, rtt=None):
+        pass
+
+    def on_loss(self, now):
+        pass
+
+    def on_timeout(self, now):
+        pass
+
+    def _cap(self):
+        self.cwnd = min(self.cwnd, float(self.max_window))
+
+    def __repr__(self):
+        return f"{self.name} cwnd={self.cwnd:.1f} ssthresh={self.ssthresh:.1f}"
+
+
+class Reno(CongestionController):
+    """AIMD with slow start: +1 packet per ACK below ssthresh, +1 per RTT above
+    it, halve on loss and restart from one packet after a timeout."""
+
+    name = "reno"
+    INITIAL_WINDOW = 10
+
+    def __init__(self, max_window):
+        super().__init__(max_window)
+        self.cwnd = float(min(self.INITIAL_WINDOW, max_window))
+
+    def on_ack(self, acked, now, rtt=None):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+        else:
+            self.cwnd += acked / self.cwnd
+        self._cap()
+
+    def on_loss(self, now):
+        self.ssthresh = max(self.cwnd / 2, 2.0)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self, now):
+        self.ssthresh = max(self.cwnd / 2, 2.0)
+        self.cwnd = 1.0
+
+
+class Cubic(CongestionController):
+    """CUBIC (RFC 8312): after a loss the window follows
+    W(t) = C * (t - K)^3 + W_max, never growing slower than Reno would."""
+
+    name = "cubic"
+    INITIAL_WINDOW = 10
+    C = 0.4
+    BETA = 0.7
+
+    def __init__(self, max_window):
+        super().__init__(max_window)
+        self.cwnd = float(min(self.INITIAL_WINDOW, max_window))
+        self.w_max = 0.0
+        self.w_last_max = 0.0
+        self.epoch_start = None
+        self.k = 0.0
+        self.origin = 0.0
+        self.w_est = 0.0  # Reno-friendly estimate
+
+    def on_ack(self, acked, now, rtt=None):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+            self._cap()
+            return
+        if self.epoch_start is None:
+            self.epoch_start = now
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / self.C) ** (1 / 3)
+                self.origin = self.w_max
+            else:
+                self.k = 0.0
+                self.origin = self.cwnd
+            self.w_est = self.cwnd
+        t = now - self.epoch_start + (rtt or 0.0)
+        target = self.origin + self.C * (t - self.k) ** 3
+        self.w_est += 3 * (1 - self.BETA) / (1 + self.BETA) * acked / self.cwnd
+        target = max(target, self.w_est)
+        if target > self.cwnd:
+            self.cwnd += (target - self.cwnd) / self.cwnd * acked
+        else:
+            self.cwnd += 0.01 * acked / self.cwnd
+        self._cap()
+
+    def on_loss(self, now):
+        self.epoch_start = None
+        # Fast convergence: release bandwidth if the previous peak was not reached
+        if self.cwnd < self.w_last_max:
+            self.w_last_max = self.cwnd
+            self.w_max = self.cwnd * (1 + self.BETA) / 2
+        else:
+            self.w_last_max = self.cwnd
+            self.w_max = self.cwnd
+        self.cwnd = max(self.cwnd * self.BETA, 2.0)
+        self.ssthresh = self.cwnd
+
+    def on_timeout(self, now):
+        self.on_loss(now)
+        self.cwnd = 1.0
+
+
+CONTROLLERS = {
+    CongestionController.name: CongestionController,
+    Reno.name: Reno,
+    Cubic.name: Cubic,
+}
+
+
+def make_controller(name, max_window):
+    return CONTROLLERS[name](max_window)
@@ -0,0 +1,237 @@
+"""Forward error correction: parity packets per block of K DATA packets.
+
+DATA packets 1.. are grouped in blocks of k consecutive sequence numbers
+(block b holds seqs b*k+1 .. b*k+k). Once a block is sent, m PARITY packets
+follow it, each a linear combination over GF(2^8) of the k payloads:
+
+    xor  m = 1, plain XOR of the payloads: repairs one loss per block
+    rs   m >= 1 rows of a Cauchy matrix (a Reed-Solomon style MDS code):
+         any k of the k + m packets rebuild the block
+
+A PARITY packet carries the row in its own sequence space, b * m + row, so
+the header needs no extra fields. Only blocks of k full-size payloads
+are protected; the block holding the short last packet of the input gets no
+parity and relies on retransmission alone, like a partial last block.
+
+Products with a constant are bytes.translate() over a 256-byte table and
+sums are XORs of whole payloads as Python ints, so encoding costs a few
+C-level passes per payload rather than a Python loop per byte.
+"""
+import config
+
+SCHEMES = {"xor": 1, "rs": 2}  # Wire ids in the START option (utils.FEC_PARAMS)
+SCHEME_NAMES = {i: name for name, i in SCHEMES.items()}
+
+# GF(2^8) with the polynomial x^8 + x^4 + x^3 + x^2 + 1
+_EXP = [0] * 512
+_LOG = [0] * 256
+_x = 1
+for _i in range(255):
+    _EXP[_i] = _x
+    _LOG[_x] = _i
+    _x <<= 1
+    if _x & 0x100:
+        _x ^= 0x11D
+for _i in range(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def gf_inv(a):
+    return _EXP[255 - _LOG[a]]
+
+
+# _MUL[c] maps every byte x to c * x, for bytes.translate
+_MUL = [bytes(gf_mul(c, x) for x in range(256)) for c in range(256)]
+
+
+def _scaled(c, data):
+    """c * data as a little-endian int, ready to be XORed"""
+    if c != 1:
+        data = bytes(data).translate(_MUL[c])
+    return int.from_bytes(data, "little")
+
+
+def coefficients(scheme, k, m):
+    """m x k matrix of the parity rows"""
+    if scheme == "xor":
+        return [[1] * k]
+    # Cauchy matrix 1 / (x_row + y_col) with distinct x and y: every square submatrix is invertible
+    return [[gf_inv(row ^ (m + col)) for col in range(k)] for row in range(m)]
+
+
+def valid(scheme, k, m):
+    return scheme in SCHEMES and k >= 1 and m >= 1 and k + m <= 256 and (scheme != "xor" or m == 1)
+
+
+def _invert(matrix):
+    """Inverse of a square GF(2^8) matrix by Gauss-Jordan elimination"""
+    n = len(matrix)
+    rows = [list(row) + [int(i == j) for j in range(n)] for i, row in enumerate(matrix)]
+    for col in range(n):
+        pivot = next(r for r in range(col, n) if rows[r][col])
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        scale = gf_inv(rows[col][col])
+        rows[col] = [gf_mul(scale, v) for v in rows[col]]
+        for r in range(n):
+            factor = rows[r][col]
+            if r != col and factor:
+                rows[r] = [v ^ gf_mul(factor, p) for v, p in zip(rows[r], rows[col])]
+    return [row[n:] for row in rows]
+
+
+class Encoder:
+    """Sender side: accumulates the parity of the current block as packets go out"""
+
+    def __init__(self, scheme, k, m, packet_size=config.packet_size):
+        self.scheme = scheme
+        self.k = k
+        self.m = m
+        self.packet_size = packet_size
+        self.matrix = coefficients(scheme, k, m)
+        self.block = 0  # Block being accumulated
+        self.sums = [0] * m
+        self.complete = True  # No short payload in the block so far
+        self.blocks_sent = 0  # Blocks below this one had their parity sent
+        self.parity_sent = 0
+        self.next_seq = 1  # A block entered midway (a resumed transfer) gets no parity
+
+    def add(self, seq, payload):
+        """Account DATA seq (sent for the first time); returns [(parity seq, payload)] when it ends a block"""
+        block, index = divmod(seq - 1, self.k)
+        if index == 0:
+            self.block = block
+            self.sums = [0] * self.m
+            self.complete = True
+        elif seq != self.next_seq:
+            self.complete = False
+        self.next_seq = seq + 1
+        if len(payload) != self.packet_size:
+            self.complete = False
+        if not self.complete:
+            return []
+        for row in range(self.m):
+            self.sums[row] ^= _scaled(self.matrix[row][index], payload)
+        if index != self.k - 1:
+            return []
+        self.blocks_sent = block + 1
+        self.parity_sent += self.m
+        return [(block * self.m + row, self.sums[row].to_bytes(self.packet_size, "little")) for row in range(self.m)]
+
+    def block_last(self, seq):
+        """Last DATA seq of the block holding seq"""
+        return ((seq - 1) // self.k + 1) * self.k
+
+    def protected(self, seq):
+        """Parity of seq's block was sent, so the receiver may rebuild seq without a retransmission"""
+        return (seq - 1) // self.k < self.blocks_sent
+
+    def __str__(self):
+        return f"FEC {self.scheme} k={self.k} m={self.m}: {self.parity_sent} parity packets"
+
+
+class Decoder:
+    """Receiver side: keeps the payloads of incomplete blocks and rebuilds missing packets"""
+
+    def __init__(self, scheme, k, m, packet_size=config.packet_size):
+        self.scheme = scheme
+        self.k = k
+        self.m = m
+        self.packet_size = packet_size
+        self.matrix = coefficients(scheme, k, m)
+        self.blocks = {}  # Block -> ({index: payload}, {row: parity payload})
+        self.released = 0  # Blocks below this one are delivered and forgotten
+        self.recovered = 0
+
+    def _entry(self, block):
+        entry = self.blocks.get(block)
+        if entry is None:
+            entry = self.blocks[block] = ({}, {})
+        return entry
+
+    def add_data(self, seq, payload):
+        """Remember DATA seq (first arrival); returns the [(seq, payload)] it lets us rebuild"""
+        block, index = divmod(seq - 1, self.k)
+        if block < self.released:
+            return []
+        data, parity = self._entry(block)
+        data[index] = bytes(payload)
+        return self._recover(block)
+
+    def add_parity(self, parity_seq, payload):
+        """Remember a PARITY packet; returns the [(seq, payload)] it lets us rebuild"""
+        block, row = divmod(parity_seq, self.m)
+        if block < self.released or len(payload) != self.packet_size:
+            return []
+        data, parity = self._entry(block)
+        parity[row] = bytes(payload)
+        return self._recover(block)
+
+    def release(self, expected_seq):
+        """Forget the blocks wholly below expected_seq"""
+        below = (expected_seq - 1) // self.k
+        if below <= self.released:
+            return
+        self.released = below
+        for block in [b for b in self.blocks if b < below]:
+            del self.blocks[block]
+
+    def _recover(self, block):
+        data, parity = self.blocks[block]
+        if len(data) == self.k:
+            del self.blocks[block]
+            return []
+        missing = [i for i in range(self.k) if i not in data]
+        if len(missing) > len(parity):
+            return []
+        rows = sorted(parity)[:len(missing)]
+        # Parity minus the known payloads leaves sum(c[row][i] * d[i]) over the missing i
+        syndromes = []
+        for row in rows:
+            row_coefficients = self.matrix[row]
+            value = int.from_bytes(parity[row], "little")
+            for index, payload in data.items():
+                value ^= _scaled(row_coefficients[index], payload)
+            syndromes.append(value.to_bytes(self.packet_size, "little"))
+        inverse = _invert([[self.matrix[row][i] for i in missing] for row in rows])
+        rebuilt = []
+        for i, index in enumerate(missing):
+            value = 0
+            for j, syndrome in enumerate(syndromes):
+                value ^= _scaled(inverse[i][j], syndrome)
+            rebuilt.append((block * self.k + index + 1, value.to_bytes(self.packet_size, "little")))
+        del self.blocks[block]
+        self.recovered += len(rebuilt)
+        return rebuilt
+
+    def __str__(self):
+        return f"FEC {self.scheme} k={self.k} m={self.m}: {self.recovered} packets rebuilt"
+
+
+if __name__ == "__main__":
+    import os
+    import random
+    import timeit
+
+    rng = random.Random(1)
+    for scheme, k, m in (("xor", 8, 1), ("rs", 8, 2), ("rs", 16, 4)):
+        payloads = [os.urandom(config.packet_size) for _ in range(k)]
+        encoder = Encoder(scheme, k, m)
+        parity = [out for seq, p in enumerate(payloads, 1) for out in encoder.add(seq, p)]
+        for _ in range(50):
+            decoder = Decoder(scheme, k, m)
+            lost = set(rng.sample(range(k + m), m))
+            rebuilt = []
+            for i in range(k + m):
+                if i in lost:
+                    continue
+                rebuilt += decoder.add_data(i + 1, payloads[i]) if i < k else decoder.add_parity(*parity[i - k])
+            assert sorted(rebuilt) == sorted((i + 1, payloads[i]) for i in lost if i < k), (scheme, lost)
+        per_block = min(timeit.repeat(lambda: [Encoder(scheme, k, m).add(seq, p) for seq, p in enumerate(payloads, 1)], number=200, repeat=3)) / 200
+        print(f"{scheme} k={k:<2d} m={m}: encode {per_block / k * 1e6:6.1f} us/packet ({config.packet_size * k / per_block / 1e6:6.0f} MB/s), "
+              f"overhead {m / k:.0%}, any {m} of {k + m} packets lost recovered")
@@ -0,0 +1,78 @@
+"""Packet checksum algorithms, selected per transfer at START.
+
+Every algorithm is a function f(data, value=0) that continues a running
+checksum, like binascii.crc32, so header and payload views are fed one after
+the other without concatenating them. "off" (None) leaves the checksum field
+at 0 and skips verification; only use it where the link already protects the
+data (loopback, datacenter fabrics with their own CRC). Receivers only
+agree to it when their --checksums lists it.
+
+crc32c uses the optional `crc32c` package (hardware accelerated where the
+CPU has SSE4.2/ARMv8 CRC instructions) and falls back to a table-driven
+pure-Python version, which is correct but slow.
+
+Run this file for a microbenchmark of per-packet build and verify cost.
+"""
+import binascii
+
+try:
+    from crc32c import crc32c as _crc32c_fast
+except ImportError:
+    _crc32c_fast = None
+
+
+def _crc_table(poly):
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ poly if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC32C_TABLE = _crc_table(0x82F63B78)  # Castagnoli polynomial, reflected
+
+
+def _crc32c_py(data, value=0):
+    table = _CRC32C_TABLE
+    crc = value ^ 0xFFFFFFFF
+    for byte in memoryview(data).cast("B"):
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+crc32 = binascii.crc32
+crc32c = _crc32c_fast or _crc32c_py
+
+ALGORITHMS = {"off": None, "crc32": crc32, "crc32c": crc32c}
+# Wire ids of the algorithms in the START option; 1 (crc32) is what peers without the option use
+ALGORITHM_IDS = {"off": 0, "crc32": 1, "crc32c": 2}
+ALGORITHM_NAMES = {i: name for name, i in ALGORITHM_IDS.items()}
+DEFAULT = "crc32"
+# What a receiver lets senders pick unless told otherwise: "off" is an explicit opt-in
+ACCEPTED = ("crc32", "crc32c")
+
+
+def by_id(algorithm_id):
+    """Name and function of a wire id; unknown ids fall back to the default"""
+    name = ALGORITHM_NAMES.get(algorithm_id, DEFAULT)
+    return name, ALGORITHMS[name]
+
+
+if __name__ == "__main__":
+    import timeit
+
+    import config
+    from utils import build_packet, verify_packet
+
+    payload = bytes(range(256)) * (config.packet_size // 256) + bytes(config.packet_size % 256)
+    buf = bytearray(64 * 1024)
+    print(f"{config.packet_size}-byte payload, crc32c {'from the crc32c package' if _crc32c_fast else 'in pure Python'}")
+    for name, algorithm in ALGORITHMS.items():
+        packet = bytes(build_packet(2, 1, payload, checksum=algorithm))
+        assert verify_packet(packet, checksum=algorithm) is not None
+        number = 20000 if algorithm is not _crc32c_py else 200
+        build = min(timeit.repeat(lambda: build_packet(2, 1, payload, buf=buf, checksum=algorithm), number=number, repeat=3)) / number
+        verify = min(timeit.repeat(lambda: verify_packet(packet, checksum=algorithm), number=number, repeat=3)) / number
+        print(f"{name:7s} build {build * 1e9:8.0f} ns/packet   verify {verify * 1e9:8.0f} ns/packet ({len(packet) / verify / 1e6:8.0f} MB/s)")
@@ -0,0 +1,52 @@
+import time
+
+
+class TokenBucket:
+    """Paces packets at `rate` per second with bursts of at most `burst`.
+
+    reserve() takes tokens immediately (the bucket may go into debt) and
+    returns how long the caller has to wait before sending, so consecutive
+    batches are spread evenly instead of leaving at line rate.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = 0.0
+        self.burst = 1.0
+        self.tokens = 0.0
+        self.last = time.perf_counter()
+        self.delay_total = 0.0  # Seconds spent waiting for tokens
+        self.paced = 0  # Reservations that had to wait
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """Change the rate (packets/s); burst defaults to 1 ms worth of packets"""
+        self._refill(time.perf_counter())
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate / 1000)
+        self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def available(self):
+        """Whole packets that can go out right now (at least 1)"""
+        self._refill(time.perf_counter())
+        return max(1, int(self.tokens))
+
+    def reserve(self, n):
+        """Take n tokens; returns the seconds to wait before sending them"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.perf_counter())
+        self.tokens -= n
+        if self.tokens >= 0:
+            return 0.0
+        wait = -self.tokens / self.rate
+        self.delay_total += wait
+        self.paced += 1
+        return wait
+
+    def __repr__(self):
+        return f"pacing {self.rate:.0f} pkt/s, waited {self.delay_total * 1000:.1f}ms over {self.paced} sends"
@@ -0,0 +1,104 @@
+"""Path MTU probing: the largest DATA payload that reaches the receiver unfragmented.
+
+Before START the sender sends PROBE packets padded to a candidate payload
+size with the Don't Fragment bit set (IP_PMTUDISC_PROBE, so the kernel's
+cached path MTU does not veto the attempt) and the receiver echoes each one
+it gets, statelessly, with an empty PROBE of the same seq_num. The largest
+echoed size wins. The search starts at the route MTU the kernel reports for
+the destination (64 KiB on loopback, 9000 on jumbo-frame links), so on a
+clean path the first probe already succeeds; otherwise a binary search runs
+down to config.packet_size, which is assumed to always fit.
+
+A receiver that does not know PROBE never answers, and the transfer keeps
+the default packet size.
+"""
+import errno
+import socket
+import time
+
+import config
+from utils import HEADER_SIZE, build_packet, verify_packet
+
+# Linux socket options (linux/in.h); not all Python builds export them
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_MTU = getattr(socket, "IP_MTU", 14)
+IP_PMTUDISC_WANT = getattr(socket, "IP_PMTUDISC_WANT", 1)
+IP_PMTUDISC_PROBE = getattr(socket, "IP_PMTUDISC_PROBE", 3)
+IP_UDP_OVERHEAD = 20 + 8
+GRANULARITY = 64  # Stop the search once the candidates are this close
+
+
+def route_payload_limit(address):
+    """Largest payload the route MTU to address allows, None if the kernel does not tell"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.connect(address)
+        mtu = probe.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return None
+    finally:
+        probe.close()
+    return mtu - IP_UDP_OVERHEAD - HEADER_SIZE
+
+
+def _try_size(sock, address, size, timeout):
+    """Send one PROBE of size payload bytes; True if the receiver echoed it in time"""
+    try:
+        sock.sendto(build_packet(config.message_type.PROBE, size, bytes(size)), address)
+    except OSError as e:
+        if e.errno == errno.EMSGSIZE:
+            return False  # Larger than the local interface allows
+        raise
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        sock.settimeout(remaining)
+        try:
+            pkt, _ = sock.recvfrom(2048)
+        except socket.timeout:
+            return False
+        parsed = verify_packet(pkt)
+        if parsed is not None and parsed[0] == config.message_type.PROBE and parsed[1] == size:
+            return True
+
+
+def probe(sock, address, limit=config.max_packet_size, timeout=config.pmtu_probe_timeout, tries=2):
+    """Largest payload size up to limit that reaches address (config.packet_size if none is echoed).
+
+    Uses sock, the socket the transfer will send from, and restores its
+    timeout and PMTU discovery mode afterwards.
+    """
+    route_limit = route_payload_limit(address)
+    hi = min(limit, route_limit) if route_limit else limit
+    lo = config.packet_size
+    if hi <= lo:
+        return hi
+    saved_timeout = sock.gettimeout()
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_PROBE)
+    except OSError:
+        pass
+    try:
+        def reaches(size):
+            return any(_try_size(sock, address, size, timeout) for _ in range(tries))
+
+        if reaches(hi):
+            return hi
+        if not reaches(lo):
+            return lo  # Nobody answers probes: keep the default
+        hi -= 1
+        while hi - lo >= GRANULARITY:
+            mid = (lo + hi) // 2
+            if reaches(mid):
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+    finally:
+        sock.settimeout(saved_timeout)
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_WANT)
+        except OSError:
+            pass
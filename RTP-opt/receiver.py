@@ -3,115 +3,54 @@ import socket
 import sys
 import time
 import config 
-from utils import PacketHeader, compute_checksum
+import integrity
+import stats as transport_stats
+import tracing
+from batch_io import BatchReceiver
+from session import Endpoint, Settings
+from utils import HEADER_SIZE
 
-# Global variables
-expected_seq = 0  # The next expected sequence number
-buffer = {}  # Buffer for out-of-order packets
-in_connection = False  # Flag to track if we're in an active connection
-is_running = True 
-last_ack_time = 0  # Time of last ACK sent
-ack_interval = 0.1  # Send ACK every 0.1 seconds to improve performance
-
-def send_ACK(sock, seq_num, addr):
-    """Send ACK with the given sequence number to the specified address"""
-    pkt_header = PacketHeader(type=config.message_type.ACK, seq_num=seq_num, length=0)
-    pkt_header.checksum = 0
-    checksum = compute_checksum(bytes(pkt_header))
-    pkt_header.checksum = checksum
-    sock.sendto(bytes(pkt_header), addr)
-    sys.stdout.flush()
-
-def receiver(receiver_ip, receiver_port, window_size):
-    global expected_seq, buffer, in_connection, is_running, last_ack_time
+def receiver(endpoint, receiver_ip, receiver_port, use_gro=True, idle_timeout=config.session_idle_timeout):
+    """Serve endpoint (session.Endpoint) on a blocking socket until it stops running"""
+    settings = endpoint.settings
+    reporter = endpoint.reporter
     
     # Create and bind socket
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     s.bind((receiver_ip, receiver_port))
+    # With GRO one recvmsg can return a whole burst of datagrams
+    batch_receiver = BatchReceiver(s, use_gro=use_gro, bufsize=HEADER_SIZE + settings.max_packet_size)
+    # Wake up regularly to flush ACKs held back by the policy and evict idle peers
+    s.settimeout(min(settings.ack_delay if settings.ack_every > 1 else 1.0, idle_timeout))
+    next_sweep = time.monotonic() + idle_timeout
+    counters = endpoint.socket_stats.counters
+    if reporter is not None:
+        reporter.start()
     sys.stdout.flush()
     
     try:
-        while is_running:
+        while endpoint.is_running:
             try:
-                pkt, address = s.recvfrom(2048)
-                
-                # Parse header
                 try:
-                    pkt_header = PacketHeader(pkt[:16])
-                except Exception as e:
-                    continue
-                
-                # Extract data based on length field
-                if pkt_header.length > 0 and len(pkt) >= 16 + pkt_header.length:
-                    msg = pkt[16:16 + pkt_header.length]
-                else:
-                    msg = b''  # Empty message for control packets
-                
-                # Validate checksum
-                received_checksum = pkt_header.checksum
-                pkt_header.checksum = 0
-                if pkt_header.length > 0:
-                    calculated_packet = bytes(pkt_header) + msg
-                else:
-                    calculated_packet = bytes(pkt_header)
+                    pkts, address = batch_receiver.recv()
+                except socket.timeout:
+                    pkts = ()
+                counters["datagrams"] = batch_receiver.packets
+                counters["syscalls"] = batch_receiver.syscalls
+                counters["socket_drops"] = batch_receiver.drops
                 
-                computed_checksum = compute_checksum(calculated_packet)
+                for pkt in pkts:
+                    endpoint.handle_packet(s, pkt, address)
+                    if not endpoint.is_running:
+                        break
                 
-                if received_checksum != computed_checksum:
-                    continue
-                
-                # Process different packet types
-                if pkt_header.type == config.message_type.DATA:
-                    seq_num = pkt_header.seq_num
-                    sys.stdout.flush()
-                    
-                    # Drop packets outside window
-                    if seq_num >= expected_seq + 2 * window_size:
-                        send_ACK(s, expected_seq, address)
-                        continue
-                    
-                    # Handle in-order packet
-                    if seq_num == expected_seq:
-                        print(msg.decode('utf-8'), end="")
-                        sys.stdout.flush()
-                        expected_seq += 1
-                        
-                        # Process buffered packets in order
-                        while expected_seq in buffer:
-                            print(buffer.pop(expected_seq).decode('utf-8'), end="")
-                            sys.stdout.flush()
-                            expected_seq += 1
-                        
-                        # Send ACK for the received packet after processing
-                        last_ack_time = time.monotonic()
-                        send_ACK(s, expected_seq, address)
-                    
-                    # Buffer out-of-order packet
-                    elif seq_num > expected_seq and seq_num < expected_seq + 2* window_size:
-                        buffer[seq_num] = msg
-                        send_ACK(s, seq_num + 1, address)
-                    
-                    # Duplicate packet or old packet
-                    elif seq_num < expected_seq:
-                        send_ACK(s, expected_seq, address)
-                
-                # Handle END message
-                elif pkt_header.type == config.message_type.END:
-                    send_ACK(s, pkt_header.seq_num + 1, address)
-                    sys.stdout.flush()
-                    is_running = False 
-                    buffer.clear()
-                    break
-                
-                elif pkt_header.type == config.message_type.START:
-                    expected_seq = pkt_header.seq_num + 1
-                    send_ACK(s, expected_seq, address)  
-                    sys.stdout.flush()
-
-                # Control ACK frequency to improve performance
-                if time.monotonic() - last_ack_time > ack_interval:
-                    send_ACK(s, expected_seq, address)
-                    last_ack_time = time.monotonic()
+                now = time.monotonic()
+                if settings.ack_every > 1:
+                    endpoint.flush_acks(s, now)
+                # Outside --serve the one transfer keeps its session however long its input pauses
+                if settings.serve and now >= next_sweep:
+                    endpoint.evict_idle(now, idle_timeout)
+                    next_sweep = now + min(idle_timeout, 1.0)
             
             except Exception as e:
                 sys.stdout.flush()
@@ -121,16 +60,52 @@ def receiver(receiver_ip, receiver_port, window_size):
     
     finally:
         s.close()
+        endpoint.close()
         sys.stdout.flush()
+        print(f"Received {batch_receiver.packets} datagrams in {batch_receiver.syscalls} syscalls (GRO {'on' if batch_receiver.use_gro else 'off'}), {batch_receiver.drops} dropped by the socket buffer", file=sys.stderr)
+        if reporter is not None:
+            reporter.stop()
+            counters["datagrams"] = batch_receiver.packets
+            counters["syscalls"] = batch_receiver.syscalls
+            counters["socket_drops"] = batch_receiver.drops
+            endpoint.socket_stats.finish()
+            reporter.emit([endpoint.socket_stats], final=True)
 
 def main():
     parser = argparse.ArgumentParser(description="Reliable UDP Receiver")
     parser.add_argument("recv_ip", type=str, help="Receiver host")
     parser.add_argument("recv_port", type=int, help="Receiver port")
     parser.add_argument("window_size", type=int, help="Window size")
+    parser.add_argument("--output", type=str, default=None, help="Write received data to this file instead of stdout")
+    parser.add_argument("--ack-every", type=int, default=config.ack_every, help="ACK every Nth in-order packet (gaps and reordering are always ACKed at once)")
+    parser.add_argument("--no-gro", action="store_true", help="Receive one datagram per syscall")
+    parser.add_argument("--ack-delay", type=float, default=config.ack_delay, help="Longest time (s) an in-order packet may wait for its ACK")
+    parser.add_argument("--serve", action="store_true", help="Keep running and accept concurrent transfers from any number of senders")
+    parser.add_argument("--output-dir", type=str, default=None, help="With --serve, write each transfer to its own file in this directory")
+    parser.add_argument("--idle-timeout", type=float, default=config.session_idle_timeout, help="With --serve, drop a sender's session after this many seconds of silence")
+    parser.add_argument("--checksums", type=str, default=",".join(integrity.ACCEPTED), help="Comma separated checksum algorithms senders may pick (others fall back to crc32); add off to allow unchecked transfers")
+    parser.add_argument("--max-packet-size", type=int, default=config.max_packet_size, help="Largest DATA payload to agree on at START (senders propose theirs)")
+    parser.add_argument("--no-compress", action="store_true", help="Refuse compressed frames (the sender then sends its input as is)")
+    parser.add_argument("--no-resume", action="store_true", help="Do not checkpoint transfers to <output>.resume or resume them (senders then start over)")
+    parser.add_argument("--no-fec", action="store_true", help="Refuse the parity packets a sender proposes (it falls back to retransmissions only)")
+    parser.add_argument("--trace-level", choices=sorted(tracing.LEVELS, key=tracing.LEVELS.get), default="off", help="Record events (drops, checksum failures...) or every packet")
+    parser.add_argument("--trace", type=str, default="receiver.trace", help="Binary trace file written at exit and on SIGUSR1 (decode with tracing.py)")
+    parser.add_argument("--trace-size", type=int, default=config.trace_events, help="Events kept in the trace ring")
+    parser.add_argument("--stats", type=str, default="-", help="Append JSON stats of every transfer (and the socket) to this file at exit (-: stderr)")
+    parser.add_argument("--stats-interval", type=float, default=0, help="Also report stats every this many seconds (0: only at exit)")
     args = parser.parse_args()
+    if args.serve and not args.output_dir:
+        parser.error("--serve needs --output-dir, concurrent transfers cannot share one output")
+    
+    settings = Settings(accepted_checksums=set(args.checksums.split(",")) | {integrity.DEFAULT}, accept_fec=not args.no_fec,
+                        accept_compression=not args.no_compress, accept_resume=not args.no_resume,
+                        max_packet_size=max(1, min(args.max_packet_size, config.max_packet_size)), ack_every=max(1, args.ack_every),
+                        ack_delay=args.ack_delay, serve=args.serve, output_dir=args.output_dir)
+    tracing.configure(args.trace_level, args.trace, args.trace_size)
+    endpoint = Endpoint(args.window_size, settings, output=args.output)
+    endpoint.reporter = transport_stats.Reporter(endpoint.all_stats, args.stats, args.stats_interval)
     
-    receiver(receiver_ip=args.recv_ip, receiver_port=args.recv_port, window_size=args.window_size)
+    receiver(endpoint, receiver_ip=args.recv_ip, receiver_port=args.recv_port, use_gro=not args.no_gro, idle_timeout=args.idle_timeout)
 
 if __name__ == "__main__":
     main()
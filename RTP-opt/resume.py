@@ -0,0 +1,130 @@
+"""Resumable transfers: content fingerprint and the receiver's checkpoint sidecar.
+
+A sender started with --resume adds OPT_RESUME to START: a transfer ID (the
+digest of a name, the input path by default) and a fingerprint of the
+content. A receiver writing to an --output file keeps a checkpoint next to
+it (<output>.resume) holding
+
+    CHECKPOINT header (magic, transfer ID, fingerprint, packet size,
+    cumulative ACK, ranges) + SACK_RANGE records of the packets held beyond it
+
+When a START with the same ID, fingerprint and a packet size the sender can
+use comes in, the receiver restores its reorder ring from the checkpoint,
+keeps the output file instead of truncating it and answers with the
+cumulative ACK and the lowest held ranges. The sender then starts at that
+sequence number and skips the held packets.
+
+Checkpoints are batched: one is written after config.checkpoint_packets
+delivered packets or config.checkpoint_interval seconds, whichever comes
+first, and when a session closes unfinished. The output is fdatasync()ed
+before each one and the sidecar replaced atomically, so a checkpoint never
+claims data that is not on disk. A finished transfer removes it.
+
+Only uncompressed transfers resume: a compressed frame is decoded from its
+first packet on, which an interrupted transfer may have lost.
+"""
+import hashlib
+import os
+import struct
+import time
+
+import config
+from utils import SACK_RANGE, decode_sack_ranges, encode_sack_ranges
+
+ID_SIZE = 16
+FINGERPRINT_SAMPLES = 64  # Inputs larger than FINGERPRINT_SAMPLES * SAMPLE_SIZE are sampled, not hashed whole
+SAMPLE_SIZE = 1 << 20
+CHECKPOINT = struct.Struct("!4sH16s16sHII")  # magic, version, transfer ID, fingerprint, packet size, cumulative ACK, ranges
+MAGIC = b"RTPR"
+VERSION = 1
+SUFFIX = ".resume"
+
+
+def transfer_id(name):
+    """Wire transfer ID of a transfer name"""
+    return hashlib.blake2b(name.encode(), digest_size=ID_SIZE).digest()
+
+
+def fingerprint(data):
+    """Digest of the input's size and content.
+
+    Inputs up to 64 MiB are hashed whole. Larger ones hash 64 evenly spaced
+    1 MiB samples (first and last included), so a multi-GB file costs
+    no more than a 64 MiB one: enough to tell a different or regrown file apart, not to
+    detect an in-place edit between the samples.
+    """
+    data = memoryview(data)
+    digest = hashlib.blake2b(struct.pack("!Q", len(data)), digest_size=ID_SIZE)
+    if len(data) <= FINGERPRINT_SAMPLES * SAMPLE_SIZE:
+        digest.update(data)
+    else:
+        step = (len(data) - SAMPLE_SIZE) // (FINGERPRINT_SAMPLES - 1)
+        for i in range(FINGERPRINT_SAMPLES):
+            digest.update(data[i * step:i * step + SAMPLE_SIZE])
+    return digest.digest()
+
+
+def sidecar_path(output, base_offset=0):
+    """Checkpoint file of an output file (one per stripe of a striped transfer)"""
+    return f"{output}.{base_offset}{SUFFIX}" if base_offset else output + SUFFIX
+
+
+class Checkpoint:
+    """The receiver's progress on one resumable transfer"""
+
+    def __init__(self, path, transfer, digest, packet_size, base=1, ranges=()):
+        self.path = path
+        self.transfer = transfer
+        self.digest = digest
+        self.packet_size = packet_size
+        self.base = base  # Cumulative ACK: every packet below it is on disk
+        self.ranges = list(ranges)  # [start, end) ranges held beyond base
+        self.resumed_from = None  # base of the checkpoint this transfer was resumed from
+        self.delivered = base  # expected_seq when the checkpoint was last written
+        self.written_at = time.monotonic()
+        self.written = 0
+
+    @classmethod
+    def load(cls, path):
+        """The checkpoint stored at path, None if there is none or it is unreadable"""
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            magic, version, transfer, digest, packet_size, base, count = CHECKPOINT.unpack_from(blob)
+        except (OSError, struct.error):
+            return None
+        if magic != MAGIC or version != VERSION or len(blob) < CHECKPOINT.size + count * SACK_RANGE.size:
+            return None
+        return cls(path, transfer, digest, packet_size, base, decode_sack_ranges(blob[CHECKPOINT.size:CHECKPOINT.size + count * SACK_RANGE.size]))
+
+    def matches(self, transfer, digest, packet_size):
+        """Same transfer and content, in packets the sender can send"""
+        return self.transfer == transfer and self.digest == digest and self.packet_size <= packet_size
+
+    def due(self, expected_seq, now):
+        """Enough progress since the last checkpoint to write another"""
+        return expected_seq - self.delivered >= config.checkpoint_packets or (
+            expected_seq != self.delivered and now - self.written_at >= config.checkpoint_interval)
+
+    def save(self, out_fd, base, ranges, now):
+        """Flush the output, then atomically replace the sidecar with base and ranges"""
+        os.fdatasync(out_fd)
+        self.base, self.ranges = base, list(ranges)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(CHECKPOINT.pack(MAGIC, VERSION, self.transfer, self.digest, self.packet_size, base, len(self.ranges)))
+            f.write(encode_sack_ranges(self.ranges))
+        os.replace(tmp, self.path)
+        self.delivered = base
+        self.written_at = now
+        self.written += 1
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __str__(self):
+        resumed = "" if self.resumed_from is None else f", resumed at packet {self.resumed_from}"
+        return f"{self.written} checkpoints{resumed}"
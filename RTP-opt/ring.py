@@ -0,0 +1,199 @@
+"""Fixed-size rings indexed by seq % capacity for the sender window and the
+receiver reorder buffer.
+
+Capacities are rounded up to a power of two so the slot of seq is
+seq & mask. Everything is allocated once: the rings never hash, never grow
+and create no per-packet objects, and sliding the base is amortised O(1)
+because each sequence number is passed over exactly once.
+
+Memory per slot (64-bit CPython 3.11):
+
+    SendWindow      8 B list pointer + 56 B Slot (__slots__, reused) + 1 B flag
+                    = 65 B, plus the 24 B float of the current send time.
+                    The payload is a view into the input and is not copied.
+    ReorderBuffer   8 B list pointer + 1 B flag = 9 B, plus a copy of the
+                    payload when writing to stdout (file output writes it
+                    straight to its offset and keeps only the flag).
+
+The dict based window this replaces cost roughly 30 B per entry in each of
+`window` and `time_stamps` plus a 28 B int key and a float, all allocated
+and freed for every packet.
+"""
+
+
+def _capacity(size):
+    """Smallest power of two >= size"""
+    return 1 << max(0, size - 1).bit_length()
+
+
+class Slot:
+    """One in-flight packet of the sender"""
+
+    __slots__ = ("payload", "sent_at", "retransmitted")
+
+    def __init__(self):
+        self.payload = None  # View into the input (b"" for END)
+        self.sent_at = 0.0  # Time of the latest transmission
+        self.retransmitted = False  # Sent more than once: no RTT sample (Karn's rule)
+
+
+class SendWindow:
+    """Unacknowledged packets of the sender between base and end.
+
+    Holds at most `size` consecutive sequence numbers; `inflight` is a byte
+    map (one byte per slot, so bytearray.find can scan it) of the slots that
+    still wait for an ACK. Selectively acknowledged packets leave holes that
+    are skipped once the base reaches them.
+    """
+
+    def __init__(self, size, base=1):
+        self.size = size
+        self.capacity = _capacity(size)
+        self.mask = self.capacity - 1
+        self.slots = [Slot() for _ in range(self.capacity)]
+        self.inflight = bytearray(self.capacity)
+        self.base = base  # Oldest sequence number that may be unacknowledged
+        self.end = base  # Next sequence number to add
+        self.count = 0  # Unacknowledged packets
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, seq):
+        return self.base <= seq < self.end and self.inflight[seq & self.mask] == 1
+
+    def __getitem__(self, seq):
+        if seq not in self:
+            raise KeyError(seq)
+        return self.slots[seq & self.mask]
+
+    def free(self):
+        """New packets that fit before the base has to move"""
+        return self.size - (self.end - self.base)
+
+    def add(self, seq, payload, now):
+        """Append packet seq (must be end) sent at now; returns its slot"""
+        if seq != self.end or self.end - self.base >= self.size:
+            raise IndexError(f"seq {seq} does not fit in window [{self.base}, {self.base + self.size})")
+        index = seq & self.mask
+        slot = self.slots[index]
+        slot.payload = payload
+        slot.sent_at = now
+        slot.retransmitted = False
+        self.inflight[index] = 1
+        self.end += 1
+        self.count += 1
+        return slot
+
+    def ack(self, seq):
+        """Mark seq acknowledged. Returns its slot, or None if it was not in flight.
+
+        The slot's fields stay readable until the next add() reuses it.
+        """
+        if seq not in self:
+            return None
+        index = seq & self.mask
+        self.inflight[index] = 0
+        self.count -= 1
+        slot = self.slots[index]
+        slot.payload = None
+        if seq == self.base:
+            self._advance()
+        return slot
+
+    def _advance(self):
+        """Move base up to the oldest packet still in flight (or end)"""
+        if self.count == 0:
+            self.base = self.end
+            return
+        head = self.base & self.mask
+        pos = self.inflight.find(1, head)
+        if pos < 0:
+            pos = self.inflight.find(1, 0, head) + self.capacity
+        self.base += pos - head
+
+
+class ReorderBuffer:
+    """Receiver side ring of packets that arrived ahead of base.
+
+    base is the next in-order sequence number (the cumulative ACK). Packets in
+    [base, base + capacity) can be held; `present` is the byte map of the held
+    ones. With keep_payload=False only the flags are kept, for receivers that
+    write payloads to their final file offset on arrival.
+    """
+
+    def __init__(self, size, base=1, keep_payload=True):
+        self.capacity = _capacity(size)
+        self.mask = self.capacity - 1
+        self.present = bytearray(self.capacity)
+        self.payloads = [None] * self.capacity if keep_payload else None
+        self.base = base
+        self.held = 0  # Packets stored beyond base
+
+    def __contains__(self, seq):
+        return self.base <= seq < self.base + self.capacity and self.present[seq & self.mask] == 1
+
+    def put(self, seq, payload=None):
+        """Hold packet seq; False if it is a duplicate or outside the ring"""
+        if not self.base <= seq < self.base + self.capacity:
+            return False
+        index = seq & self.mask
+        if self.present[index]:
+            return False
+        self.present[index] = 1
+        if self.payloads is not None:
+            self.payloads[index] = payload
+        self.held += 1
+        return True
+
+    def skip(self):
+        """Consume base itself (delivered directly, never stored)"""
+        self.base += 1
+
+    def pop_ready(self):
+        """Remove and return the held payloads that are now in order (None each without payloads)"""
+        ready = []
+        present = self.present
+        payloads = self.payloads
+        while self.held and present[self.base & self.mask]:
+            index = self.base & self.mask
+            present[index] = 0
+            if payloads is not None:
+                ready.append(payloads[index])
+                payloads[index] = None
+            else:
+                ready.append(None)
+            self.held -= 1
+            self.base += 1
+        return ready
+
+    def _find(self, value, rel):
+        """Offset from base of the first slot at or after base + rel whose flag is value, or -1"""
+        present = self.present
+        head = self.base & self.mask
+        index = (head + rel) & self.mask
+        if rel >= self.capacity:
+            return -1
+        if index >= head:
+            pos = present.find(value, index)
+            if pos >= 0:
+                return pos - head
+            pos = present.find(value, 0, head)
+        else:
+            pos = present.find(value, index, head)
+        return pos + self.capacity - head if pos >= 0 else -1
+
+    def ranges(self, limit):
+        """At most limit [start, end) ranges of held packets, lowest first"""
+        ranges = []
+        rel = 1
+        while self.held and len(ranges) < limit:
+            start = self._find(1, rel)
+            if start < 0:
+                break
+            end = self._find(0, start)
+            if end < 0:
+                end = self.capacity
+            ranges.append((self.base + start, self.base + end))
+            rel = end
+        return ranges
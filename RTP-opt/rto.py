@@ -0,0 +1,45 @@
+class RTOEstimator:
+    """Retransmission timeout computed from measured round-trip times.
+
+    Follows Jacobson/Karels as specified in RFC 6298: a smoothed RTT (srtt) and
+    its mean deviation (rttvar) are updated from every valid ACK sample and
+    rto = srtt + max(granularity, 4 * rttvar), clamped to [min_rto, max_rto].
+    Callers must not feed samples from retransmitted packets (Karn's rule).
+    Each timeout doubles rto until the next valid sample.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial=0.5, min_rto=0.05, max_rto=10.0, granularity=0.001):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.granularity = granularity
+        self.srtt = None
+        self.rttvar = None
+        self.rto = self._clamp(initial)
+        self.backoffs = 0  # Consecutive timeouts since the last valid sample
+
+    def _clamp(self, value):
+        return min(self.max_rto, max(self.min_rto, value))
+
+    def sample(self, rtt):
+        """Update the estimate with one RTT measurement (seconds)"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        self.rto = self._clamp(self.srtt + max(self.granularity, self.K * self.rttvar))
+        self.backoffs = 0
+
+    def backoff(self):
+        """Exponential backoff after a retransmission timeout"""
+        self.rto = self._clamp(self.rto * 2)
+        self.backoffs += 1
+
+    def __repr__(self):
+        srtt = "-" if self.srtt is None else f"{self.srtt * 1000:.1f}ms"
+        return f"RTO {self.rto * 1000:.1f}ms (srtt {srtt}, backoffs {self.backoffs})"
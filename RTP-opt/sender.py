@@ -1,304 +1,338 @@
 import argparse
+import os
 import socket
 import threading
 import time
+import compress
 import config
+import fec
+import integrity
+import pmtu
+import stats as transport_stats
 import sys
-from utils import PacketHeader, compute_checksum
-
-# Global variables
-base = 0  # Base of the sliding window
-seq_num = 0  # Sequence number for packets
-window = {}  # Store unacknowledged packets
-lock = threading.Lock()
-s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-timer = None  # Timer for retransmission
-time_stamps = {} # Store timestamp for each packet 
-is_running = True  # Flag to control thread execution
-end_received = False  # Flag to track if END ACK was received
-timeout = 0.5
-ws = 0
-num_packet = 0
-
-def check_timeout(recv_ip, recv_port):
-    global is_running, timeout
-    while is_running:
-        current_time = time.monotonic()
-        with lock:
-            for seq, send_time in list(time_stamps.items()):
-                if current_time - send_time > timeout: 
-                    if seq in window: 
-                        print(f"Timeout! Retransmitting packet {seq}")
-                        sys.stdout.flush()
-                        s.sendto(window[seq], (recv_ip,recv_port))
-                        time_stamps[seq] = time.monotonic()  
-        time.sleep(0.05)  
-
-def receive_ACK():
-    global base, timer, is_running, end_received, ws, num_packet
-    
-    while is_running:
-        try:
-            pkt, _ = s.recvfrom(2048)
-            
-            if not is_running:
-                break
-                
-            ack_header = PacketHeader(pkt[:16])
-            
-            # Check if it's an ACK packet
-            if ack_header.type != config.message_type.ACK:
-                continue
-                
-            ack_num = ack_header.seq_num
-            print(f"Received ACK: {ack_num}")
-            sys.stdout.flush()
-            
-            with lock:
-                if ack_num >= base:
-                    #Delete packet [ack_num] in window 
-                    window.pop (ack_num-1,None)
-                    time_stamps.pop(ack_num-1,None)
-                    ws = max (0, ws - 1)
-                    #Plus base to slide window
-                    while base not in window and base < seq_num:     
-                        base += 1 
-
-                    # Handle END message acknowledgment
-                    if num_packet + 2 == ack_num:
-                        print (f"seq num of END message :{ack_num}")
-                        print("All packets including END message acknowledged")
+import tracing
+from batch_io import BatchSender
+from congestion import CONTROLLERS
+from pacing import TokenBucket
+from transfer import Transfer
+from utils import HEADER_SIZE, open_input
+
+timeout = 0.5  # Socket, START and END waits; retransmissions use the transfer's RTO
+PACING_GAIN = 1.25  # Auto pacing runs slightly above cwnd / srtt so the window stays full
+
+class Sender:
+    """Threads driving one Transfer (transfer.py) over a socket of its own.
+
+    The caller's thread runs the send loop, receive_ACK reads what the
+    receiver answers and check_timeout fires retransmissions. Every call into
+    the Transfer holds lock; nothing is module-global, so one process can run
+    several transfers at once.
+    """
+
+    def __init__(self, recv_ip, recv_port, data, window_size, use_gso=True, pace_rate=0, pace_auto=False, pmtu_limit=None, **options):
+        self.address = (recv_ip, recv_port)
+        self.s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.batch_sender = BatchSender(self.s, use_gso=use_gso)  # New DATA goes out in GSO batches when the kernel supports it
+        self.lock = threading.Lock()
+        self.timer_cond = threading.Condition(self.lock)  # Wakes check_timeout when an earlier deadline is armed
+        self.window_open = threading.Condition(self.lock)  # Wakes the send loop when ACKs free window space
+        # TokenBucket spreading new DATA packets, None sends as fast as the window allows
+        self.pacer = TokenBucket(pace_rate) if pace_rate > 0 or pace_auto else None
+        self.pace_auto = pace_auto  # Derive the pacing rate from cwnd / srtt
+        self.pmtu_limit = pmtu_limit  # Probe the path for payloads up to this size before START
+        self.transfer = Transfer(self.send, data, window_size, send_batch=self.send_batch, **options)
+
+    def send(self, packet):
+        self.s.sendto(packet, self.address)
+
+    def send_batch(self, packets):
+        self.batch_sender.send(packets, self.address)
+
+    def check_timeout(self):
+        transfer = self.transfer
+        with self.timer_cond:
+            while transfer.is_running:
+                transfer.expire(time.monotonic())
+                # Sleep until the next deadline (the lock is released while waiting)
+                next_deadline = transfer.next_deadline()
+                self.timer_cond.wait(None if next_deadline is None else next_deadline - time.monotonic())
+
+    def receive_ACK(self):
+        transfer = self.transfer
+        while transfer.is_running:
+            try:
+                pkt, _ = self.s.recvfrom(2048)
+
+                if not transfer.is_running:
+                    break
+
+                with self.lock:
+                    if transfer.on_packet(pkt, time.monotonic()):
+                        self.window_open.notify()
+                    if not transfer.is_running:
+                        # END acknowledged, or the receiver reset the transfer
                         sys.stdout.flush()
-                        end_received = True
-                        is_running = False
-                        if timer:
-                            timer.cancel()
+                        self.timer_cond.notify_all()
+                        self.window_open.notify_all()
                         break
-        
-        except socket.timeout:
-            continue
-        except Exception as e:
-            print(f"Error in receive_ACK: {e}")
-            sys.stdout.flush()
-            
-    print("ACK receiver thread exiting")
-    sys.stdout.flush()
 
-def send_packet(recv_ip, recv_port, data, seq):
-    global window
-    pkt_header = PacketHeader(type=config.message_type.DATA, seq_num=seq, length=len(data))
-    
-    # Set checksum to 0 before calculating
-    pkt_header.checksum = 0
-    
-    # Create full packet and compute checksum
-    full_packet = bytes(pkt_header) + data
-    checksum = compute_checksum(full_packet)
-    
-    # Update header with checksum
-    pkt_header.checksum = checksum
-    
-    # Construct final packet
-    packet = bytes(pkt_header) + data
-    
-    with lock:
-        s.sendto(packet, (recv_ip, recv_port))
-        print(f"Sent packet {seq}")
+            except socket.timeout:
+                continue
+            except Exception as e:
+                print(f"Error in receive_ACK: {e}")
+                sys.stdout.flush()
+
+        print("ACK receiver thread exiting")
         sys.stdout.flush()
-        window[seq] = packet
-        time_stamps[seq] = time.monotonic() 
-
-def send_data(recv_ip , recv_port ,data, window_size):
-    global seq_num, base, is_running,ws, timeout, num_packet
-    
-    s.settimeout(timeout)
-    # Convert string to bytes if needed
-    if isinstance(data, str):
-        data = data.encode('utf-8')
-    
-    # Send start message
-    send_start_message(recv_ip=recv_ip,recv_port= recv_port)
-    if not wait_for_start_ack(recv_ip=recv_ip,recv_port=recv_port):
-        print ("Can't send START message to start send data")
-        return
-    sys.stdout.flush()
 
-    # Split data into chunks
-    chunks = []
-    for i in range(0, len(data), config.packet_size):
-        chunks.append(data[i:min(i + config.packet_size, len(data))])
-    
-    print(f"Message split into {len(chunks)} chunks")
-    sys.stdout.flush()
-    num_packet = len (chunks)
-    
-    #Because socket buffer would be store old packet, we need waiting socket clear buffer
-    flush_socket_buffer()
-
-    # Start the ACK receiver thread
-    ack_thread = threading.Thread(target=receive_ACK, daemon=True)
-    ack_thread.start()
-
-    #Start the check_timeout thread 
-    check_time_out = threading.Thread (target=check_timeout,args=(recv_ip,recv_port),daemon=True)
-    check_time_out.start()
-
-
-    # Send all chunks using sliding window
-    while base <= len(chunks) and is_running:
-        # Send as many packets as window size allows
-        while ws < window_size and seq_num <= len(chunks):
-            send_packet(recv_ip, recv_port, chunks[seq_num-1], seq_num)
-            seq_num += 1
-            ws += 1
-        
-        # Small delay to prevent CPU hogging
-        time.sleep(0.01)
-    
-    print ("Sending data is done !!!")
-    # Wait until all packets are acknowledged
-    while base <= len(chunks) and is_running:
-        print(f"Waiting for acknowledgments... base={base}, seq_num={seq_num}")
+    def send_packets(self, chunks):
+        """Send consecutive new DATA packets starting at seq_num in one batch"""
+        # Checksums and parity are computed before taking the lock
+        packets, parity = self.transfer.encode(chunks)
+        with self.lock:
+            if self.transfer.send_new(chunks, packets, parity, time.monotonic()):
+                self.timer_cond.notify()
+
+    def run(self):
+        """Send the whole input and END; returns the Transfer (transfer.complete() tells if it was delivered)"""
+        transfer = self.transfer
+        self.s.settimeout(timeout)
+        if self.pmtu_limit:
+            transfer.max_packet_size = pmtu.probe(self.s, self.address, self.pmtu_limit)
+            print(f"Path MTU probe: {transfer.max_packet_size}-byte payloads fit")
+
+        # Send start message
+        self.send_start_message()
+        if not self.wait_for_start_ack():
+            print ("Can't send START message to start send data")
+            self.s.close()
+            return transfer
         sys.stdout.flush()
-        time.sleep(0.1)
-    
-    if is_running:
-        # Send END message
-        print ("Send end message ...")
-        send_end_message(recv_ip,recv_port) 
-        
-        # Wait for END acknowledgment or timeout
-        end_wait_start = time.time()
-        while is_running and not end_received and (time.time() - end_wait_start) < timeout:
-            time.sleep(0.05)
-        
-        # Close everything
-        is_running = False
-        if timer:
-            timer.cancel()
-    
-    # Give ACK thread time to exit
-    ack_thread.join(0.5)
-    
-    # Close socket
-    s.close()
-    print("Sender terminated")
-    sys.stdout.flush()
 
-def flush_socket_buffer():
-    s.setblocking(False)
-    try:
-        while True:
-            try:
-                s.recvfrom(2048)
-            except BlockingIOError:
-                break  
-    finally:
-        s.setblocking(True)  
-
-# def wait_for_empty_buffer():
-#     try:
-#         while True:
-#             pkt, _ = s.recvfrom(2048) 
-#             header = PacketHeader(pkt[:16])
-#             if header.type == config.message_type.ACK:
-#                 continue
-#     except socket.timeout:
-#         pass 
-
-def send_start_message(recv_ip, recv_port):
-    start_header = PacketHeader(
-        type=config.message_type.START,
-        seq_num=0,
-        length=0,
-        checksum=0
-    )
-    
-    packet = bytes(start_header)
-    start_header.checksum = compute_checksum(packet)
-    packet = bytes(start_header)
-    
-    s.sendto(packet, (recv_ip,recv_port))
-    print("Sent START message")
-    sys.stdout.flush()
+        transfer.begin()
+        chunks = transfer.payloads()
+        # Input that can stall (a pipe) tells whether its next payload is already there
+        chunks_ready = getattr(chunks, "ready", None)
 
-def wait_for_start_ack(recv_ip, recv_port):
-    global is_running, base, seq_num
-    last_send_time = 0
-    start_time = time.time()
+        #Because socket buffer would be store old packet, we need waiting socket clear buffer
+        self.flush_socket_buffer()
 
-    print("Waiting for START ACK...")
-    sys.stdout.flush()
+        # Start the ACK receiver thread
+        ack_thread = threading.Thread(target=self.receive_ACK, daemon=True)
+        ack_thread.start()
+
+        #Start the check_timeout thread
+        check_time_out = threading.Thread(target=self.check_timeout, daemon=True)
+        check_time_out.start()
+
+        pacer = self.pacer
+        # Send all chunks using sliding window; num_packet grows until the input hits EOF
+        eof = False
+        while (not eof or not transfer.all_acked()) and transfer.is_running:
+            # Send as many packets as the congestion window (capped by window size) allows
+            while not eof:
+                batch = []
+                room = min(transfer.room(), self.batch_sender.max_batch(HEADER_SIZE + transfer.packet_size))
+                if room <= 0:
+                    break
+                if pacer is not None:
+                    if self.pace_auto and transfer.rto_estimator.srtt:
+                        pacer.set_rate(PACING_GAIN * transfer.congestion.window() / transfer.rto_estimator.srtt)
+                    room = min(room, pacer.available())
+                while len(batch) < room:
+                    if batch and chunks_ready is not None and not chunks_ready():
+                        break  # Send what the input had so far rather than wait to fill the batch
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        eof = True
+                        break
+                    batch.append(chunk)
+                if batch:
+                    if pacer is not None:
+                        wait = pacer.reserve(len(batch))
+                        if wait > 0:
+                            time.sleep(wait)
+                    self.send_packets(batch)
+                transfer.input_done = eof
+
+            # Sleep until ACKs open the window (or all data is acknowledged)
+            with self.window_open:
+                if transfer.is_running and (eof or transfer.room() <= 0):
+                    self.window_open.wait(0.1)
 
-    while is_running:
-        current_time = time.time()
-        
-        # if time is greater than 10 second, (receiver can be turn off, we need to stop sender)
-        if current_time - start_time > 10: 
+        print(f"Message split into {transfer.num_packet} chunks")
+        print ("Sending data is done !!!")
+        # Wait until all packets are acknowledged
+        while not transfer.all_acked() and transfer.is_running:
+            print(f"Waiting for acknowledgments... base={transfer.base}, seq_num={transfer.seq_num}")
             sys.stdout.flush()
-            break
-        
-        if current_time - last_send_time > timeout:
-            send_start_message(recv_ip=recv_ip, recv_port=recv_port)
-            last_send_time = current_time
-        
+            time.sleep(0.1)
+
+        if transfer.is_running:
+            # Send END message
+            print ("Send end message ...")
+            self.send_end_message()
+
+            # Wait for END acknowledgment or timeout
+            end_wait_start = time.time()
+            while transfer.is_running and not transfer.end_received and (time.time() - end_wait_start) < timeout:
+                time.sleep(0.05)
+            if not transfer.end_received:
+                # A receiver without --serve exits right after ACKing END, so that ACK has no retransmission
+                print("No ACK for END, but the receiver had acknowledged every packet")
+
+        # Close everything
+        with self.lock:
+            transfer.finish()
+            self.timer_cond.notify_all()
+            self.window_open.notify_all()
+
+        # Give ACK thread time to exit
+        ack_thread.join(0.5)
+
+        # Close socket
+        self.s.close()
+        transfer.report()
+        print(f"Sent {self.batch_sender.packets} DATA packets in {self.batch_sender.syscalls} syscalls (GSO {'on' if self.batch_sender.use_gso else 'off'}), {self.batch_sender.drops} dropped by the socket buffer")
+        if pacer is not None:
+            print(pacer)
+        print("Sender terminated")
+        sys.stdout.flush()
+        return transfer
+
+    def flush_socket_buffer(self):
+        self.s.setblocking(False)
         try:
-            pkt, addr = s.recvfrom(2048)
-            header = PacketHeader(pkt[:16])
-            if header.type == config.message_type.ACK and header.seq_num == 1:
-                print("Received START ACK. Proceeding to data transmission.")
+            while True:
+                try:
+                    self.s.recvfrom(2048)
+                except BlockingIOError:
+                    break
+        finally:
+            self.s.setblocking(True)
+
+    def send_start_message(self):
+        self.send(self.transfer.start_packet())
+        print("Sent START message")
+        sys.stdout.flush()
+
+    def wait_for_start_ack(self):
+        last_send_time = 0
+        start_time = time.time()
+
+        print("Waiting for START ACK...")
+        sys.stdout.flush()
+
+        while self.transfer.is_running:
+            current_time = time.time()
+
+            # if time is greater than 10 second, (receiver can be turn off, we need to stop sender)
+            if current_time - start_time > 10:
                 sys.stdout.flush()
-                seq_num = 1
-                base = 1
-                return True
-        except socket.timeout:
-            continue
-        except Exception as e:
-            print(f"Error in wait_for_start_ack: {e}")
-            sys.stdout.flush()
+                break
 
-    return False
+            if current_time - last_send_time > timeout:
+                self.send_start_message()
+                last_send_time = current_time
 
-def send_end_message(recv_ip, recv_port):
-    global timer, seq_num
-    
-    print("Sending END message")
-    sys.stdout.flush()
-    
-    # Create END packet
-    end_header = PacketHeader(type=config.message_type.END, seq_num=seq_num, length=0)
-    end_header.checksum = 0
-    
-    # Compute checksum for END packet
-    packet = bytes(end_header)
-    checksum = compute_checksum(packet)
-    
-    # Update header with checksum
-    end_header.checksum = checksum
-    end_packet = bytes(end_header)
-    
-    # Send END packet and store it in window
-    with lock:
-        s.sendto(end_packet, (recv_ip, recv_port))
-        window[seq_num] = end_packet
-        print(f"Sent END message with seq_num {seq_num}")
+            try:
+                pkt, addr = self.s.recvfrom(2048)
+                if self.transfer.accept_start(pkt):
+                    print("Received START ACK. Proceeding to data transmission.")
+                    sys.stdout.flush()
+                    return True
+            except socket.timeout:
+                continue
+            except Exception as e:
+                print(f"Error in wait_for_start_ack: {e}")
+                sys.stdout.flush()
+
+        return False
+
+    def send_end_message(self):
+        print("Sending END message")
+        sys.stdout.flush()
+
+        # Send END packet and store it in window
+        with self.lock:
+            if self.transfer.send_end(time.monotonic()):
+                self.timer_cond.notify()
+        print(f"Sent END message with seq_num {self.transfer.seq_num - 1}")
         sys.stdout.flush()
-        time_stamps[seq_num] = time.monotonic() 
-        # Increment sequence number
-        seq_num += 1
+
+def send_data(recv_ip, recv_port, data, window_size, cc="none", **options):
+    """Send data to the receiver from a socket of its own; returns the finished Transfer.
+
+    options are those of Sender (use_gso, pacing, pmtu_limit) and Transfer (checksum, FEC, compression, resume...).
+    """
+    return Sender(recv_ip, recv_port, data, window_size, cc=cc, **options).run()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Reliable UDP Sender")
     parser.add_argument("recv_ip", type=str, help="Receiver host")
     parser.add_argument("recv_port", type=int, help="Receiver port")
     parser.add_argument("window_size", type=int, help="Window size")
+    parser.add_argument("--file", type=str, default=None, help="Send this file (memory-mapped) instead of stdin")
+    parser.add_argument("--rto-min", type=float, default=config.rto_min, help="Lower bound of the retransmission timeout (s)")
+    parser.add_argument("--rto-max", type=float, default=config.rto_max, help="Upper bound of the retransmission timeout (s)")
+    parser.add_argument("--dupack-threshold", type=int, default=config.dupack_threshold, help="Duplicate ACKs that trigger a fast retransmit")
+    parser.add_argument("--no-gso", action="store_true", help="Send every packet with its own sendto")
+    parser.add_argument("--pace-rate", type=float, default=0, help="Pace new DATA at this many packets/s (0: no pacing)")
+    parser.add_argument("--pace-auto", action="store_true", help="Pace at cwnd / srtt instead of a fixed rate")
+    parser.add_argument("--cc", choices=sorted(CONTROLLERS), default="none", help="Congestion control (none: fixed window_size)")
+    parser.add_argument("--checksum", choices=sorted(integrity.ALGORITHMS), default=integrity.DEFAULT, help="Checksum to propose at START (off: trusted paths only)")
+    parser.add_argument("--packet-size", type=int, default=None, help=f"Largest DATA payload to propose at START (default {config.packet_size}, "
+                        f"with --pmtu-probe the largest to probe, up to {config.max_packet_size})")
+    parser.add_argument("--pmtu-probe", action="store_true", help="Find the largest unfragmented payload to the receiver before START")
+    parser.add_argument("--fec", choices=["off"] + sorted(fec.SCHEMES), default="off", help="Send parity packets per block (xor: one, rs: --fec-parity) if the receiver accepts")
+    parser.add_argument("--fec-block", type=int, default=config.fec_block, help="DATA packets per FEC block (k)")
+    parser.add_argument("--fec-parity", type=int, default=config.fec_parity, help="Parity packets per block with --fec rs (m); redundancy is m / k")
+    parser.add_argument("--compress", choices=["off"] + sorted(compress.METHODS), default="off", help="Compress the input in independent frames if the receiver accepts")
+    parser.add_argument("--compress-level", type=int, default=None, help="zlib level / lzma preset (default: zlib 6, lzma 0)")
+    parser.add_argument("--resume", nargs="?", const="", default=None, metavar="ID",
+                        help="Resume where an interrupted transfer of this input to the same receiver output stopped (ID defaults to the --file path)")
+    parser.add_argument("--trace-level", choices=sorted(tracing.LEVELS, key=tracing.LEVELS.get), default="off", help="Record events (retransmits, timeouts...) or every packet")
+    parser.add_argument("--trace", type=str, default="sender.trace", help="Binary trace file written at exit and on SIGUSR1 (decode with tracing.py)")
+    parser.add_argument("--trace-size", type=int, default=config.trace_events, help="Events kept in the trace ring")
+    parser.add_argument("--stats", type=str, default="-", help="Append JSON stats to this file at exit (-: stderr)")
+    parser.add_argument("--stats-interval", type=float, default=0, help="Also report stats every this many seconds (0: only at exit)")
     args = parser.parse_args()
-    
+    if args.packet_size is not None and not 1 <= args.packet_size <= config.max_packet_size:
+        parser.error(f"--packet-size must be between 1 and {config.max_packet_size}")
+    options = dict(cc=args.cc, checksum=args.checksum, rto_min=args.rto_min, rto_max=args.rto_max, dupack_threshold=args.dupack_threshold,
+                   use_gso=not args.no_gso, pace_rate=args.pace_rate, pace_auto=args.pace_auto)
+    if args.pmtu_probe:
+        options["pmtu_limit"] = args.packet_size or config.max_packet_size
+    elif args.packet_size:
+        options["max_packet_size"] = args.packet_size
+    if args.fec != "off":
+        fec_parity = 1 if args.fec == "xor" else args.fec_parity
+        if not fec.valid(args.fec, args.fec_block, fec_parity):
+            parser.error("FEC needs k >= 1, m >= 1 and k + m <= 256")
+        options.update(fec_scheme=args.fec, fec_block=args.fec_block, fec_parity=fec_parity)
+    if args.resume is not None and args.compress != "off":
+        parser.error("--resume needs uncompressed DATA (drop --compress)")
+    if args.compress != "off":
+        options.update(compress_method=args.compress, compress_level=args.compress_level)
+    tracing.configure(args.trace_level, args.trace, args.trace_size)
+
     # Print config information
     print(f"Starting sender with window size: {args.window_size}")
     print(f"Receiver IP: {args.recv_ip}, Port: {args.recv_port}")
-    message = sys.stdin.read()
+    message = open_input(args.file)
+    if args.resume is not None:
+        if not isinstance(message, memoryview):
+            parser.error("--resume needs a regular file input (--file, or stdin redirected from one)")
+        options["resume_id"] = args.resume or (os.path.abspath(args.file) if args.file else "stdin")
     sys.stdout.flush()
-    
+
+    sender = Sender(args.recv_ip, args.recv_port, message, args.window_size, **options)
+    reporter = transport_stats.Reporter(lambda: [sender.transfer.stats], args.stats, args.stats_interval).start()
+
     # Send data with specified window size
-    send_data(args.recv_ip, args.recv_port, message, args.window_size)
\ No newline at end of file
+    transfer = sender.run()
+    reporter.stop()
+    transfer.stats.finish()
+    reporter.emit(final=True)
+    # Delivered once every DATA packet is acknowledged, whether or not the END ACK made it back
+    sys.exit(0 if transfer.complete() else 1)
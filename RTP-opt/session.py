@@ -0,0 +1,469 @@
+"""Receiving side: the sessions of every peer sending to one socket.
+
+An Endpoint takes each datagram that arrives on a receiver socket, with the
+socket to answer on (anything with sendto(packet, address): a socket or an
+asyncio transport), and hands it to the Session of the sender's address,
+opening one on START. A Session holds the state of one inbound transfer: the
+options agreed at START, the reorder ring, the ACK policy, FEC repair,
+decompression and the resume checkpoint. Neither reads a socket nor keeps
+module-global state; receiver.py drives an Endpoint from a blocking socket,
+async_transport.py from an asyncio event loop.
+"""
+import os
+import sys
+import time
+
+import compress
+import config
+import fec
+import integrity
+import resume
+import stats as transport_stats
+import tracing
+from ack_policy import AckPolicy
+from ring import ReorderBuffer
+from utils import (FEATURE_COMPRESS, FEATURE_FEC, FEATURE_PROBE, FEATURE_RESUME, FEATURE_SACK, FEATURES, FEC_PARAMS, HEADER_SIZE, OPT_CHECKSUM,
+                   OPT_COMPRESS, OPT_FEATURES, OPT_FEC, OPT_PACKET_SIZE, OPT_RESUME, OPT_STRIPE_OFFSET, OPT_WINDOW, PACKET_SIZE, RESET_FAILED,
+                   RESET_REASON, RESET_UNKNOWN, RESUME, RESUME_BASE, RESUME_MAX_RANGES, SACK_RANGE, STRIPE_OFFSET, WINDOW, build_packet, decode_header,
+                   decode_options, encode_options, encode_sack_ranges, verify_packet)
+
+
+class Settings:
+    """What a receiver agrees to at START and how it acknowledges, shared by all its sessions"""
+
+    def __init__(self, accepted_checksums=integrity.ACCEPTED, accept_fec=True, accept_compression=True, accept_resume=True,
+                 max_packet_size=config.max_packet_size, ack_every=config.ack_every, ack_delay=config.ack_delay, ack_interval=0.1,
+                 serve=False, output_dir=None, truncate_output=True):
+        self.accepted_checksums = set(accepted_checksums)  # Algorithms a sender may choose at START
+        self.accept_fec = accept_fec  # Agree to the parity scheme a sender proposes at START
+        self.accept_compression = accept_compression  # Agree to compressed frames (if the method is available here)
+        self.accept_resume = accept_resume  # Checkpoint transfers that ask for it (OPT_RESUME) and resume them from the sidecar
+        self.max_packet_size = max_packet_size  # Largest DATA payload a sender may agree on at START
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.ack_interval = ack_interval  # Send ACK if none was sent for this long
+        self.serve = serve  # Keep serving new peers after a transfer ends instead of stopping
+        self.output_dir = output_dir  # Where each session writes its file when serving several peers
+        self.truncate_output = truncate_output  # False when several stripe receivers share one output file
+
+
+class Session:
+    """State of one inbound transfer, keyed by the sender's address.
+
+    Each peer gets its own sequence space, reorder ring and ACK policy, so any number of senders can share the
+    receiver socket. last_seen drives idle eviction.
+    """
+
+    def __init__(self, address, window_size, settings, out_fd=None, output=None, sink=None, reporter=None):
+        self.address = address
+        self.window_size = window_size
+        self.settings = settings
+        self.out_fd = out_fd  # File descriptor of the output file, None when writing to sink
+        self.sink = sink or sys.stdout.buffer.write  # Takes the in-order payloads without an output file
+        self.reporter = reporter  # stats.Reporter the summary goes to at close, None when used as a library
+        self.output = output  # Path of that file, names the resume checkpoint next to it
+        self.base_offset = 0  # Output offset of packet 1, set by START for one stripe of a striped transfer
+        self.packet_size = config.packet_size  # DATA payload size, agreed at START
+        # Packets held beyond expected_seq: payload copies for stdout, only flags for a file
+        self.reorder = ReorderBuffer(2 * window_size, keep_payload=out_fd is None)
+        self.ack_policy = AckPolicy(settings.ack_every, settings.ack_delay)
+        self.last_ack_time = 0  # Time of last ACK sent
+        self.last_seen = time.monotonic()
+        self.finished = False  # END received; kept around to re-ACK a retransmitted END
+        self.checksum_name = integrity.DEFAULT
+        self.checksum = integrity.crc32  # Integrity function of everything after START
+        self.start_reply = {}  # Options confirmed in the START ACK
+        self.fec = None  # fec.Decoder when the sender sends parity packets
+        self.decompressor = None  # compress.Decompressor when DATA carries compressed frames
+        self.checkpoint = None  # resume.Checkpoint of a resumable transfer
+        self.stats = transport_stats.receiver_stats(peer=f"{address[0]}:{address[1]}")
+        self.ack_buf = bytearray(HEADER_SIZE + SACK_RANGE.size * config.sack_max_ranges)  # Reused for every ACK/SACK
+
+    def negotiate(self, options):
+        """Apply the options proposed in START and remember the answer"""
+        settings = self.settings
+        if len(options.get(OPT_STRIPE_OFFSET, b"")) == STRIPE_OFFSET.size and self.out_fd is not None:
+            self.base_offset = STRIPE_OFFSET.unpack(options[OPT_STRIPE_OFFSET])[0]
+        if len(options.get(OPT_PACKET_SIZE, b"")) == PACKET_SIZE.size:
+            self.packet_size = max(1, min(settings.max_packet_size, PACKET_SIZE.unpack(options[OPT_PACKET_SIZE])[0]))
+            self.start_reply[OPT_PACKET_SIZE] = PACKET_SIZE.pack(self.packet_size)
+        # Offsets in the output are only known for uncompressed DATA
+        if settings.accept_resume and self.out_fd is not None and len(options.get(OPT_RESUME, b"")) == RESUME.size and not options.get(OPT_COMPRESS):
+            self.restore(options[OPT_RESUME])
+        if OPT_WINDOW in options:
+            # The sender keeps at most 2 * this many packets beyond our cumulative ACK; larger packets
+            # get fewer of them, so the bytes in flight still fit a socket buffer sized for the default
+            window = self.window_size * config.packet_size // max(self.packet_size, config.packet_size)
+            self.start_reply[OPT_WINDOW] = WINDOW.pack(max(2, window))
+        if len(options.get(OPT_FEATURES, b"")) == FEATURES.size:
+            features = (FEATURE_SACK | FEATURE_PROBE | (FEATURE_FEC if settings.accept_fec else 0) | (FEATURE_COMPRESS if settings.accept_compression else 0)
+                        | (FEATURE_RESUME if settings.accept_resume else 0))
+            self.start_reply[OPT_FEATURES] = FEATURES.pack(features & FEATURES.unpack(options[OPT_FEATURES])[0])
+        if options.get(OPT_CHECKSUM):
+            name, algorithm = integrity.by_id(options[OPT_CHECKSUM][0])
+            if name not in settings.accepted_checksums:
+                name, algorithm = integrity.DEFAULT, integrity.ALGORITHMS[integrity.DEFAULT]
+            self.checksum_name, self.checksum = name, algorithm
+            self.start_reply[OPT_CHECKSUM] = bytes([integrity.ALGORITHM_IDS[name]])
+        if settings.accept_fec and len(options.get(OPT_FEC, b"")) == FEC_PARAMS.size:
+            scheme_id, k, m = FEC_PARAMS.unpack(options[OPT_FEC])
+            scheme = fec.SCHEME_NAMES.get(scheme_id)
+            if fec.valid(scheme, k, m):
+                self.fec = fec.Decoder(scheme, k, m, self.packet_size)
+                self.fec.release(self.expected_seq)
+                self.start_reply[OPT_FEC] = options[OPT_FEC]
+        # Each frame starts a packet with its FRAME header, which must fit in that packet
+        if settings.accept_compression and options.get(OPT_COMPRESS) and self.packet_size >= compress.FRAME.size:
+            method = compress.METHOD_NAMES.get(options[OPT_COMPRESS][0])
+            if method is not None:
+                self.decompressor = compress.Decompressor(method)
+                # Frames are decoded in order, so held packets keep their payload even with a file
+                self.reorder = ReorderBuffer(2 * self.window_size)
+                self.start_reply[OPT_COMPRESS] = options[OPT_COMPRESS]
+
+    def restore(self, resume_option):
+        """Pick up a resumable transfer from its checkpoint (or start one) and answer where to go on"""
+        transfer, digest = RESUME.unpack(resume_option)
+        path = resume.sidecar_path(self.output, self.base_offset)
+        checkpoint = resume.Checkpoint.load(path)
+        if checkpoint is not None and checkpoint.matches(transfer, digest, self.packet_size):
+            # Packets below base and in the held ranges are already at their offsets in the output
+            self.packet_size = checkpoint.packet_size
+            self.start_reply[OPT_PACKET_SIZE] = PACKET_SIZE.pack(self.packet_size)
+            self.reorder = ReorderBuffer(2 * self.window_size, base=checkpoint.base, keep_payload=False)
+            for start, end in checkpoint.ranges:
+                for seq_num in range(start, end):
+                    self.reorder.put(seq_num)
+            checkpoint.resumed_from = checkpoint.base
+        else:
+            checkpoint = resume.Checkpoint(path, transfer, digest, self.packet_size)
+        self.checkpoint = checkpoint
+        self.resume_reply(resume_option)
+
+    def resume_reply(self, resume_option):
+        """Answer OPT_RESUME with the first missing packet and the lowest ranges held beyond it"""
+        self.start_reply[OPT_RESUME] = (resume_option + RESUME_BASE.pack(self.expected_seq)
+                                        + encode_sack_ranges(self.reorder.ranges(RESUME_MAX_RANGES)))
+
+    def same_transfer(self, options):
+        """START options of a (restarted) sender of this resumable transfer"""
+        return self.checkpoint is not None and options.get(OPT_RESUME) == RESUME.pack(self.checkpoint.transfer, self.checkpoint.digest)
+
+    def save_checkpoint(self, now):
+        """Record what is on disk so a restarted transfer can skip it"""
+        self.checkpoint.save(self.out_fd, self.expected_seq, self.reorder.ranges(self.reorder.capacity), now)
+        self.stats.counters["checkpoints"] += 1
+
+    @property
+    def expected_seq(self):
+        """The next expected sequence number"""
+        return self.reorder.base
+
+    def send_ACK(self, sock, seq_num, ranges=None):
+        """Send ACK with the given sequence number to the peer.
+
+        With ranges (packets held beyond seq_num) a SACK is sent instead.
+        """
+        self.last_ack_time = time.monotonic()
+        self.ack_policy.on_sent()
+        self.stats.counters["sacks_sent" if ranges else "acks_sent"] += 1
+        if tracing.level >= tracing.PACKETS:
+            tracing.record(tracing.ACK_SENT, seq_num, len(ranges) if ranges else 0)
+        if ranges:
+            packet = build_packet(config.message_type.SACK, seq_num, encode_sack_ranges(ranges), buf=self.ack_buf, checksum=self.checksum)
+        else:
+            packet = build_packet(config.message_type.ACK, seq_num, buf=self.ack_buf, checksum=self.checksum)
+        sock.sendto(packet, self.address)
+
+    def send_start_ACK(self, sock):
+        """ACK 1 with the negotiated options, under the default checksum like START"""
+        self.last_ack_time = time.monotonic()
+        sock.sendto(build_packet(config.message_type.ACK, 1, encode_options(self.start_reply), buf=self.ack_buf), self.address)
+
+    def write(self, seq_num, msg):
+        """Write a payload to its final offset in the output file"""
+        os.pwrite(self.out_fd, msg, self.base_offset + (seq_num - 1) * self.packet_size)
+
+    def deliver(self, seq_num, msg):
+        """Output the in-order payload seq_num (decompressing the frames it completes)"""
+        if self.decompressor is not None:
+            for offset, raw in self.decompressor.feed(msg):
+                self.stats.counters["bytes_decompressed"] += len(raw)
+                if self.out_fd is None:
+                    self.sink(raw)
+                else:
+                    os.pwrite(self.out_fd, raw, self.base_offset + offset)
+        elif self.out_fd is None:
+            self.sink(msg)
+        else:
+            self.write(seq_num, msg)
+
+    def store(self, seq_num, msg):
+        """Keep an accepted out-of-order DATA payload until everything before it has arrived.
+
+        With an uncompressed output file the payload is written straight to its final
+        offset and only flagged in the reorder ring; otherwise a copy is held in the ring.
+        Returns False for a duplicate.
+        """
+        if seq_num in self.reorder:
+            if tracing.level >= tracing.EVENTS:
+                tracing.record(tracing.DROP, seq_num, tracing.DROP_DUPLICATE)
+            return False
+        if self.reorder.payloads is not None:
+            self.reorder.put(seq_num, bytes(msg))
+        else:
+            self.write(seq_num, msg)
+            self.reorder.put(seq_num)
+        return True
+
+    def deliver_in_order(self):
+        """Move expected_seq past every packet already stored"""
+        first = self.reorder.base
+        ready = self.reorder.pop_ready()
+        if self.reorder.payloads is not None:
+            for seq_num, payload in enumerate(ready, first):
+                self.deliver(seq_num, payload)
+
+    def sack_ranges(self):
+        """[start, end) ranges of packets stored beyond expected_seq, lowest first"""
+        return self.reorder.ranges(config.sack_max_ranges)
+
+    def repair(self, s, rebuilt, now):
+        """Handle the DATA packets FEC rebuilt as if they had arrived"""
+        for seq_num, payload in rebuilt:
+            self.stats.counters["fec_recovered"] += 1
+            if tracing.level >= tracing.EVENTS:
+                tracing.record(tracing.FEC_RECOVER, seq_num)
+            self.handle(s, config.message_type.DATA, seq_num, payload, now, rebuilt=True)
+
+    def handle(self, s, pkt_type, seq_num, msg, now, rebuilt=False):
+        """Process one verified packet from the peer (or a DATA packet FEC rebuilt)"""
+        self.last_seen = now
+        window_size = self.window_size
+        
+        # Process different packet types
+        if pkt_type == config.message_type.DATA:
+            if self.finished:
+                return
+            if tracing.level >= tracing.PACKETS:
+                tracing.record(tracing.RECV, seq_num, len(msg))
+            counters = self.stats.counters
+            if not rebuilt:
+                counters["packets_received"] += 1
+            expected_seq = self.expected_seq
+            # Drop packets outside window
+            if seq_num >= expected_seq + 2 * window_size:
+                counters["out_of_window"] += 1
+                if tracing.level >= tracing.EVENTS:
+                    tracing.record(tracing.DROP, seq_num, tracing.DROP_WINDOW)
+                self.send_ACK(s, expected_seq, self.sack_ranges())
+                return
+            
+            # Handle in-order packet
+            if seq_num == expected_seq:
+                self.deliver(seq_num, msg)
+                self.reorder.skip()
+                counters["bytes_received"] += len(msg)
+                
+                # Process buffered packets in order
+                self.deliver_in_order()
+                
+                # Send ACK for the received packet after processing. Filling a gap
+                # (or leaving one behind) is always ACKed, the rest follows the policy
+                ranges = self.sack_ranges()
+                if ranges or self.expected_seq != seq_num + 1 or self.ack_policy.on_in_order(now) or self.ack_policy.due(now):
+                    self.send_ACK(s, self.expected_seq, ranges)
+                if self.fec is not None:
+                    self.fec.release(self.expected_seq)
+                    if not rebuilt:
+                        self.repair(s, self.fec.add_data(seq_num, msg), now)
+                # Batched: at most one fdatasync and sidecar write per checkpoint_packets or checkpoint_interval
+                if self.checkpoint is not None and not self.finished and self.checkpoint.due(self.expected_seq, now):
+                    self.save_checkpoint(now)
+            
+            # Buffer out-of-order packet, the SACK tells the sender what is held
+            elif seq_num > expected_seq:
+                if self.store(seq_num, msg):
+                    counters["out_of_order"] += 1
+                    counters["bytes_received"] += len(msg)
+                    self.stats.histograms["reorder_held_packets"].add(self.reorder.held)
+                    self.send_ACK(s, expected_seq, self.sack_ranges())
+                    if self.fec is not None and not rebuilt:
+                        self.repair(s, self.fec.add_data(seq_num, msg), now)
+                else:
+                    counters["duplicates"] += 1
+                    self.send_ACK(s, expected_seq, self.sack_ranges())
+            
+            # Duplicate packet or old packet
+            else:
+                counters["duplicates"] += 1
+                if tracing.level >= tracing.EVENTS:
+                    tracing.record(tracing.DROP, seq_num, tracing.DROP_DUPLICATE)
+                self.send_ACK(s, expected_seq, self.sack_ranges())
+        
+        # Handle END message
+        elif pkt_type == config.message_type.END:
+            if not self.finished and self.decompressor is not None:
+                self.decompressor.finish()  # A frame cut short fails the session instead of truncating the output
+            self.send_ACK(s, seq_num + 1)
+            if not self.finished:
+                if tracing.level >= tracing.EVENTS:
+                    tracing.record(tracing.END, seq_num)
+                self.finished = True
+                self.close()
+            return
+        
+        elif pkt_type == config.message_type.START:
+            # First START, or a retransmitted one because our ACK was lost. A resumable transfer
+            # whose sender restarted from the same address goes on from what we have now
+            options = decode_options(msg)
+            if self.same_transfer(options):
+                self.resume_reply(options[OPT_RESUME])
+            self.send_start_ACK(s)
+
+        elif pkt_type == config.message_type.PARITY:
+            if self.fec is None or self.finished:
+                return
+            self.stats.counters["fec_parity_received"] += 1
+            self.repair(s, self.fec.add_parity(seq_num, msg), now)
+
+        # Control ACK frequency to improve performance
+        if not self.finished and now - self.last_ack_time > self.settings.ack_interval:
+            self.send_ACK(s, self.expected_seq, self.sack_ranges())
+
+    def close(self):
+        """Flush the output and release the file (idempotent)"""
+        sys.stdout.flush()
+        if self.checkpoint is not None:
+            if self.finished:
+                self.checkpoint.remove()
+            elif self.out_fd is not None:
+                self.save_checkpoint(time.monotonic())
+        if self.out_fd is not None:
+            os.close(self.out_fd)
+            self.out_fd = None
+        print(f"{self.address[0]}:{self.address[1]}: {self.expected_seq - 1} packets of {self.packet_size} bytes{'' if self.finished else ' (incomplete)'}, checksum {self.checksum_name}, {self.ack_policy}"
+              f"{'' if self.fec is None else ', ' + str(self.fec)}{'' if self.decompressor is None else ', ' + str(self.decompressor)}"
+              f"{'' if self.checkpoint is None else ', ' + str(self.checkpoint)}", file=sys.stderr)
+        self.stats.finish()
+        if self.reporter is not None:
+            self.reporter.emit([self.stats], final=True)
+
+
+class Endpoint:
+    """Sessions of every peer of one receiver socket, keyed by the sender's address.
+
+    Each session writes to output (a file path), or in order to sink
+    (stdout by default) without one. Without settings.serve one transfer is
+    accepted at a time and is_running turns False once it ends.
+    """
+
+    def __init__(self, window_size, settings, output=None, sink=None, reporter=None):
+        self.window_size = window_size
+        self.settings = settings
+        self.output = output
+        self.sink = sink
+        self.reporter = reporter  # stats.Reporter writing the JSON summaries, None when used as a library
+        self.sessions = {}  # Source address -> Session of every transfer in progress (or just finished)
+        self.transfers = 0  # Sessions started so far, used to name their output files
+        self.is_running = True
+        self.socket_stats = transport_stats.socket_stats()  # Datagrams, syscalls and drops of the shared socket
+
+    def all_stats(self):
+        """Stats of every session and of the socket, for a stats.Reporter"""
+        return [session.stats for session in list(self.sessions.values())] + [self.socket_stats]
+
+    def open_session(self, address, options):
+        """Create the Session for a peer that sent START and negotiate its options"""
+        self.transfers += 1
+        output = self.output
+        if self.settings.output_dir:
+            output = os.path.join(self.settings.output_dir, f"{self.transfers:04d}-{address[0]}_{address[1]}")
+        out_fd = os.open(output, os.O_WRONLY | os.O_CREAT, 0o644) if output else None
+        session = Session(address, self.window_size, self.settings, out_fd, output, sink=self.sink, reporter=self.reporter)
+        session.negotiate(options)
+        # A resumed transfer keeps what the output already holds
+        if out_fd is not None and self.settings.truncate_output and (session.checkpoint is None or session.checkpoint.resumed_from is None):
+            os.ftruncate(out_fd, 0)
+        self.sessions[address] = session
+        return session
+
+    def handle_packet(self, s, pkt, address):
+        """Process one received datagram, answering on s"""
+        sessions = self.sessions
+        serve = self.settings.serve
+        session = sessions.get(address)
+        if session is None and len(pkt) >= HEADER_SIZE:
+            pkt_type, seq_num = decode_header(pkt)[:2]
+            if pkt_type in (config.message_type.DATA, config.message_type.END, config.message_type.PARITY):
+                # From a peer we never saw START from, or one that was evicted. Its checksum is unknown here,
+                # so tell it unverified (under the default checksum, like START) that the session is gone
+                s.sendto(build_packet(config.message_type.RESET, seq_num, RESET_REASON.pack(RESET_UNKNOWN)), address)
+                return
+        # START (and PROBE) always use the default checksum, the rest of a transfer what its START chose
+        checksum = integrity.crc32
+        if session is not None and len(pkt) >= HEADER_SIZE and decode_header(pkt)[0] not in (config.message_type.START, config.message_type.PROBE):
+            checksum = session.checksum
+
+        # Parse header and validate checksum (drop truncated/corrupted packets)
+        parsed = verify_packet(pkt, checksum)
+        if parsed is None:
+            (session.stats if session is not None else self.socket_stats).counters["checksum_failures"] += 1
+            if tracing.level >= tracing.EVENTS:
+                tracing.record(tracing.CHECKSUM_FAIL, 0, len(pkt))
+            return
+        pkt_type, seq_num, msg = parsed
+
+        if pkt_type == config.message_type.PROBE:
+            # Path MTU probe: echo it empty, no session needed
+            s.sendto(build_packet(config.message_type.PROBE, seq_num), address)
+            return
+        if pkt_type == config.message_type.START and (session is None or session.finished):
+            if session is not None:
+                del sessions[address]
+            options = decode_options(msg)
+            # A restarted sender of a resumable transfer (from a new port) takes over its unfinished session,
+            # which writes its checkpoint on the way out
+            for other in [a for a, other in sessions.items() if not other.finished and other.same_transfer(options)]:
+                sessions.pop(other).close()
+            # Without serve one transfer at a time goes to the sink/output
+            if not serve and any(not other.finished for other in sessions.values()):
+                return
+            if len(sessions) >= config.max_sessions:
+                return  # The peer keeps retrying START until a slot frees up
+            session = self.open_session(address, options)
+            if tracing.level >= tracing.EVENTS:
+                tracing.record(tracing.START, address[1], integrity.ALGORITHM_IDS[session.checksum_name])
+        if session is None:
+            return
+        try:
+            session.handle(s, pkt_type, seq_num, msg, time.monotonic())
+        except ValueError as e:
+            # A compressed frame that does not decode: the output can never be completed
+            print(f"{address[0]}:{address[1]}: {e}, closing the session", file=sys.stderr)
+            session.stats.counters["decode_errors"] += 1
+            sessions.pop(address).close()
+            s.sendto(build_packet(config.message_type.RESET, seq_num, RESET_REASON.pack(RESET_FAILED)), address)
+            if not serve:
+                self.is_running = False
+            return
+        if session.finished and not serve:
+            self.is_running = False
+
+    def flush_acks(self, s, now):
+        """Send the ACKs the policy held back for too long"""
+        for session in self.sessions.values():
+            if not session.finished and session.ack_policy.due(now):
+                session.send_ACK(s, session.expected_seq, session.sack_ranges())
+
+    def evict_idle(self, now, idle_timeout):
+        """Drop sessions that have not sent anything for idle_timeout seconds"""
+        for address in [a for a, session in self.sessions.items() if now - session.last_seen > idle_timeout]:
+            self.sessions.pop(address).close()
+
+    def close(self):
+        """Close every unfinished session (they checkpoint what they have)"""
+        for session in self.sessions.values():
+            if not session.finished:
+                session.close()
+        self.sessions.clear()
@@ -0,0 +1,164 @@
+"""Per-connection transport statistics and JSON reports.
+
+A Stats object holds plain integer counters (a dict, so callers bump them
+with `stats.counters["name"] += n`) and fixed-bucket histograms, and
+renders a JSON-ready snapshot with derived goodput. A Reporter writes
+snapshots as JSON lines to a file or stderr, at exit and optionally every
+`interval` seconds from a background thread.
+"""
+import bisect
+import json
+import sys
+import threading
+import time
+
+SENDER_COUNTERS = (
+    "packets_sent", "bytes_sent", "bytes_acked", "acks_received", "sacks_received", "dup_acks",
+    "retransmits", "retransmits_timeout", "retransmits_dupack", "retransmits_partial_ack", "retransmits_sack_hole",
+    "timeouts", "fast_retransmits", "checksum_failures", "fec_parity_sent",
+    "bytes_uncompressed", "packets_resumed",
+)
+# Indexed by the retransmission reason (tracing.RTX_*)
+RETRANSMIT_COUNTERS = ("retransmits_timeout", "retransmits_dupack", "retransmits_partial_ack", "retransmits_sack_hole")
+RECEIVER_COUNTERS = (
+    "packets_received", "bytes_received", "duplicates", "out_of_order", "out_of_window",
+    "acks_sent", "sacks_sent", "checksum_failures", "fec_parity_received", "fec_recovered",
+    "bytes_decompressed", "decode_errors", "checkpoints",
+)
+SOCKET_COUNTERS = ("datagrams", "syscalls", "socket_drops", "checksum_failures")
+
+RTT_MS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+OCCUPANCY_BUCKETS = tuple(1 << i for i in range(17))  # 1 .. 65536 packets
+
+
+class Histogram:
+    """Counts of samples per bucket: counts[i] holds samples <= bounds[i], the last one the rest"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (max for the overflow bucket)"""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "bounds": list(self.bounds),
+            "counts": self.counts,
+        }
+
+
+class Stats:
+    """Counters and histograms of one connection (or one socket)"""
+
+    def __init__(self, role, counters, histograms=None, **labels):
+        self.role = role
+        self.labels = labels
+        self.started = time.monotonic()
+        self.finished = None  # Set by finish(); elapsed time stops there
+        self.counters = dict.fromkeys(counters, 0)
+        self.histograms = {name: Histogram(bounds) for name, bounds in (histograms or {}).items()}
+
+    def restart(self):
+        """Measure elapsed time (and goodput) from now, e.g. once the handshake is done"""
+        self.started = time.monotonic()
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.monotonic()
+
+    def snapshot(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        snapshot = {"role": self.role, **self.labels, "elapsed_s": round(elapsed, 6)}
+        # Goodput: payload delivered in order (sender: acknowledged, receiver: accepted)
+        useful = self.counters.get("bytes_acked", self.counters.get("bytes_received"))
+        if useful is not None:
+            snapshot["goodput_mbit_s"] = round(useful * 8 / elapsed / 1e6, 3) if elapsed > 0 else 0.0
+        snapshot["counters"] = dict(self.counters)
+        snapshot["histograms"] = {name: h.to_dict() for name, h in self.histograms.items()}
+        return snapshot
+
+
+def sender_stats(**labels):
+    return Stats("sender", SENDER_COUNTERS, {"rtt_ms": RTT_MS_BUCKETS, "inflight_packets": OCCUPANCY_BUCKETS}, **labels)
+
+
+def receiver_stats(**labels):
+    return Stats("receiver", RECEIVER_COUNTERS, {"reorder_held_packets": OCCUPANCY_BUCKETS}, **labels)
+
+
+def socket_stats(**labels):
+    return Stats("socket", SOCKET_COUNTERS, **labels)
+
+
+class Reporter:
+    """Writes JSON lines of stats snapshots to path ("-": stderr).
+
+    source() returns the Stats objects to report; with interval > 0 start()
+    reports them every interval seconds until stop().
+    """
+
+    def __init__(self, source, path="-", interval=0):
+        self.source = source
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def emit(self, stats_list=None, final=False):
+        lines = []
+        for stats in (self.source() if stats_list is None else stats_list):
+            snapshot = stats.snapshot()
+            snapshot["final"] = final
+            lines.append(json.dumps(snapshot))
+        if not lines:
+            return
+        with self.lock:
+            if self.path == "-":
+                sys.stderr.write("\n".join(lines) + "\n")
+                sys.stderr.flush()
+            else:
+                with open(self.path, "a") as f:
+                    f.write("\n".join(lines) + "\n")
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.emit()
+
+    def start(self):
+        if self.interval > 0:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
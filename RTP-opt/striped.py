@@ -0,0 +1,137 @@
+"""Striped transfer: one file sent over N sockets by N processes.
+
+The input is split into N byte ranges (aligned to packet_size). Stripe i is
+sent by its own worker process running the regular sender to port
+base_port + i, where a receiver process writes it into the shared output
+file at the stripe's offset, which travels in the START payload. CRC,
+header encoding and syscalls of each stripe run on their own core instead of
+all sharing one interpreter.
+
+    python striped.py receive 0.0.0.0 40000 128 --output out.bin --streams 4
+    python striped.py send 10.0.0.2 40000 128 --file in.bin --streams 4
+    python striped.py bench --file in.bin --streams 1,2,4,8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import config
+import receiver
+import sender
+from congestion import CONTROLLERS
+from session import Endpoint, Settings
+from utils import open_input
+
+
+def stripe_ranges(size, streams):
+    """[start, end) byte range of every stripe, each a whole number of packets"""
+    packets = -(-size // config.packet_size)
+    per_stripe = -(-packets // streams) * config.packet_size
+    return [(min(size, i * per_stripe), min(size, (i + 1) * per_stripe)) for i in range(streams)]
+
+
+def _quiet():
+    """Send a worker's per-packet logging to /dev/null"""
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+
+def _send_stripe(recv_ip, recv_port, window_size, path, start, end, cc, quiet):
+    # Every send_data call has its own socket and Transfer, so a worker may send several stripes
+    if quiet:
+        _quiet()
+    data = open_input(path)[start:end]
+    transfer = sender.send_data(recv_ip, recv_port, data, window_size, cc=cc, stripe_offset=start)
+    return transfer.complete(), transfer.num_packet
+
+
+def _receive_stripe(recv_ip, recv_port, window_size, output, quiet):
+    if quiet:
+        _quiet()
+        sys.stderr = open(os.devnull, "w")
+    receiver.receiver(Endpoint(window_size, Settings(truncate_output=False), output=output), recv_ip, recv_port)
+
+
+def send_striped(recv_ip, base_port, window_size, path, streams, cc="none", quiet=True):
+    """Send path over `streams` parallel transfers; True if every stripe was acknowledged"""
+    ranges = stripe_ranges(os.path.getsize(path), streams)
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(streams) as pool:
+        results = pool.starmap(_send_stripe, [(recv_ip, base_port + i, window_size, path, start, end, cc, quiet)
+                                              for i, (start, end) in enumerate(ranges)])
+    return all(done for done, _ in results)
+
+
+def start_receivers(recv_ip, base_port, window_size, output, streams, quiet=False):
+    """Start one receiver process per stripe; join them to wait for the transfer"""
+    # Created (and truncated) once here, the stripes then write at their own offsets
+    os.close(os.open(output, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644))
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_receive_stripe, args=(recv_ip, base_port + i, window_size, output, quiet))
+               for i in range(streams)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def bench(path, stream_counts, window_size, base_port, cc="none", log=sys.stdout):
+    """Time a loopback transfer of path for every stream count, reporting each to log"""
+    size = os.path.getsize(path)
+    output = path + ".striped"
+    results = []
+    for streams in stream_counts:
+        receivers = start_receivers("127.0.0.1", base_port, window_size, output, streams, quiet=True)
+        time.sleep(0.5)  # Let the receivers bind before the START messages go out
+        t0 = time.perf_counter()
+        ok = send_striped("127.0.0.1", base_port, window_size, path, streams, cc=cc)
+        for worker in receivers:
+            # Receivers of a failed stripe never see END
+            worker.join(5 if ok else 0.5)
+            if worker.is_alive():
+                worker.terminate()
+        elapsed = time.perf_counter() - t0
+        with open(path, "rb") as a, open(output, "rb") as b:
+            ok = ok and a.read() == b.read()
+        results.append({"streams": streams, "seconds": round(elapsed, 3), "mbit_s": round(size * 8 / elapsed / 1e6, 1), "ok": ok})
+        speedup = results[0]["seconds"] / elapsed
+        print(f"streams={streams:<3d} {elapsed:7.3f}s {results[-1]['mbit_s']:9.1f} Mbit/s  speedup x{speedup:.2f}{'' if ok else '  OUTPUT MISMATCH'}", file=log)
+        log.flush()
+        base_port += streams
+    os.remove(output)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Striped transfer over parallel sockets")
+    parser.add_argument("mode", choices=["send", "receive", "bench"])
+    parser.add_argument("ip", type=str, nargs="?", default="127.0.0.1", help="Receiver host (address to bind when receiving)")
+    parser.add_argument("port", type=int, nargs="?", default=40000, help="Port of stripe 0, stripe i uses port + i")
+    parser.add_argument("window_size", type=int, nargs="?", default=128, help="Window size of each stripe")
+    parser.add_argument("--file", type=str, default=None, help="File to send (send, bench)")
+    parser.add_argument("--output", type=str, default=None, help="Output file (receive)")
+    parser.add_argument("--streams", type=str, default=str(os.cpu_count() or 1), help="Number of stripes; comma separated list for bench")
+    parser.add_argument("--cc", choices=sorted(CONTROLLERS), default="none", help="Congestion control of each stripe")
+    parser.add_argument("--json", action="store_true", help="bench: print the results as JSON")
+    args = parser.parse_args()
+    if args.mode != "receive" and not args.file:
+        parser.error("--file is required, stripes are byte ranges of a regular file")
+    if args.mode == "receive" and not args.output:
+        parser.error("--output is required, stripes are written at their offsets")
+
+    if args.mode == "send":
+        ok = send_striped(args.ip, args.port, args.window_size, args.file, int(args.streams), cc=args.cc)
+        print("Transfer complete" if ok else "Transfer failed")
+        sys.exit(0 if ok else 1)
+    elif args.mode == "receive":
+        for worker in start_receivers(args.ip, args.port, args.window_size, args.output, int(args.streams)):
+            worker.join()
+    else:
+        # With --json stdout carries only the JSON document
+        results = bench(args.file, [int(n) for n in args.streams.split(",")], args.window_size, args.port, cc=args.cc,
+                        log=sys.stderr if args.json else sys.stdout)
+        if args.json:
+            print(json.dumps({"file_bytes": os.path.getsize(args.file), "cpus": os.cpu_count(), "results": results}))
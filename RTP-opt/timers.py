@@ -0,0 +1,57 @@
+import heapq
+
+
+class RetransmitScheduler:
+    """Retransmission deadlines kept in a min-heap with lazy cancellation.
+
+    deadlines maps each armed key (sequence number) to its current deadline.
+    Cancelling or re-arming only touches that dict; the matching heap entry
+    becomes stale and is discarded when it reaches the top. Not thread-safe:
+    the sender calls it with its global lock held.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, key, deadline):
+        """Arm (or re-arm) key. Returns True if it is now the earliest deadline."""
+        self.deadlines[key] = deadline
+        heapq.heappush(self.heap, (deadline, key))
+        # Stale entries only go away from the top; rebuild if they pile up
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(d, k) for k, d in self.deadlines.items()]
+            heapq.heapify(self.heap)
+        return self.next_deadline() == deadline
+
+    def cancel(self, key):
+        """Disarm key in O(1)"""
+        self.deadlines.pop(key, None)
+
+    def clear(self):
+        self.heap.clear()
+        self.deadlines.clear()
+
+    def next_deadline(self):
+        """Earliest armed deadline, or None when nothing is armed"""
+        heap = self.heap
+        while heap:
+            deadline, key = heap[0]
+            if self.deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(heap)
+        return None
+
+    def pop_expired(self, now):
+        """Disarm and return every key whose deadline is <= now"""
+        expired = []
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            deadline, key = heapq.heappop(heap)
+            if self.deadlines.get(key) == deadline:
+                del self.deadlines[key]
+                expired.append(key)
+        return expired
@@ -0,0 +1,142 @@
+"""Packet event tracing into a fixed-size in-memory ring.
+
+Events are 17-byte binary records (time, kind, seq, arg) packed into a
+preallocated bytearray; once it is full the oldest events are overwritten.
+Nothing is formatted or written while the transfer runs. The ring is dumped
+to a trace file at exit, on SIGUSR1, or by calling dump(). Recording takes a
+lock, so the sender's send loop, ACK thread and timer thread can all record
+without overwriting each other's events.
+
+Call sites check the level before building an event, so with tracing off
+(the default) the cost is one global lookup and compare:
+
+    if tracing.level >= tracing.PACKETS:
+        tracing.record(tracing.SEND, seq)
+
+Decode a trace file with:
+
+    python tracing.py out.trace [--kinds retransmit,timeout] [--csv]
+"""
+import argparse
+import atexit
+import signal
+import struct
+import sys
+import threading
+import time
+
+OFF, EVENTS, PACKETS = 0, 1, 2
+LEVELS = {"off": OFF, "events": EVENTS, "packets": PACKETS}
+
+# Event kinds. EVENTS level: rare control events; PACKETS level: one or more per packet
+START, END, TIMEOUT, FAST_RETRANSMIT, RETRANSMIT, DROP, CHECKSUM_FAIL, SEND, ACK, RECV, ACK_SENT, FEC_RECOVER = range(1, 13)
+KIND_NAMES = {
+    START: "start", END: "end", TIMEOUT: "timeout", FAST_RETRANSMIT: "fast_retransmit",
+    RETRANSMIT: "retransmit", DROP: "drop", CHECKSUM_FAIL: "checksum_fail",
+    SEND: "send", ACK: "ack", RECV: "recv", ACK_SENT: "ack_sent", FEC_RECOVER: "fec_recover",
+}
+# arg of RETRANSMIT: why the packet was sent again
+RTX_TIMEOUT, RTX_DUPACK, RTX_PARTIAL_ACK, RTX_SACK_HOLE = range(4)
+# arg of DROP
+DROP_WINDOW, DROP_DUPLICATE = range(2)
+
+EVENT = struct.Struct("<QBII")  # ns since the trace started, kind, seq, arg
+FILE_HEADER = struct.Struct("<4sHHQQQ")  # magic, version, event size, start time (ns), events recorded, events kept
+MAGIC = b"RTPT"
+VERSION = 1
+
+level = OFF
+path = None
+ring = bytearray()
+capacity = 0
+recorded = 0  # Events ever recorded; the ring keeps the last `capacity`
+started_ns = 0
+_pack_into = EVENT.pack_into
+# Reentrant: a SIGUSR1 dump runs on the main thread, possibly in the middle of its own record()
+_lock = threading.RLock()
+_clock = time.monotonic_ns
+
+
+def configure(trace_level, trace_path=None, size=65536):
+    """Enable tracing at trace_level into a ring of size events, dumped to trace_path"""
+    global level, path, ring, capacity, recorded, started_ns
+    level = LEVELS[trace_level] if isinstance(trace_level, str) else trace_level
+    if level == OFF:
+        return
+    path = trace_path
+    capacity = size
+    ring = bytearray(EVENT.size * size)
+    recorded = 0
+    started_ns = _clock()
+    if path:
+        atexit.register(dump)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: dump())
+
+
+def record(kind, seq=0, arg=0):
+    """Append one event (callers check the level first)"""
+    global recorded
+    with _lock:
+        _pack_into(ring, (recorded % capacity) * EVENT.size, _clock() - started_ns, kind, seq & 0xFFFFFFFF, arg & 0xFFFFFFFF)
+        recorded += 1
+
+
+def snapshot():
+    """The kept events as one bytes object, oldest first"""
+    with _lock:
+        if recorded <= capacity:
+            return bytes(ring[:recorded * EVENT.size])
+        split = (recorded % capacity) * EVENT.size
+        return bytes(ring[split:] + ring[:split])
+
+
+def dump(trace_path=None):
+    """Write the ring to trace_path (default: the configured path)"""
+    trace_path = trace_path or path
+    if level == OFF or not trace_path:
+        return
+    with _lock:
+        events = snapshot()
+        total = recorded
+    with open(trace_path, "wb") as f:
+        f.write(FILE_HEADER.pack(MAGIC, VERSION, EVENT.size, started_ns, total, len(events) // EVENT.size))
+        f.write(events)
+
+
+def read(trace_path):
+    """Header fields and (ns, kind, seq, arg) events of a trace file"""
+    with open(trace_path, "rb") as f:
+        data = f.read()
+    magic, version, event_size, start_ns, total, kept = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or event_size != EVENT.size:
+        raise ValueError(f"{trace_path}: not a version {VERSION} trace file")
+    body = memoryview(data)[FILE_HEADER.size:FILE_HEADER.size + kept * EVENT.size]
+    return (start_ns, total, kept), EVENT.iter_unpack(body)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode a binary trace file")
+    parser.add_argument("trace_file", type=str)
+    parser.add_argument("--kinds", type=str, default=None, help="Comma separated event kinds to show")
+    parser.add_argument("--csv", action="store_true", help="Print CSV instead of aligned columns")
+    args = parser.parse_args()
+    wanted = None
+    if args.kinds:
+        by_name = {name: kind for kind, name in KIND_NAMES.items()}
+        wanted = {by_name[name] for name in args.kinds.split(",")}
+
+    (start_ns, total, kept), events = read(args.trace_file)
+    if args.csv:
+        print("time_ms,event,seq,arg")
+    else:
+        print(f"# {kept} of {total} events ({total - kept} overwritten)")
+    for ns, kind, seq, arg in events:
+        if wanted is not None and kind not in wanted:
+            continue
+        name = KIND_NAMES.get(kind, str(kind))
+        if args.csv:
+            print(f"{ns / 1e6:.3f},{name},{seq},{arg}")
+        else:
+            print(f"{ns / 1e6:12.3f} ms  {name:16s} {seq:10d} {arg:10d}")
+    sys.stdout.flush()
@@ -0,0 +1,448 @@
+"""Sending side of one transfer, independent of how it is driven.
+
+A Transfer holds everything the protocol keeps on the sender: the START
+proposal and the receiver's answer, the ring of unacknowledged packets and
+their retransmission deadlines, RTO estimation, congestion control,
+duplicate-ACK and SACK loss recovery, FEC parity, compression and resume.
+It opens no socket, starts no thread and never reads the clock: packets go
+out through the send callables it is given and every method that needs the
+time takes `now` (any monotonic clock, in seconds).
+
+sender.py drives a Transfer from threads sharing one lock, async_transport.py
+from an asyncio event loop. Methods marked "lock held" must not run
+concurrently with each other.
+"""
+import compress
+import config
+import fec
+import integrity
+import resume
+import stats as transport_stats
+import tracing
+from congestion import make_controller
+from ring import SendWindow
+from rto import RTOEstimator
+from timers import RetransmitScheduler
+from utils import (FEATURE_COMPRESS, FEATURE_FEC, FEATURE_NAMES, FEATURE_PROBE, FEATURE_RESUME, FEATURE_SACK, FEATURES, FEC_PARAMS, HEADER_SIZE,
+                   OPT_CHECKSUM, OPT_COMPRESS, OPT_FEATURES, OPT_FEC, OPT_PACKET_SIZE, OPT_RESUME, OPT_STRIPE_OFFSET, OPT_WINDOW, PACKET_SIZE,
+                   RESET_FAILED, RESET_REASON, RESUME, RESUME_BASE, SACK_RANGE, STRIPE_OFFSET, WINDOW, build_packet, decode_header, decode_options,
+                   decode_sack_ranges, encode_options, iter_chunks, verify_packet)
+
+FEATURES_IMPLEMENTED = FEATURE_SACK | FEATURE_FEC | FEATURE_COMPRESS | FEATURE_PROBE | FEATURE_RESUME
+
+
+class Transfer:
+    """Protocol state of one outbound transfer of data.
+
+    send(packet) transmits one packet to the receiver, send_batch(packets)
+    a run of new DATA packets (one send per packet by default). The options
+    are what START proposes; the receiver's answer decides what is used.
+    """
+
+    def __init__(self, send, data, window_size, cc="none", checksum=integrity.DEFAULT, max_packet_size=config.packet_size,
+                 fec_scheme=None, fec_block=config.fec_block, fec_parity=config.fec_parity, compress_method=None, compress_level=None,
+                 resume_id=None, stripe_offset=None, rto_min=config.rto_min, rto_max=config.rto_max, dupack_threshold=config.dupack_threshold,
+                 send_batch=None):
+        self.send = send
+        self.send_batch = send_batch or (lambda packets: [send(packet) for packet in packets])
+        self.data = data
+        self.window_size = window_size
+        self.cc = cc
+        self.base = 0  # Base of the sliding window
+        self.seq_num = 0  # Sequence number of the next new packet
+        self.window = SendWindow(1)  # Ring of unacknowledged packets (payload view, send time), sized in begin
+        self.retransmit_timers = RetransmitScheduler()  # Retransmission deadline of each packet in window
+        self.rto_estimator = RTOEstimator(config.rto_initial, rto_min, rto_max)
+        self.is_running = True  # False once END is acknowledged, the receiver reset us or the driver gave up
+        self.end_received = False  # The END ACK came back
+        self.transfer_failed = False  # The receiver reported that this transfer cannot complete (RESET_FAILED)
+        self.input_done = False  # Set by the driver once the input hit EOF, num_packet is final
+        self.ws = 0  # Packets in flight
+        self.num_packet = 0  # DATA packets handed to send_new so far
+        self.congestion = None  # Congestion controller, limits ws below window_size
+        self.dupack_threshold = dupack_threshold
+        self.dup_acks = 0  # Consecutive ACKs repeating last_ack
+        self.last_ack = 0  # Highest cumulative ACK received
+        self.recovery_point = None  # Highest seq sent when fast recovery started, None outside recovery
+        self.loss_scan = 0  # SACK holes below this were already retransmitted in this recovery
+        self.backoff_until = 0  # Timeouts before this belong to the same loss event
+        self.checksum_name = integrity.DEFAULT
+        self.checksum = integrity.crc32  # Integrity function agreed in the START exchange (None: off)
+        self.stats = transport_stats.sender_stats()  # Counters and histograms of this transfer
+        self.fec_encoder = None  # fec.Encoder once the receiver accepted the OPT_FEC proposal of START
+        self.compress_method = None  # Method agreed in the START exchange, None sends the input as is
+        self.compress_level = compress_level
+        self.compression = None  # compress.Compressor producing the payloads of this transfer
+        self.packet_size = config.packet_size  # DATA payload size agreed in the START exchange
+        self.max_packet_size = max_packet_size  # Largest payload proposed at START (a driver may lower it after probing the path)
+        self.peer_window = None  # Receiver window from the START ACK, bounds ours
+        self.peer_features = None  # FEATURE_* bits both sides implement, None if the receiver did not say
+        self.resume_option = None  # OPT_RESUME value of START: transfer ID and fingerprint of the input
+        self.resume_skip = set()  # Packets beyond the resume point that the receiver's checkpoint already holds
+
+        # Options carried by START (utils.OPT_*); OPT_PACKET_SIZE is added when it goes out
+        self.start_options = {OPT_WINDOW: WINDOW.pack(window_size), OPT_FEATURES: FEATURES.pack(FEATURES_IMPLEMENTED)}
+        if checksum != integrity.DEFAULT:
+            self.start_options[OPT_CHECKSUM] = bytes([integrity.ALGORITHM_IDS[checksum]])
+        if stripe_offset is not None:
+            self.start_options[OPT_STRIPE_OFFSET] = STRIPE_OFFSET.pack(stripe_offset)
+        if fec_scheme is not None:
+            if not fec.valid(fec_scheme, fec_block, fec_parity):
+                raise ValueError("FEC needs k >= 1, m >= 1 and k + m <= 256 (m = 1 with xor)")
+            self.start_options[OPT_FEC] = FEC_PARAMS.pack(fec.SCHEMES[fec_scheme], fec_block, fec_parity)
+        if compress_method is not None:
+            if resume_id is not None:
+                raise ValueError("resuming needs uncompressed DATA")
+            self.start_options[OPT_COMPRESS] = bytes([compress.METHODS[compress_method]])
+            if compress_level is None:
+                self.compress_level = compress.DEFAULT_LEVELS[compress_method]
+        if resume_id is not None:
+            if not isinstance(data, (bytes, bytearray, memoryview)):
+                raise ValueError("resuming needs a bytes-like input (a regular file, memory-mapped)")
+            self.resume_option = RESUME.pack(resume.transfer_id(resume_id), resume.fingerprint(data))
+            self.start_options[OPT_RESUME] = self.resume_option
+
+    def start_packet(self):
+        """START with the proposal; START and its ACK always use the default checksum, the rest what they agree on"""
+        self.start_options[OPT_PACKET_SIZE] = PACKET_SIZE.pack(self.max_packet_size)
+        return build_packet(config.message_type.START, 0, encode_options(self.start_options))
+
+    def accept_start(self, pkt):
+        """Take the receiver's answer if pkt is the START ACK; returns True once DATA may go out"""
+        parsed = verify_packet(pkt)
+        if parsed is None:
+            return False
+        pkt_type, ack_num, payload = parsed
+        if pkt_type != config.message_type.ACK or ack_num != 1:
+            return False
+        # Receivers that don't know the option answer without it: default checksum
+        options = decode_options(payload)
+        if options.get(OPT_CHECKSUM):
+            self.checksum_name, self.checksum = integrity.by_id(options[OPT_CHECKSUM][0])
+        else:
+            self.checksum_name, self.checksum = integrity.DEFAULT, integrity.ALGORITHMS[integrity.DEFAULT]
+        # Receivers that don't answer the size option use the default payload size
+        self.packet_size = config.packet_size
+        if len(options.get(OPT_PACKET_SIZE, b"")) == PACKET_SIZE.size:
+            self.packet_size = max(1, min(self.max_packet_size, PACKET_SIZE.unpack(options[OPT_PACKET_SIZE])[0]))
+        self.peer_window = WINDOW.unpack(options[OPT_WINDOW])[0] if len(options.get(OPT_WINDOW, b"")) == WINDOW.size else None
+        self.peer_features = FEATURES.unpack(options[OPT_FEATURES])[0] if len(options.get(OPT_FEATURES, b"")) == FEATURES.size else None
+        # FEC only runs if the receiver echoed the proposal
+        self.fec_encoder = None
+        if len(options.get(OPT_FEC, b"")) == FEC_PARAMS.size:
+            scheme_id, k, m = FEC_PARAMS.unpack(options[OPT_FEC])
+            if fec.valid(fec.SCHEME_NAMES.get(scheme_id), k, m):
+                self.fec_encoder = fec.Encoder(fec.SCHEME_NAMES[scheme_id], k, m, self.packet_size)
+        self.compress_method = None
+        if options.get(OPT_COMPRESS):
+            self.compress_method = compress.METHOD_NAMES.get(options[OPT_COMPRESS][0])
+            if self.packet_size < compress.FRAME.size:
+                # A frame's header must fit the packet that starts it
+                print(f"{self.packet_size}-byte packets are too small for compressed frames, sending uncompressed")
+                self.compress_method = None
+        # The receiver's checkpoint of this transfer: first missing packet, then ranges it holds beyond
+        first_seq = 1
+        self.resume_skip = set()
+        reply = options.get(OPT_RESUME, b"")
+        if self.resume_option is not None and reply[:RESUME.size] == self.resume_option and len(reply) >= RESUME.size + RESUME_BASE.size:
+            first_seq = max(1, RESUME_BASE.unpack_from(reply, RESUME.size)[0])
+            self.resume_skip = {seq for start, end in decode_sack_ranges(reply[RESUME.size + RESUME_BASE.size:]) for seq in range(start, end)}
+        if tracing.level >= tracing.EVENTS:
+            tracing.record(tracing.START, 0, integrity.ALGORITHM_IDS[self.checksum_name])
+        self.seq_num = first_seq
+        self.base = first_seq
+        self.stats.restart()
+        return True
+
+    def begin(self):
+        """Size the window and congestion control from the START answer (after accept_start)"""
+        # Never run ahead of what the receiver buffers
+        window_size = min(self.window_size, self.peer_window) if self.peer_window else self.window_size
+        self.congestion = make_controller(self.cc, window_size)
+        # Selective ACKs let new data go out past a hole, up to the 2 * window_size
+        # the receiver accepts; one more slot for END
+        self.window = SendWindow(2 * window_size + 1, self.base)
+        # A resumed transfer starts past the packets the receiver already has
+        self.num_packet = self.base - 1
+        if self.base > 1 or self.resume_skip:
+            self.data = self.data[self.num_packet * self.packet_size:]
+            self.stats.counters["packets_resumed"] = self.num_packet + len(self.resume_skip)
+            print(f"Resuming at packet {self.base}, {len(self.resume_skip)} more already received")
+
+    def payloads(self):
+        """Iterator of the DATA payloads still to send (after begin).
+
+        Payloads are pulled from the input only when the window has room,
+        compressed frames from a worker thread if the receiver agreed to them.
+        """
+        if self.compress_method is not None:
+            # Blocks of at least 8 packets keep the padding of each frame small
+            self.compression = compress.Compressor(self.data, self.compress_method, self.compress_level,
+                                                   max(config.compress_block, 8 * self.packet_size), self.packet_size)
+            return iter(self.compression)
+        return iter_chunks(self.data, self.packet_size)
+
+    def room(self):
+        """New packets the congestion window and the ring have space for"""
+        return min(self.congestion.window() - self.ws, self.window.free())
+
+    def all_acked(self):
+        """Every DATA packet handed to send_new so far is acknowledged"""
+        return self.base > self.num_packet
+
+    def complete(self):
+        """Every DATA packet up to the end of the input was acknowledged"""
+        return not self.transfer_failed and (self.end_received or (self.input_done and self.all_acked()))
+
+    def finish(self):
+        """Stop the transfer (idempotent)"""
+        self.is_running = False
+        self.stats.finish()
+
+    def packet_for(self, seq, data):
+        """Rebuild the packet for seq; only the payload view is kept in the window"""
+        if seq > self.num_packet:
+            return build_packet(config.message_type.END, seq, checksum=self.checksum)
+        return build_packet(config.message_type.DATA, seq, data, checksum=self.checksum)
+
+    def encode(self, chunks):
+        """DATA packets of new payloads numbered from seq_num, and the parity of the blocks they complete.
+
+        Only the sending side calls this, so it may run outside the lock.
+        """
+        first = self.seq_num
+        checksum = self.checksum
+        # Packets a resumed transfer's receiver already holds only pass through the window
+        fresh = [(seq, data) for seq, data in enumerate(chunks, first) if seq not in self.resume_skip] if self.resume_skip else enumerate(chunks, first)
+        # Encode header and payload into one buffer per packet, checksum included
+        packets = [build_packet(config.message_type.DATA, seq, data, checksum=checksum) for seq, data in fresh]
+        # Parity of every block these packets complete goes out right behind them
+        parity = []
+        if self.fec_encoder is not None:
+            parity = [build_packet(config.message_type.PARITY, parity_seq, payload, checksum=checksum)
+                      for seq, data in enumerate(chunks, first) for parity_seq, payload in self.fec_encoder.add(seq, data)]
+        return packets, parity
+
+    def send_new(self, chunks, packets, parity, now):
+        """Send what encode(chunks) built and put the payloads in the window (lock held).
+
+        Returns True if a retransmission deadline earlier than all others was armed.
+        """
+        first = self.seq_num
+        self.num_packet += len(chunks)
+        self.send_batch(packets)
+        for packet in parity:
+            self.send(packet)
+        earliest = False
+        trace_sends = tracing.level >= tracing.PACKETS
+        resume_skip = self.resume_skip
+        bytes_sent = 0
+        for seq, data in enumerate(chunks, first):
+            if seq in resume_skip:
+                self.window.add(seq, data, now)
+                self.window.ack(seq)
+                continue
+            if trace_sends:
+                tracing.record(tracing.SEND, seq, len(data))
+            self.window.add(seq, data, now)
+            bytes_sent += len(data)
+            if self.retransmit_timers.schedule(seq, now + self.rto_estimator.rto):
+                earliest = True
+        self.seq_num += len(chunks)
+        self.ws += len(packets)
+        self.stats.counters["packets_sent"] += len(packets)
+        self.stats.counters["bytes_sent"] += bytes_sent
+        self.stats.counters["fec_parity_sent"] += len(parity)
+        self.stats.histograms["inflight_packets"].add(self.ws)
+        return earliest
+
+    def send_end(self, now):
+        """Send END and keep it in the window until acknowledged (lock held); True if its deadline is the earliest"""
+        self.send(build_packet(config.message_type.END, self.seq_num, checksum=self.checksum))
+        slot = self.window.add(self.seq_num, b"", now)
+        self.seq_num += 1
+        return self.retransmit_timers.schedule(self.seq_num - 1, slot.sent_at + self.rto_estimator.rto)
+
+    def retransmit(self, seq, reason, now):
+        """Send seq again and rearm its timer (lock held)"""
+        if tracing.level >= tracing.EVENTS:
+            tracing.record(tracing.RETRANSMIT, seq, reason)
+        counters = self.stats.counters
+        counters["retransmits"] += 1
+        counters[transport_stats.RETRANSMIT_COUNTERS[reason]] += 1
+        slot = self.window[seq]
+        self.send(self.packet_for(seq, slot.payload))
+        slot.retransmitted = True
+        slot.sent_at = now
+        self.retransmit_timers.schedule(seq, now + self.rto_estimator.rto)
+
+    def next_deadline(self):
+        """Earliest retransmission deadline, None if nothing is in flight"""
+        return self.retransmit_timers.next_deadline()
+
+    def expire(self, now):
+        """Retransmit every packet whose deadline passed (lock held)"""
+        expired = [seq for seq in self.retransmit_timers.pop_expired(now) if seq in self.window]
+        if expired and now >= self.backoff_until:
+            # Packets time out one by one; back off once per RTO, not per packet
+            self.rto_estimator.backoff()
+            self.congestion.on_timeout(now)
+            self.backoff_until = now + self.rto_estimator.rto
+            self.recovery_point = None
+            self.stats.counters["timeouts"] += 1
+            if tracing.level >= tracing.EVENTS:
+                tracing.record(tracing.TIMEOUT, expired[0], int(self.rto_estimator.rto * 1000))
+        for seq in expired:
+            self.retransmit(seq, tracing.RTX_TIMEOUT, now)
+
+    def fec_pending(self, seq, highest_sacked):
+        """The receiver may still rebuild seq from its block's parity: nothing beyond the block was SACKed yet"""
+        return self.fec_encoder is not None and self.fec_encoder.protected(seq) and highest_sacked <= self.fec_encoder.block_last(seq)
+
+    def ack_packet(self, seq):
+        """Remove an acknowledged packet from the window (lock held).
+
+        Returns its send time if it yields a valid RTT sample, else None.
+        """
+        self.retransmit_timers.cancel(seq)
+        slot = self.window.ack(seq)
+        if slot is None:
+            return None
+        self.ws = max(0, self.ws - 1)
+        if slot.retransmitted:
+            # Karn's rule: can't tell which transmission this ACK is for
+            return None
+        return slot.sent_at
+
+    def fast_recovery(self, ack_num, ack_type, ranges, now):
+        """Duplicate-ACK loss detection and recovery (lock held).
+
+        dupack_threshold repeats of the same cumulative ACK retransmit the missing
+        packet right away and start recovery until everything sent so far is
+        acknowledged. Inside recovery a partial ACK retransmits the next missing
+        packet (unless already resent in this recovery), and SACKed packets free window space so new data keeps flowing.
+        Holes with at least dupack_threshold SACKed packets above them are
+        retransmitted once per recovery. With FEC, holes the parity of their block
+        may still fill wait until packets beyond that block are SACKed.
+        """
+        highest_sacked = max((end - 1 for _, end in ranges), default=0)
+        window = self.window
+        if ack_num > self.last_ack:
+            self.dup_acks = 0
+            self.last_ack = ack_num
+            if self.recovery_point is not None:
+                if ack_num > self.recovery_point:
+                    self.recovery_point = None
+                elif ack_num in window and ack_num >= self.loss_scan and not self.fec_pending(ack_num, highest_sacked):
+                    # Not covered by the SACK hole scan yet
+                    self.retransmit(ack_num, tracing.RTX_PARTIAL_ACK, now)
+                    self.loss_scan = ack_num + 1
+        elif ack_num == self.last_ack and ack_num in window and not self.fec_pending(ack_num, highest_sacked):
+            # Duplicates only count once the hole is beyond FEC repair
+            self.dup_acks += 1
+            self.stats.counters["dup_acks"] += 1
+            if self.dup_acks == self.dupack_threshold and self.recovery_point is None:
+                self.recovery_point = self.seq_num - 1
+                self.loss_scan = ack_num + 1
+                self.congestion.on_loss(now)
+                self.stats.counters["fast_retransmits"] += 1
+                if tracing.level >= tracing.EVENTS:
+                    tracing.record(tracing.FAST_RETRANSMIT, ack_num, self.dup_acks)
+                self.retransmit(ack_num, tracing.RTX_DUPACK, now)
+        if self.recovery_point is None or ack_type != config.message_type.SACK:
+            return
+        limit = highest_sacked - self.dupack_threshold + 1
+        # loss_scan is already past ack_num unless a partial ACK left that hole to FEC
+        for seq in range(max(self.loss_scan, ack_num), limit):
+            if self.fec_pending(seq, highest_sacked):
+                limit = seq  # Scanned again once the block's parity had its chance
+                break
+            if seq in window:
+                self.retransmit(seq, tracing.RTX_SACK_HOLE, now)
+        self.loss_scan = max(self.loss_scan, limit)
+
+    def on_reset(self, payload):
+        """The receiver has no session for us: the transfer is over, one way or the other (lock held)"""
+        if len(payload) == RESET_REASON.size and RESET_REASON.unpack(payload)[0] == RESET_FAILED:
+            self.transfer_failed = True
+            print(f"Receiver could not decode this transfer, giving up at packet {self.base}")
+        elif self.input_done and self.all_acked():
+            print("Receiver dropped the session after every packet was acknowledged, END ACK lost")
+        else:
+            print(f"Receiver has no session for this transfer (evicted or restarted), giving up at packet {self.base}")
+        self.finish()
+
+    def on_packet(self, pkt, now):
+        """Process a packet from the receiver (lock held).
+
+        Returns True if it acknowledged packets, freeing window space. The END
+        ACK and RESET end the transfer: is_running turns False.
+        """
+        # RESET comes from a receiver without our session, so it cannot know the agreed checksum
+        parsed = verify_packet(pkt, self.checksum)
+        if parsed is None and len(pkt) >= HEADER_SIZE and decode_header(pkt)[0] == config.message_type.RESET:
+            parsed = verify_packet(pkt)
+        if parsed is None:
+            self.stats.counters["checksum_failures"] += 1
+            if tracing.level >= tracing.EVENTS:
+                tracing.record(tracing.CHECKSUM_FAIL, 0, len(pkt))
+            return False
+        ack_type, ack_num, payload = parsed
+
+        if ack_type == config.message_type.RESET:
+            self.on_reset(payload)
+            return False
+        if ack_type != config.message_type.ACK and ack_type != config.message_type.SACK:
+            return False
+
+        self.stats.counters["sacks_received" if ack_type == config.message_type.SACK else "acks_received"] += 1
+        if tracing.level >= tracing.PACKETS:
+            tracing.record(tracing.ACK, ack_num, len(payload) // SACK_RANGE.size)
+        if ack_num < self.base:
+            return False
+
+        window = self.window
+        seq_num = self.seq_num
+        # ACK numbers are cumulative: every packet below ack_num has arrived
+        newly_acked = [seq for seq in range(self.base, min(ack_num, seq_num)) if seq in window]
+        # SACK ranges: packets the receiver holds beyond the cumulative ACK
+        ranges = []
+        if ack_type == config.message_type.SACK:
+            ranges = list(decode_sack_ranges(payload))
+            for start, end in ranges:
+                newly_acked.extend(seq for seq in range(max(start, ack_num), min(end, seq_num)) if seq in window)
+        if newly_acked:
+            # The most recently sent packet is the one that triggered this ACK
+            sent_times = [t for t in map(self.ack_packet, newly_acked) if t is not None]
+            rtt = None
+            if sent_times:
+                rtt = now - max(sent_times)
+                self.rto_estimator.sample(rtt)
+                self.stats.histograms["rtt_ms"].add(rtt * 1000)
+            self.congestion.on_ack(len(newly_acked), now, rtt)
+        self.fast_recovery(ack_num, ack_type, ranges, now)
+        # The ring slides its base past every acknowledged packet
+        self.base = window.base
+        # Everything below base has been delivered in order
+        self.stats.counters["bytes_acked"] = min((self.base - 1) * self.packet_size, self.stats.counters["bytes_sent"])
+
+        # Handle END message acknowledgment
+        if self.num_packet + 2 == ack_num:
+            if tracing.level >= tracing.EVENTS:
+                tracing.record(tracing.END, ack_num)
+            print(f"seq num of END message :{ack_num}")
+            print("All packets including END message acknowledged")
+            self.end_received = True
+            self.finish()
+        return bool(newly_acked)
+
+    def report(self):
+        """Print what the transfer ended up using (after begin)"""
+        print(f"Final {self.rto_estimator}, {self.congestion}, checksum {self.checksum_name}, {self.packet_size}-byte packets")
+        if self.peer_features is not None:
+            print(f"Receiver features: {', '.join(name for bit, name in FEATURE_NAMES.items() if self.peer_features & bit) or 'none'}")
+        if self.fec_encoder is not None:
+            print(self.fec_encoder)
+        if self.compression is not None:
+            self.stats.counters["bytes_uncompressed"] = self.compression.raw_bytes
+            print(f"Compression {self.compression}")
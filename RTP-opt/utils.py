@@ -1,17 +1,248 @@
-import binascii
+import mmap
+import os
+import select
+import stat
+import struct
+import sys
 
-from scapy.all import Packet, IntField
+import config
+from integrity import crc32
 
+# Wire layout of the 16-byte header: type, seq_num, length, checksum (network order)
+HEADER = struct.Struct("!IIII")
+HEADER_SIZE = HEADER.size
+CHECKSUM_OFFSET = 12
 
-class PacketHeader(Packet):
-    name = "PacketHeader"
-    fields_desc = [
-        IntField("type", 0),
-        IntField("seq_num", 0),
-        IntField("length", 0),
-        IntField("checksum", 0),
-    ]
+# SACK payload: list of [start, end) sequence ranges held by the receiver
+SACK_RANGE = struct.Struct("!II")
 
+# START and START ACK payload: options as (kind, length, value) records, unknown kinds are skipped
+OPTION = struct.Struct("!BB")
+OPT_STRIPE_OFFSET = 1  # Byte offset of a stripe in the output file (STRIPE_OFFSET)
+OPT_CHECKSUM = 2  # Checksum algorithm id (integrity.ALGORITHM_IDS), one byte
+OPT_FEC = 3  # Parity scheme, block size and parity packets per block (FEC_PARAMS)
+OPT_COMPRESS = 4  # Compression method id (compress.METHODS), one byte: DATA carries compress.FRAME frames
+OPT_PACKET_SIZE = 5  # DATA payload size (PACKET_SIZE): the sender's largest, answered with the agreed one
+OPT_WINDOW = 6  # Window in packets (WINDOW): the sender's, answered with the receiver's
+OPT_FEATURES = 7  # FEATURE_* bits (FEATURES) the sender implements, answered with those both do
+OPT_RESUME = 8  # Transfer ID and fingerprint (RESUME), answered with them + RESUME_BASE + SACK_RANGE records (resume.py)
+STRIPE_OFFSET = struct.Struct("!Q")
+FEC_PARAMS = struct.Struct("!BBB")  # fec.SCHEMES id, k, m
+PACKET_SIZE = struct.Struct("!H")
+WINDOW = struct.Struct("!I")
+FEATURES = struct.Struct("!I")
+RESUME = struct.Struct("!16s16s")  # resume.transfer_id, resume.fingerprint
+RESUME_BASE = struct.Struct("!I")  # First packet the receiver misses
+RESUME_MAX_RANGES = (255 - RESUME.size - RESUME_BASE.size) // SACK_RANGE.size  # Held ranges that fit the option
+FEATURE_SACK = 1  # Receiver reports held ranges in SACK packets
+FEATURE_FEC = 2  # Receiver can rebuild from PARITY packets (OPT_FEC)
+FEATURE_COMPRESS = 4  # Receiver can decode compressed frames (OPT_COMPRESS)
+FEATURE_PROBE = 8  # Receiver echoes PROBE packets
+FEATURE_RESUME = 16  # Receiver checkpoints transfers and resumes them (OPT_RESUME)
+# RESET payload: why the receiver has no session for the peer (empty from receivers that predate it: RESET_UNKNOWN)
+RESET_REASON = struct.Struct("!B")
+RESET_UNKNOWN = 0  # No session for this address (evicted, restarted, never saw START)
+RESET_FAILED = 1  # The session failed on data that does not decode; the transfer cannot complete
+FEATURE_NAMES = {FEATURE_SACK: "sack", FEATURE_FEC: "fec", FEATURE_COMPRESS: "compress", FEATURE_PROBE: "probe", FEATURE_RESUME: "resume"}
 
-def compute_checksum(pkt):
-    return binascii.crc32(bytes(pkt)) & 0xFFFFFFFF
\ No newline at end of file
+_pack_checksum_into = struct.Struct("!I").pack_into
+_ZERO_CHECKSUM = bytes(4)
+
+
+def decode_header(pkt):
+    """Return (type, seq_num, length, checksum) without building any object"""
+    return HEADER.unpack_from(pkt)
+
+
+def build_packet(pkt_type, seq_num, data=b"", buf=None, checksum=crc32):
+    """Encode header + data (checksum included) into buf, or a new bytearray.
+
+    checksum is an integrity function (None leaves the field at 0).
+    Returns a memoryview over the encoded packet.
+    """
+    size = HEADER_SIZE + len(data)
+    if buf is None:
+        buf = bytearray(size)
+    HEADER.pack_into(buf, 0, pkt_type, seq_num, len(data), 0)
+    buf[HEADER_SIZE:size] = data
+    packet = memoryview(buf)[:size]
+    if checksum is not None:
+        _pack_checksum_into(buf, CHECKSUM_OFFSET, checksum(packet) & 0xFFFFFFFF)
+    return packet
+
+
+def encode_sack_ranges(ranges):
+    """Payload of a SACK packet for a list of (start, end) ranges"""
+    payload = bytearray(SACK_RANGE.size * len(ranges))
+    for i, (start, end) in enumerate(ranges):
+        SACK_RANGE.pack_into(payload, i * SACK_RANGE.size, start, end)
+    return payload
+
+
+def decode_sack_ranges(payload):
+    """Iterate the (start, end) ranges carried by a SACK payload"""
+    usable = len(payload) - len(payload) % SACK_RANGE.size
+    return SACK_RANGE.iter_unpack(payload[:usable])
+
+
+def verify_packet(pkt, checksum=crc32):
+    """Check a received packet.
+
+    The checksum is computed incrementally over the header (with a zeroed
+    checksum field) and the payload view, nothing is copied. With
+    checksum=None only the length is checked.
+    Returns (type, seq_num, payload) with payload as a memoryview into pkt,
+    or None if the packet is truncated or its checksum does not match.
+    """
+    if len(pkt) < HEADER_SIZE:
+        return None
+    pkt_type, seq_num, length, received_checksum = HEADER.unpack_from(pkt)
+    if len(pkt) < HEADER_SIZE + length:
+        return None
+    view = memoryview(pkt)
+    payload = view[HEADER_SIZE:HEADER_SIZE + length]
+    if checksum is None:
+        return pkt_type, seq_num, payload
+    crc = checksum(view[:CHECKSUM_OFFSET])
+    crc = checksum(_ZERO_CHECKSUM, crc)
+    crc = checksum(payload, crc)
+    if crc & 0xFFFFFFFF != received_checksum:
+        return None
+    return pkt_type, seq_num, payload
+
+
+def encode_options(options):
+    """START payload for a {kind: value bytes} dict"""
+    payload = bytearray()
+    for kind, value in options.items():
+        payload += OPTION.pack(kind, len(value))
+        payload += value
+    return bytes(payload)
+
+
+def decode_options(payload):
+    """{kind: value} of a START payload; a truncated last record is dropped"""
+    options = {}
+    pos = 0
+    while pos + OPTION.size <= len(payload):
+        kind, length = OPTION.unpack_from(payload, pos)
+        pos += OPTION.size
+        if pos + length > len(payload):
+            break
+        options[kind] = bytes(payload[pos:pos + length])
+        pos += length
+    return options
+
+
+def open_input(path=None):
+    """Return the input to send.
+
+    Regular files (path, or stdin redirected from a file) are memory-mapped and
+    returned as a memoryview so pages are read lazily by the kernel instead of
+    being copied into the heap. Pipes, FIFOs and the like are returned as the
+    open binary file and streamed by iter_chunks.
+    """
+    f = open(path, "rb") if path else sys.stdin.buffer
+    st = os.fstat(f.fileno())
+    if not stat.S_ISREG(st.st_mode):
+        return f
+    try:
+        if st.st_size == 0:
+            return memoryview(b"")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        return memoryview(mm)
+    finally:
+        if path:
+            f.close()
+
+
+class StreamChunks:
+    """packet_size payloads of a pipe, FIFO or socket file, read as the data arrives.
+
+    Only whole payloads come out (the receiver places packet n at
+    (n - 1) * packet_size), but next() waits for no more than one, and
+    ready() tells without blocking whether the next one is already there, so
+    the sender sends what it has instead of holding it back to fill a batch.
+    """
+
+    READ_SIZE = 1 << 16  # Bytes asked for per read; a pipe returns what it holds
+
+    def __init__(self, f, size=config.packet_size):
+        self.fd = f.fileno()
+        self.read = getattr(f, "read1", f.read)  # At most one read syscall, returns what is available
+        self.size = size
+        self.pending = bytearray()
+        self.eof = False
+
+    def __iter__(self):
+        return self
+
+    def _read(self):
+        piece = self.read(max(self.size, self.READ_SIZE))
+        if piece:
+            self.pending += piece
+        else:
+            self.eof = True
+
+    def ready(self):
+        """The next payload (or the end of the input) is available without blocking"""
+        while len(self.pending) < self.size and not self.eof:
+            if not select.select([self.fd], [], [], 0)[0]:
+                return False
+            self._read()
+        return True
+
+    def __next__(self):
+        while len(self.pending) < self.size and not self.eof:
+            self._read()
+        if not self.pending:
+            raise StopIteration
+        chunk = bytes(self.pending[:self.size])
+        del self.pending[:self.size]
+        return chunk
+
+
+def iter_chunks(data, size=config.packet_size):
+    """Iterator of packet_size payloads of data, pulled as the sender asks for them.
+
+    data can be bytes-like (sliced without copying), a binary file object
+    (read incrementally, e.g. a pipe: a StreamChunks when it has a
+    descriptor) or any iterable of bytes such as a generator (regrouped into
+    full packets).
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
+        return _slices(memoryview(data), size)
+    if hasattr(data, "read"):
+        try:
+            return StreamChunks(data, size)
+        except (AttributeError, OSError, ValueError):  # No descriptor (io.BytesIO...)
+            return _read_chunks(data, size)
+    return _regroup(data, size)
+
+
+def _slices(data, size):
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+def _read_chunks(f, size):
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _regroup(pieces, size):
+    pending = bytearray()
+    for piece in pieces:
+        pending += piece
+        while len(pending) >= size:
+            yield bytes(pending[:size])
+            del pending[:size]
+    if pending:
+        yield bytes(pending)
@@ -0,0 +1,265 @@
+"""Throughput/latency benchmark of the transport implementations over loopback.
+
+Every combination of implementation, message content (random bytes or
+compressible JSON log lines), message size, window size and error
+profile is run --repeat times. A run starts the receiver, the network
+emulator (netem.py, or proxy.py with --emulator proxy; none for the "none"
+profile) and the sender, and records:
+
+    seconds              sender start to exit (0 if it timed out)
+    goodput_mbit_s       message bits / seconds
+    retransmission_ratio extra DATA transmissions / DATA packets, counted
+                         from the emulator log, or from the sender's JSON stats
+                         on direct runs (null if neither is available)
+    cpu_s_per_mb         user + system CPU of sender and receiver per MB
+
+Results are written as JSON lines (one metadata line, then one line per run)
+so runs of different commits can be compared:
+
+    python3 bench.py --output before.jsonl
+    python3 bench.py --output after.jsonl
+    python3 bench.py --compare before.jsonl after.jsonl
+
+--sender-args passes options to the sender of the RTP-opt runs, e.g.
+--sender-args="--compress zlib" --content random,logs.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+EMULATORS = {name: os.path.join(ROOT, "test_scripts", name + ".py") for name in ("netem", "proxy")}
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text):
+    """'24K' -> 24576"""
+    text = text.strip().upper()
+    if text[-1] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def log_lines(size, rng):
+    """Compressible message: JSON log lines"""
+    out = bytearray()
+    while len(out) < size:
+        out += json.dumps({"ts": 1700000000 + len(out) // 100, "level": rng.choice(["INFO", "INFO", "WARN", "ERROR"]),
+                           "service": rng.choice(["api", "auth", "billing"]), "latency_ms": rng.randint(1, 500),
+                           "path": f"/v1/items/{rng.randint(1, 10000)}"}).encode() + b"\n"
+    return bytes(out[:size])
+
+
+def make_message(directory, size, seed, content="random"):
+    """Deterministic message of size bytes: random bytes or JSON log lines"""
+    path = os.path.join(directory, f"message_{content}_{size}_{seed}.bin")
+    if not os.path.exists(path):
+        rng = random.Random(seed)
+        with open(path, "wb") as f:
+            f.write(rng.randbytes(size) if content == "random" else log_lines(size, rng))
+    return path
+
+
+def wait_cpu(proc, timeout):
+    """Wait for proc (killing it after timeout); returns (exited in time, CPU seconds)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return True, usage.ru_utime + usage.ru_stime
+        time.sleep(0.01)
+    proc.kill()
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return False, usage.ru_utime + usage.ru_stime
+
+
+def proxy_retransmissions(log_path):
+    """(DATA transmissions, distinct DATA packets) seen by the proxy"""
+    sent = 0
+    seqs = set()
+    with open(log_path, errors="replace") as f:
+        for line in f:
+            if "DATA:" in line:
+                sent += 1
+                seqs.add(line.rsplit(":", 1)[1].strip())
+    return sent, len(seqs)
+
+
+def sender_stats_retransmissions(log_path):
+    """(DATA transmissions, DATA packets) from the sender's JSON stats, or None"""
+    with open(log_path, errors="replace") as f:
+        for line in f:
+            if line.startswith("{") and '"role": "sender"' in line:
+                counters = json.loads(line)["counters"]
+                return counters["packets_sent"] + counters["retransmits"], counters["packets_sent"]
+    return None
+
+
+def run_once(impl, message, size, window, errors, timeout, workdir, emulator=("netem", []), sender_args=()):
+    impl_dir = os.path.join(ROOT, impl)
+    recv_port = free_port()
+    output = os.path.join(workdir, "output.bin")
+    sender_log = os.path.join(workdir, "sender.log")
+    proxy_log = os.path.join(workdir, "proxy.log")
+
+    with open(output, "wb") as out, open(os.devnull, "wb") as devnull:
+        receiver = subprocess.Popen([sys.executable, os.path.join(impl_dir, "receiver.py"), "127.0.0.1", str(recv_port), str(window)],
+                                    stdout=out, stderr=devnull, cwd=impl_dir)
+    time.sleep(0.3)
+    proxy = None
+    send_port = recv_port
+    if errors != "none":
+        send_port = free_port()
+        with open(proxy_log, "wb") as log:
+            name, extra = emulator
+            proxy = subprocess.Popen([sys.executable, EMULATORS[name], "127.0.0.1", str(send_port), "127.0.0.1", str(recv_port), errors, *extra],
+                                     stdout=log, stderr=subprocess.DEVNULL)
+        time.sleep(0.3)
+
+    started = time.monotonic()
+    with open(message, "rb") as stdin, open(sender_log, "wb") as log:
+        sender = subprocess.Popen([sys.executable, os.path.join(impl_dir, "sender.py"), "127.0.0.1", str(send_port), str(window), *sender_args],
+                                  stdin=stdin, stdout=log, stderr=subprocess.STDOUT, cwd=impl_dir)
+    finished, cpu_sender = wait_cpu(sender, timeout)
+    seconds = time.monotonic() - started
+    _, cpu_receiver = wait_cpu(receiver, 1.0)
+    if proxy is not None:
+        # SIGINT lets the emulator flush its log on the way out
+        proxy.send_signal(signal.SIGINT)
+        try:
+            proxy.wait(2)
+        except subprocess.TimeoutExpired:
+            proxy.kill()
+            proxy.wait()
+
+    with open(message, "rb") as a, open(output, "rb") as b:
+        ok = finished and a.read() == b.read()
+    counts = proxy_retransmissions(proxy_log) if proxy is not None else sender_stats_retransmissions(sender_log)
+    ratio = None
+    if counts and counts[1]:
+        ratio = round((counts[0] - counts[1]) / counts[1], 4)
+    return {
+        "impl": impl,
+        "size": size,
+        "window": window,
+        "errors": errors,
+        "ok": ok,
+        "timed_out": not finished,
+        "seconds": round(seconds, 4),
+        "goodput_mbit_s": round(size * 8 / seconds / 1e6, 3) if ok else 0.0,
+        "retransmission_ratio": ratio,
+        "retransmission_source": None if ratio is None else ("proxy" if proxy is not None else "sender_stats"),
+        "cpu_s_sender": round(cpu_sender, 4),
+        "cpu_s_receiver": round(cpu_receiver, 4),
+        "cpu_s_per_mb": round((cpu_sender + cpu_receiver) / (size / 1e6), 4) if size else None,
+    }
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "type": "meta",
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "timeout": args.timeout,
+        "emulator": args.emulator,
+        "link": args.link,
+        "sender_args": args.sender_args,
+    }
+
+
+def key(run):
+    return run["impl"], run.get("content", "random"), run["size"], run["window"], run["errors"]
+
+
+def load(path):
+    runs = {}
+    with open(path) as f:
+        for line in f:
+            run = json.loads(line)
+            if run.get("type") != "meta":
+                runs.setdefault(key(run), []).append(run)
+    return runs
+
+
+def compare(before_path, after_path):
+    """Median time of every configuration in both files and its change"""
+    before, after = load(before_path), load(after_path)
+    print(f"{'impl':8s} {'content':7s} {'size':>10s} {'window':>6s} {'errors':>6s} {'before s':>9s} {'after s':>9s} {'change':>8s}")
+    for k in sorted(before.keys() & after.keys()):
+        b = statistics.median(r["seconds"] if r["ok"] else float("inf") for r in before[k])
+        a = statistics.median(r["seconds"] if r["ok"] else float("inf") for r in after[k])
+        change = f"{(a - b) / b * 100:+7.1f}%" if b not in (0, float("inf")) and a != float("inf") else "    n/a"
+        print(f"{k[0]:8s} {k[1]:7s} {k[2]:10d} {k[3]:6d} {k[4]:>6s} {b:9.3f} {a:9.3f} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RTP implementations over loopback")
+    parser.add_argument("--impls", default="RTP-base,RTP-opt", help="Comma separated implementation directories")
+    parser.add_argument("--content", default="random", help="Comma separated message contents: random, logs (compressible)")
+    parser.add_argument("--sender-args", default="", help="Extra options of the RTP-opt sender, e.g. '--compress zlib'")
+    parser.add_argument("--sizes", default="24K,256K", help="Comma separated message sizes (K/M/G suffixes)")
+    parser.add_argument("--windows", default="16,128", help="Comma separated window sizes")
+    parser.add_argument("--errors", default="none,0123", help="Comma separated error types of the emulator, none: no emulator")
+    parser.add_argument("--emulator", choices=sorted(EMULATORS), default="netem", help="netem.py (seeded, concurrent) or the turn-based proxy.py")
+    parser.add_argument("--link", default="", help="Extra netem.py options shaping the link, e.g. '--rate 100 --delay 5'")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds before a sender is killed and the run marked failed")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the generated messages")
+    parser.add_argument("--output", default="-", help="JSON lines results file (-: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two results files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    emulator = (args.emulator, ["--seed", str(args.seed), *args.link.split()] if args.emulator == "netem" else [])
+    out = sys.stdout if args.output == "-" else open(args.output, "w")
+    out.write(json.dumps(metadata(args)) + "\n")
+    with tempfile.TemporaryDirectory() as workdir:
+        for content, size in [(c, parse_size(s)) for c in args.content.split(",") for s in args.sizes.split(",")]:
+            message = make_message(workdir, size, args.seed, content)
+            for impl in args.impls.split(","):
+                sender_args = args.sender_args.split() if impl == "RTP-opt" else []
+                for window in map(int, args.windows.split(",")):
+                    for errors in args.errors.split(","):
+                        for _ in range(args.repeat):
+                            run = run_once(impl, message, size, window, errors, args.timeout, workdir, emulator, sender_args)
+                            run["content"] = content
+                            out.write(json.dumps(run) + "\n")
+                            out.flush()
+                            print(f"{impl:8s} {content:6s} {size:>10d} B  window {window:<5d} errors {errors:5s} "
+                                  f"{'ok ' if run['ok'] else 'FAIL'} {run['seconds']:8.3f}s {run['goodput_mbit_s']:9.3f} Mbit/s "
+                                  f"rtx {run['retransmission_ratio']}  cpu/MB {run['cpu_s_per_mb']}", file=sys.stderr)
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
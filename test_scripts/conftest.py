@@ -0,0 +1,5 @@
+# The transport is a directory of flat scripts that import each other by name, like sender.py and receiver.py do
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "RTP-opt"))
@@ -0,0 +1,289 @@
+"""Seeded, event-driven network emulator between a sender and a receiver.
+
+Drop-in replacement for proxy.py (same positional arguments and error type
+string) that forwards both directions concurrently instead of in turns of
+five packets. Every packet is scheduled for delivery on a timer heap, so a
+delayed or reordered packet never stalls the ones behind it, and all random
+decisions come from a per-direction random.Random(seed), so a run with the
+same seed and the same packet sequence applies the same impairments.
+
+Error types (the proxy's spec): after --warmup packets, --mess-rate of the
+packets in each direction get one of the listed impairments, chosen
+uniformly from the string:
+
+    1      delay the packet by --spec-delay (0.4 s)
+    2      reorder: the packet and the next ones, up to --reorder-group in
+           total (or whatever arrives within 0.1 s), go out shuffled
+    3      drop
+    other  jam: one random byte is set to "a"
+
+Pass "-" to disable them. The link itself is shaped by:
+
+    --rate        bandwidth cap in Mbit/s with a --queue-kb tail-drop queue
+    --delay       one-way delay, plus --jitter (uniform/normal/pareto)
+    --loss-p/-r   Gilbert-Elliott burst loss: good->bad and bad->good
+                  transition probabilities per packet, losing --loss /
+                  --loss-bad of the packets in each state (--loss alone is
+                  plain Bernoulli loss)
+    --reorder     probability of starting a reorder group
+    --duplicate   probability of sending a packet twice
+    --corrupt     probability of flipping one bit
+
+Jitter does not reorder packets (arrivals are kept in order, like netem with
+a rate); reordering is only what --reorder and error type 2 produce.
+
+    python netem.py localhost 50000 localhost 40000 0123 --seed 7
+    python netem.py localhost 50000 localhost 40000 - --rate 100 --delay 10 --jitter 2 --loss-p 0.01 --loss-r 0.3
+
+Every packet that arrives is logged to stdout as "Got it: <actions>. TYPE: seq",
+the proxy's format (--quiet turns it off); a JSON summary of the counters of
+each direction goes to stderr at exit.
+"""
+import argparse
+import heapq
+import json
+import random
+import selectors
+import socket
+import sys
+import time
+
+from proxy import MAX_DATAGRAM, get_seq_num
+
+REORDER_WAIT = 0.1  # Longest a reorder group waits for its packets (the proxy's socket timeout)
+COUNTERS = ("packets", "bytes", "forwarded", "delayed", "reordered", "lost", "dropped", "queue_drops",
+            "jammed", "corrupted", "duplicated")
+
+
+class Direction:
+    """One way of the link: its random state, queue, reorder group and counters"""
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.rng = random.Random(f"{args.seed}:{name}")
+        self.busy_until = 0.0  # When the link finishes serialising the queued packets
+        self.last_arrival = 0.0  # Keeps jittered arrivals in order
+        self.bad = False  # Gilbert-Elliott state
+        self.group = None  # Open reorder group: list of (arrival, packet)
+        self.group_size = 0
+        self.group_deadline = 0.0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def jitter(self):
+        args = self.args
+        if not args.jitter:
+            return 0.0
+        if args.jitter_dist == "uniform":
+            return self.rng.uniform(-args.jitter, args.jitter)
+        if args.jitter_dist == "normal":
+            return self.rng.gauss(0.0, args.jitter)
+        return args.jitter * (self.rng.paretovariate(2.5) - 1)
+
+    def lost(self):
+        """Gilbert-Elliott: move between the good and bad state, then lose with that state's probability"""
+        args = self.args
+        if self.bad:
+            if self.rng.random() < args.loss_r:
+                self.bad = False
+        elif args.loss_p and self.rng.random() < args.loss_p:
+            self.bad = True
+        p = args.loss_bad if self.bad else args.loss_good
+        return p > 0 and self.rng.random() < p
+
+    def open_group(self, now):
+        self.group = []
+        self.group_size = self.args.reorder_group
+        self.group_deadline = now + REORDER_WAIT
+
+    def close_group(self):
+        """Packets of the reorder group shuffled over the group's arrival times"""
+        group, self.group = self.group, None
+        times = sorted(t for t, _ in group)
+        packets = [pkt for _, pkt in group]
+        self.rng.shuffle(packets)
+        self.counters["reordered"] += len(packets)
+        return list(zip(times, packets))
+
+    def impair(self, pkt, now):
+        """Decide the fate of one packet; returns (log actions, [(arrival, packet), ...])"""
+        args = self.args
+        c = self.counters
+        c["packets"] += 1
+        c["bytes"] += len(pkt)
+        actions = []
+        extra = 0.0
+        grouped = self.group is not None
+
+        if (args.loss or args.loss_p) and self.lost():
+            c["lost"] += 1
+            return ["Loss"], []
+
+        if not grouped:
+            if args.error_types and c["packets"] > args.warmup and self.rng.random() < args.mess_rate:
+                mode = args.error_types[self.rng.randrange(len(args.error_types))]
+                if mode == "1":
+                    actions.append("Delay")
+                    c["delayed"] += 1
+                    extra = args.spec_delay
+                elif mode == "2":
+                    actions.append("Reorder")
+                    self.open_group(now)
+                    grouped = True
+                elif mode == "3":
+                    c["dropped"] += 1
+                    return ["Drop"], []
+                else:
+                    actions.append("Jam")
+                    c["jammed"] += 1
+                    i = self.rng.randint(0, len(pkt) - 1)
+                    pkt = pkt[:i] + b"a" + pkt[i + 1:]
+            if args.reorder and not grouped and self.rng.random() < args.reorder:
+                actions.append("Reorder")
+                self.open_group(now)
+                grouped = True
+        else:
+            actions.append("Reorder")
+        if args.corrupt and self.rng.random() < args.corrupt:
+            actions.append("Corrupt")
+            c["corrupted"] += 1
+            pkt = bytearray(pkt)
+            pkt[self.rng.randrange(len(pkt))] ^= 1 << self.rng.randrange(8)
+            pkt = bytes(pkt)
+
+        departure = now
+        if args.rate:
+            backlog = max(0.0, self.busy_until - now) * args.rate / 8
+            if backlog + len(pkt) > args.queue_kb * 1024:
+                c["queue_drops"] += 1
+                return actions + ["Queue drop"], []
+            self.busy_until = departure = max(now, self.busy_until) + len(pkt) * 8 / args.rate
+        arrival = max(departure + max(0.0, args.delay + self.jitter()), self.last_arrival)
+        self.last_arrival = arrival
+        arrival += extra
+
+        copies = [pkt]
+        if args.duplicate and self.rng.random() < args.duplicate:
+            actions.append("Duplicate")
+            c["duplicated"] += 1
+            copies.append(pkt)
+        c["forwarded"] += len(copies)
+
+        if grouped:
+            self.group.extend((arrival, p) for p in copies)
+            if len(self.group) >= self.group_size:
+                return actions, self.close_group()
+            return actions, []
+        return actions, [(arrival, p) for p in copies]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeded event-driven network emulator (proxy.py compatible)")
+    parser.add_argument("bind_addr", help="Binding address (sender address)")
+    parser.add_argument("bind_port", type=int, help="Binding port (sender port)")
+    parser.add_argument("receiver_addr", help="Receiver address")
+    parser.add_argument("receiver_port", type=int, help="Receiver port")
+    parser.add_argument("error_types", nargs="?", default="-",
+                        help="proxy.py error types (e.g. '0123'); 1: delay, 2: reorder, 3: drop, other: jam; '-': none")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of all random decisions")
+    parser.add_argument("--mess-rate", type=float, default=0.2, help="Share of packets hit by an error type")
+    parser.add_argument("--warmup", type=int, default=10, help="Packets per direction forwarded untouched before error types apply")
+    parser.add_argument("--spec-delay", type=float, default=0.4, help="Delay of error type 1 in seconds")
+    parser.add_argument("--rate", type=float, default=0, help="Bandwidth per direction in Mbit/s, 0: unlimited")
+    parser.add_argument("--queue-kb", type=float, default=256, help="Queue in front of the rate limit, tail drop beyond it")
+    parser.add_argument("--delay", type=float, default=0, help="One-way delay in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="Delay variation in ms")
+    parser.add_argument("--jitter-dist", choices=["uniform", "normal", "pareto"], default="uniform",
+                        help="uniform: +-jitter, normal: standard deviation jitter, pareto: heavy tail of scale jitter")
+    parser.add_argument("--loss", type=float, default=0, help="Bernoulli loss probability (loss in the good state)")
+    parser.add_argument("--loss-p", type=float, default=0, help="Gilbert-Elliott good->bad transition probability")
+    parser.add_argument("--loss-r", type=float, default=0.5, help="Gilbert-Elliott bad->good transition probability")
+    parser.add_argument("--loss-bad", type=float, default=1.0, help="Loss probability in the bad state")
+    parser.add_argument("--reorder", type=float, default=0, help="Probability of starting a reorder group")
+    parser.add_argument("--reorder-group", type=int, default=6, help="Packets shuffled by a reorder group")
+    parser.add_argument("--duplicate", type=float, default=0, help="Duplication probability")
+    parser.add_argument("--corrupt", type=float, default=0, help="Probability of flipping one bit")
+    parser.add_argument("--quiet", action="store_true", help="Do not log every packet")
+    args = parser.parse_args()
+    args.error_types = "" if args.error_types == "-" else args.error_types
+    args.loss_good = args.loss
+    args.rate *= 1e6
+    args.delay /= 1000
+    args.jitter /= 1000
+
+    sender_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    for s in (sender_socket, receiver_socket):
+        s.setblocking(False)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 << 20)
+    sender_socket.bind((args.bind_addr, args.bind_port))
+    receiver = (args.receiver_addr, args.receiver_port)
+    sender = [None]  # Learnt from the packets arriving on the bind socket
+
+    forward = Direction("forward", args)  # sender -> receiver
+    backward = Direction("backward", args)  # receiver -> sender
+    selector = selectors.DefaultSelector()
+    selector.register(sender_socket, selectors.EVENT_READ, forward)
+    selector.register(receiver_socket, selectors.EVENT_READ, backward)
+    events = []  # Heap of (arrival, order, packet, direction)
+    order = 0
+    log = [] if not args.quiet else None
+
+    def deliver(pkt, direction):
+        try:
+            if direction is forward:
+                receiver_socket.sendto(pkt, receiver)
+            elif sender[0] is not None:
+                sender_socket.sendto(pkt, sender[0])
+        except OSError:
+            pass
+
+    try:
+        while True:
+            deadlines = [d.group_deadline for d in (forward, backward) if d.group is not None]
+            if events:
+                deadlines.append(events[0][0])
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            for key, _ in selector.select(timeout):
+                direction = key.data
+                while True:
+                    try:
+                        pkt, address = key.fileobj.recvfrom(MAX_DATAGRAM)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except ConnectionRefusedError:  # ICMP for an earlier send, nobody listening yet
+                        continue
+                    if direction is forward and address[1] != args.receiver_port:
+                        sender[0] = address
+                    now = time.monotonic()
+                    actions, scheduled = direction.impair(pkt, now)
+                    for arrival, copy in scheduled:
+                        order += 1
+                        heapq.heappush(events, (max(arrival, now), order, copy, direction))
+                    if log is not None:
+                        pkt_type, seq_num = get_seq_num(pkt)
+                        log.append(f"Got it: {', '.join(actions) or 'No messing'}. {pkt_type}: {seq_num}\n")
+            now = time.monotonic()
+            for direction in (forward, backward):
+                if direction.group is not None and direction.group_deadline <= now:
+                    for arrival, pkt in direction.close_group():
+                        order += 1
+                        heapq.heappush(events, (max(arrival, now), order, pkt, direction))
+            while events and events[0][0] <= now:
+                _, _, pkt, direction = heapq.heappop(events)
+                deliver(pkt, direction)
+            if log:
+                sys.stdout.write("".join(log))
+                log.clear()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if log:
+            sys.stdout.write("".join(log))
+        sys.stdout.flush()
+        for direction in (forward, backward):
+            sys.stderr.write(json.dumps({"direction": direction.name, "seed": args.seed, **direction.counters}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,26 @@
 import argparse
 import random
 import socket
+import struct
 import time
 
-from scapy.all import IntField, Packet
-
-
-class PacketHeader(Packet):
-    name = "PacketHeader"
-    fields_desc = [
-        IntField("type", 0),
-        IntField("seq_num", 0),
-        IntField("length", 0),
-        IntField("checksum", 0),
-    ]
+# Same 16-byte header as the transport: type, seq_num, length, checksum
+HEADER = struct.Struct("!IIII")
+MAX_DATAGRAM = 65535  # Packet size is negotiated at START and may exceed the Ethernet MTU on loopback
 
 
 def get_seq_num(pkt):
-    if len(pkt) > 1500:
-        print("Error! Packet size exceeds 1500")
-    pkt_header = PacketHeader(pkt[:16])
+    if len(pkt) < HEADER.size:
+        return "UNKNOWN", -1
+    header_type, seq_num, _, _ = HEADER.unpack_from(pkt)
     pkt_type = "START/END"
-    if pkt_header.type == 2:
+    if header_type == 2:
         pkt_type = "DATA"
-    elif pkt_header.type == 3:
+    elif header_type == 3:
         pkt_type = "ACK"
-    return pkt_type, pkt_header.seq_num
+    elif header_type == 4:
+        pkt_type = "SACK"
+    return pkt_type, seq_num
 
 
 def main():
@@ -57,7 +52,7 @@ def main():
     ):
         def delay():
             """Delay a packet by 0.4 seconds."""
-            pkt, _ = from_socket.recvfrom(2048)
+            pkt, _ = from_socket.recvfrom(MAX_DATAGRAM)
             pkt_type, seq_num = get_seq_num(pkt)
             print(f"Got it: Delay. {pkt_type}: {seq_num}")
             time.sleep(0.4)
@@ -70,7 +65,7 @@ def main():
 
             for _ in range(num):
                 try:
-                    pkt, _ = from_socket.recvfrom(2048)
+                    pkt, _ = from_socket.recvfrom(MAX_DATAGRAM)
                     pkt_type, seq_num = get_seq_num(pkt)
                     print(f"Got it: Reorder. {pkt_type}: {seq_num}")
                     packet_list.append(pkt)
@@ -83,13 +78,13 @@ def main():
 
         def drop():
             """Drop the next available packet."""
-            pkt, _ = from_socket.recvfrom(2048)
+            pkt, _ = from_socket.recvfrom(MAX_DATAGRAM)
             pkt_type, seq_num = get_seq_num(pkt)
             print(f"Got it: Drop. {pkt_type}: {seq_num}")
 
         def jam():
             """Randomly change a byte from the packet to "a"."""
-            pkt, _ = from_socket.recvfrom(2048)
+            pkt, _ = from_socket.recvfrom(MAX_DATAGRAM)
             i = random.randint(0, len(pkt) - 1)
             pkt = pkt[:i] + b"a" + pkt[i + 1 :]
             pkt_type, seq_num = get_seq_num(pkt)
@@ -97,7 +92,7 @@ def main():
             to_socket.sendto(pkt, (to_addr, to_port))
 
         if start_stage < 10 or random.randint(1, 100) > 20:
-            pkt, address = from_socket.recvfrom(2048, socket.MSG_DONTWAIT)
+            pkt, address = from_socket.recvfrom(MAX_DATAGRAM, socket.MSG_DONTWAIT)
             if address[1] != receiver_port and address[1] != bind_port:
                 sender_port.pop(0)
                 sender_port.append(address[1])
@@ -0,0 +1,61 @@
+import os
+import zlib
+
+import pytest
+
+import compress
+
+
+def round_trip(data, method, packet_size, block_size):
+    payloads = [bytes(p) for p in compress.Compressor(data, method, compress.DEFAULT_LEVELS[method], block_size, packet_size)]
+    assert all(len(p) == packet_size for p in payloads)
+    decompressor = compress.Decompressor(method)
+    out = bytearray(len(data))
+    for payload in payloads:
+        for offset, raw in decompressor.feed(payload):
+            out[offset:offset + len(raw)] = raw
+    decompressor.finish()
+    return bytes(out)
+
+
+@pytest.mark.parametrize("method", sorted(compress.METHODS))
+@pytest.mark.parametrize("packet_size", [compress.FRAME.size, 100, 1456])
+def test_round_trip(method, packet_size):
+    # Compressible blocks, a stored (random) block and a short last block
+    data = compress.sample_logs(50000) + os.urandom(20000) + b"tail"
+    assert round_trip(data, method, packet_size, 16384) == data
+
+
+def test_empty_input_sends_no_frames():
+    assert list(compress.Compressor(b"", "zlib", 6)) == []
+
+
+def test_packet_too_short_for_a_frame_header_is_an_error():
+    # Used to be dropped silently, leaving an empty output behind a "finished" transfer
+    with pytest.raises(ValueError):
+        compress.Decompressor("zlib").feed(bytes(compress.FRAME.size - 1))
+
+
+def test_stream_ending_inside_a_frame_is_an_error():
+    payloads = [bytes(p) for p in compress.Compressor(os.urandom(5000), "zlib", 6, packet_size=1000)]
+    assert len(payloads) > 1
+    decompressor = compress.Decompressor("zlib")
+    assert decompressor.feed(payloads[0]) == []
+    with pytest.raises(ValueError):
+        decompressor.finish()
+
+
+def test_unknown_method_is_rejected():
+    frame = compress.FRAME.pack(9, 0, 10, 10) + bytes(10)
+    with pytest.raises(ValueError):
+        compress.Decompressor("zlib").feed(frame)
+
+
+def test_decompressed_size_is_bounded_by_the_header():
+    bomb = zlib.compress(bytes(16 << 20))
+    frame = compress.FRAME.pack(compress.METHODS["zlib"], 0, 1000, len(bomb)) + bomb
+    decompressor = compress.Decompressor("zlib")
+    with pytest.raises(ValueError):
+        decompressor.feed(frame)
+    # The frame state is reset, not left half-collected
+    assert decompressor.header is None and not decompressor.pending
@@ -0,0 +1,75 @@
+import itertools
+import os
+
+import pytest
+
+import fec
+
+PACKET_SIZE = 64
+
+
+def encode(scheme, k, m, payloads):
+    encoder = fec.Encoder(scheme, k, m, PACKET_SIZE)
+    return [out for seq, payload in enumerate(payloads, 1) for out in encoder.add(seq, payload)]
+
+
+def deliver(scheme, k, m, payloads, parity, lost):
+    """Feed a block minus the lost packets (0..k-1 DATA, k.. PARITY); returns {seq: payload} rebuilt"""
+    decoder = fec.Decoder(scheme, k, m, PACKET_SIZE)
+    rebuilt = []
+    for i in range(k + m):
+        if i in lost:
+            continue
+        rebuilt += decoder.add_data(i + 1, payloads[i]) if i < k else decoder.add_parity(*parity[i - k])
+    return dict(rebuilt)
+
+
+@pytest.mark.parametrize("scheme, k, m", [("xor", 4, 1), ("rs", 4, 2), ("rs", 5, 3)])
+def test_any_m_erasures_are_recovered(scheme, k, m):
+    payloads = [os.urandom(PACKET_SIZE) for _ in range(k)]
+    parity = encode(scheme, k, m, payloads)
+    assert [seq for seq, _ in parity] == list(range(m))
+    for count in range(1, m + 1):
+        for lost in itertools.combinations(range(k + m), count):
+            expected = {i + 1: payloads[i] for i in lost if i < k}
+            assert deliver(scheme, k, m, payloads, parity, set(lost)) == expected, lost
+
+
+@pytest.mark.parametrize("scheme, k, m", [("xor", 4, 1), ("rs", 4, 2)])
+def test_more_than_m_erasures_rebuild_nothing(scheme, k, m):
+    payloads = [os.urandom(PACKET_SIZE) for _ in range(k)]
+    parity = encode(scheme, k, m, payloads)
+    assert deliver(scheme, k, m, payloads, parity, set(range(m + 1))) == {}
+
+
+def test_second_block_uses_its_own_parity_seqs():
+    k, m = 3, 2
+    payloads = [os.urandom(PACKET_SIZE) for _ in range(2 * k)]
+    parity = encode("rs", k, m, payloads)
+    assert [seq for seq, _ in parity] == [0, 1, 2, 3]
+    decoder = fec.Decoder("rs", k, m, PACKET_SIZE)
+    for seq in (4, 6):
+        assert decoder.add_data(seq, payloads[seq - 1]) == []
+    assert decoder.add_parity(*parity[3]) == [(5, payloads[4])]
+
+
+def test_short_or_resumed_block_gets_no_parity():
+    payloads = [os.urandom(PACKET_SIZE) for _ in range(3)] + [b"short"]
+    assert encode("xor", 4, 1, payloads) == []
+    encoder = fec.Encoder("xor", 2, 1, PACKET_SIZE)
+    # Entered at seq 2, the middle of block 0
+    assert encoder.add(2, payloads[0]) == []
+    assert encoder.add(3, payloads[1]) == []
+    assert len(encoder.add(4, payloads[2])) == 1
+    assert encoder.protected(4)
+
+
+def test_release_forgets_delivered_blocks():
+    k = 2
+    payloads = [os.urandom(PACKET_SIZE) for _ in range(k)]
+    parity = encode("xor", k, 1, payloads)
+    decoder = fec.Decoder("xor", k, 1, PACKET_SIZE)
+    decoder.add_data(1, payloads[0])
+    decoder.release(k + 1)
+    assert decoder.blocks == {}
+    assert decoder.add_parity(*parity[0]) == []
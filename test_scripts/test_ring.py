@@ -0,0 +1,81 @@
+import pytest
+
+from ring import ReorderBuffer, SendWindow
+
+
+def test_send_window_wraps_around_its_ring():
+    window = SendWindow(5)  # Capacity 8
+    assert window.capacity == 8
+    now = 0.0
+    for seq in range(1, 6):
+        window.add(seq, b"%d" % seq, now)
+    assert window.free() == 0
+    with pytest.raises(IndexError):
+        window.add(6, b"6", now)
+    # Slide well past the capacity so slots are reused several times
+    for seq in range(6, 40):
+        assert window.ack(seq - 5).payload is None
+        window.add(seq, b"%d" % seq, now)
+        assert window.base == seq - 4
+    assert len(window) == 5
+    assert all(seq in window for seq in range(35, 40))
+    assert 34 not in window and 40 not in window
+
+
+def test_send_window_skips_selectively_acked_holes():
+    window = SendWindow(6, base=7)  # Base not aligned to the ring
+    for seq in range(7, 13):
+        window.add(seq, b"x", 1.0)
+    for seq in (9, 10, 12):
+        window.ack(seq)
+    assert window.base == 7 and len(window) == 3
+    assert window.ack(10) is None  # Already acknowledged
+    window.ack(7)
+    assert window.base == 8
+    window.ack(8)
+    assert window.base == 11  # Past the SACKed 9 and 10
+    window.ack(11)
+    assert window.base == window.end == 13 and len(window) == 0
+    assert window.free() == 6
+
+
+def test_send_window_keeps_karn_state_per_slot():
+    window = SendWindow(2)
+    slot = window.add(1, b"a", 1.0)
+    slot.retransmitted = True
+    window.ack(1)
+    assert window.add(2, b"b", 2.0).retransmitted is False
+    assert window.add(3, b"c", 3.0).retransmitted is False  # Reuses the slot of 1
+
+
+def test_reorder_buffer_holds_and_releases_in_order():
+    buf = ReorderBuffer(4)
+    assert buf.put(3, b"c") and buf.put(2, b"b")
+    assert not buf.put(3, b"c")  # Duplicate
+    assert not buf.put(5, b"e")  # Beyond base + capacity
+    assert not buf.put(0, b"?")  # Below base
+    assert buf.pop_ready() == []  # 1 is still missing
+    buf.skip()  # 1 delivered directly
+    assert buf.pop_ready() == [b"b", b"c"]
+    assert buf.base == 4 and buf.held == 0
+
+
+def test_reorder_buffer_ranges_across_the_wrap():
+    buf = ReorderBuffer(8, base=6, keep_payload=False)  # Slots 6..13 wrap at index 8
+    for seq in (7, 8, 9, 11, 13):
+        assert buf.put(seq)
+    assert buf.ranges(10) == [(7, 10), (11, 12), (13, 14)]
+    assert buf.ranges(2) == [(7, 10), (11, 12)]
+    buf.skip()
+    assert buf.pop_ready() == [None, None, None]
+    assert buf.base == 10
+    assert buf.ranges(10) == [(11, 12), (13, 14)]
+    assert buf.put(17)  # Now fits: the ring moved with base
+    assert buf.ranges(10) == [(11, 12), (13, 14), (17, 18)]
+
+
+def test_reorder_buffer_range_reaching_the_end_of_the_ring():
+    buf = ReorderBuffer(4, base=3)
+    for seq in (4, 5, 6):
+        buf.put(seq, seq)
+    assert buf.ranges(4) == [(4, 7)]
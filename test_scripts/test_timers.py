@@ -0,0 +1,54 @@
+from timers import RetransmitScheduler
+
+
+def test_pop_expired_in_deadline_order():
+    timers = RetransmitScheduler()
+    for seq, deadline in ((3, 3.0), (1, 1.0), (2, 2.0)):
+        timers.schedule(seq, deadline)
+    assert timers.next_deadline() == 1.0
+    assert timers.pop_expired(2.5) == [1, 2]
+    assert len(timers) == 1
+    assert timers.pop_expired(2.5) == []
+    assert timers.next_deadline() == 3.0
+
+
+def test_cancel_leaves_a_stale_entry_that_never_fires():
+    timers = RetransmitScheduler()
+    timers.schedule(1, 1.0)
+    timers.schedule(2, 2.0)
+    timers.cancel(1)
+    assert len(timers) == 1
+    assert len(timers.heap) == 2  # Lazy: the heap entry stays until it reaches the top
+    assert timers.next_deadline() == 2.0
+    assert timers.pop_expired(10.0) == [2]
+    assert timers.next_deadline() is None
+    timers.cancel(7)  # Unknown keys are ignored
+
+
+def test_rearm_replaces_the_deadline():
+    timers = RetransmitScheduler()
+    assert timers.schedule(1, 1.0)
+    assert not timers.schedule(2, 2.0)
+    # Backed off past packet 2: its old deadline no longer counts
+    assert not timers.schedule(1, 5.0)
+    assert timers.next_deadline() == 2.0
+    assert timers.pop_expired(1.5) == []
+    assert timers.pop_expired(2.0) == [2]
+    assert timers.pop_expired(5.0) == [1]
+    # Re-arming earlier than everything makes it the next deadline
+    timers.schedule(3, 9.0)
+    assert timers.schedule(3, 6.0)
+    assert timers.pop_expired(6.0) == [3]
+
+
+def test_stale_entries_are_compacted():
+    timers = RetransmitScheduler()
+    armed = {}
+    for i in range(1000):
+        timers.schedule(i % 10, float(i))
+        armed[i % 10] = float(i)
+        timers.cancel((i + 5) % 10)
+        armed.pop((i + 5) % 10, None)
+        assert len(timers.heap) <= 2 * len(timers) + 65
+    assert timers.deadlines == armed
+    assert timers.pop_expired(float("inf")) == sorted(armed, key=armed.get)
@@ -0,0 +1,69 @@
+import io
+import os
+
+import config
+from utils import (OPT_CHECKSUM, OPT_FEC, OPT_WINDOW, OPTION, SACK_RANGE, StreamChunks, build_packet, decode_options, decode_sack_ranges,
+                   encode_options, encode_sack_ranges, iter_chunks, verify_packet)
+
+
+def test_sack_ranges_round_trip():
+    ranges = [(5, 9), (12, 13), (2 ** 32 - 2, 2 ** 32 - 1)]
+    payload = encode_sack_ranges(ranges)
+    assert len(payload) == 3 * SACK_RANGE.size
+    assert list(decode_sack_ranges(payload)) == ranges
+    assert list(decode_sack_ranges(b"")) == []
+
+
+def test_sack_ranges_ignore_a_partial_record():
+    payload = encode_sack_ranges([(5, 9), (12, 13)])
+    assert list(decode_sack_ranges(payload[:-3])) == [(5, 9)]
+
+
+def test_sack_ranges_survive_the_packet_codec():
+    packet = bytes(build_packet(config.message_type.SACK, 4, encode_sack_ranges([(6, 8)])))
+    pkt_type, ack_num, payload = verify_packet(packet)
+    assert (pkt_type, ack_num, list(decode_sack_ranges(payload))) == (config.message_type.SACK, 4, [(6, 8)])
+    corrupted = bytearray(packet)
+    corrupted[-1] ^= 1
+    assert verify_packet(bytes(corrupted)) is None
+
+
+def test_options_round_trip():
+    options = {OPT_CHECKSUM: b"\x02", OPT_FEC: b"\x01\x08\x01", OPT_WINDOW: b"", 200: b"unknown kind"}
+    assert decode_options(encode_options(options)) == options
+    assert decode_options(b"") == {}
+
+
+def test_options_drop_a_truncated_last_record():
+    payload = encode_options({OPT_CHECKSUM: b"\x02", OPT_FEC: b"\x01\x08\x01"})
+    assert decode_options(payload[:-1]) == {OPT_CHECKSUM: b"\x02"}
+    # Down to a lone kind byte, not even a whole record header
+    assert decode_options(payload[:OPTION.size + 1 + 1]) == {OPT_CHECKSUM: b"\x02"}
+
+
+def test_iter_chunks_slices_and_regroups():
+    data = bytes(range(250))
+    assert [bytes(c) for c in iter_chunks(data, 100)] == [data[:100], data[100:200], data[200:]]
+    assert list(iter_chunks(io.BytesIO(data), 100)) == [data[:100], data[100:200], data[200:]]
+    assert list(iter_chunks(iter([data[:30], data[30:]]), 100)) == [data[:100], data[100:200], data[200:]]
+
+
+def test_stream_chunks_hands_out_each_payload_as_soon_as_it_is_complete():
+    r, w = os.pipe()
+    with os.fdopen(r, "rb") as f:
+        chunks = iter_chunks(f, 100)
+        assert isinstance(chunks, StreamChunks)
+        assert not chunks.ready()
+        os.write(w, bytes(150))
+        # One whole payload is there, the second half-written one is not
+        assert chunks.ready()
+        assert next(chunks) == bytes(100)
+        assert not chunks.ready()
+        os.write(w, b"\x01" * 50)
+        assert chunks.ready()
+        assert next(chunks) == bytes(50) + b"\x01" * 50
+        os.write(w, b"end")
+        os.close(w)
+        # A short last payload at the end of the input
+        assert chunks.ready()
+        assert list(chunks) == [b"end"]